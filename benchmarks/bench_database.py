@@ -0,0 +1,211 @@
+"""
+Database层基准测试
+在datagen.py生成的数据库副本上测量常用操作的耗时，结果写入JSON文件；
+指定--baseline时与基线比较，任一项平均耗时超过基线的(1 + tolerance)倍即以非0状态退出
+
+用法:
+    python benchmarks/bench_database.py --db bench.db [--output results.json]
+    python benchmarks/bench_database.py --db bench.db --baseline benchmarks/baseline.json
+    python benchmarks/bench_database.py --db bench.db --write-baseline benchmarks/baseline.json
+不指定--db时按--products/--order-lines在临时目录中生成数据库
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import datagen
+from models import Database
+from money import Money
+
+def measure(func, repeat):
+    """执行func repeat次，返回耗时统计（毫秒）和最后一次的返回值"""
+    times = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(i)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'repeat': repeat,
+        'mean_ms': round(statistics.fmean(times), 4),
+        'p50_ms': round(times[len(times) // 2], 4),
+        'p95_ms': round(times[min(int(len(times) * 0.95), len(times) - 1)], 4),
+        'min_ms': round(times[0], 4),
+    }, result
+
+def dataset_info(db):
+    conn = db.pool.reader()
+    return {
+        'products': conn.execute('SELECT COUNT(*) FROM products').fetchone()[0],
+        'orders': conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0],
+        'order_lines': conn.execute('SELECT COUNT(*) FROM order_items').fetchone()[0],
+        'members': conn.execute('SELECT COUNT(*) FROM members').fetchone()[0],
+    }
+
+def run_benchmarks(db, workdir, scale=1.0, seed=1):
+    """依次执行各项基准测试，返回{名称: 统计}"""
+    rng = random.Random(seed)
+    info = dataset_info(db)
+    product_count = info['products']
+    results = {}
+
+    def run(name, func, repeat, rows=None):
+        repeat = max(int(repeat * scale), 1)
+        stats, result = measure(func, repeat)
+        if rows is not None:
+            count = rows(result)
+            stats['rows'] = count
+            stats['rows_per_second'] = round(count / (stats['mean_ms'] / 1000)) if stats['mean_ms'] else 0
+        results[name] = stats
+        print(f"{name:<32} 平均 {stats['mean_ms']:>10.3f} ms  P95 {stats['p95_ms']:>10.3f} ms"
+              f"  ({stats['repeat']} 次)")
+
+    barcodes = [datagen.barcode_for(rng.randrange(product_count)) for _ in range(2000)]
+
+    def lookup_cold(i):
+        db.product_cache.clear()
+        return db.get_product_by_barcode(barcodes[i % len(barcodes)])
+    run('get_product_by_barcode_cold', lookup_cold, 2000)
+
+    hot = barcodes[:100]
+    run('get_product_by_barcode_warm', lambda i: db.get_product_by_barcode(hot[i % len(hot)]), 5000)
+
+    keywords = [datagen.model_for(rng.randrange(product_count))[2:8] for _ in range(200)]
+    run('search_products_fts', lambda i: db.search_products(keywords[i % len(keywords)]), 200,
+        rows=len)
+    short_keywords = [f'{rng.randrange(100):02d}' for _ in range(50)]
+    run('search_products_short', lambda i: db.search_products(short_keywords[i % len(short_keywords)]),
+        50, rows=len)
+
+    products = db.pool.reader().execute(
+        'SELECT id, price_cents FROM products WHERE stock >= 100 LIMIT 1000').fetchall()
+    if products:
+        # 保证库存充足，不因库存不足失败
+        with db.pool.writer() as conn:
+            conn.execute('UPDATE products SET stock = 1000000 WHERE id IN (%s)'
+                         % ','.join(str(product_id) for product_id, _ in products))
+
+        def create_order(i):
+            cart = [{'product_id': product_id, 'quantity': rng.randint(1, 3),
+                     'price': Money(price)}
+                    for product_id, price in rng.sample(products, rng.randint(1, min(8, len(products))))]
+            return db.create_order(cart, rng.choice(datagen.PAYMENT_METHODS))
+        run('create_order', create_order, 300)
+
+    run('get_all_orders', lambda i: db.get_all_orders(), 3, rows=len)
+
+    def orders_page(i):
+        page, cursor = db.get_orders_page(100)
+        for _ in range(9):
+            if cursor is None:
+                break
+            page, cursor = db.get_orders_page(100, after=cursor)
+        return page
+    run('get_orders_page_10_pages', orders_page, 50)
+
+    run('get_sales_statistics_30', lambda i: db.get_sales_statistics(30), 50)
+    run('get_sales_statistics_365', lambda i: db.get_sales_statistics(365), 20)
+
+    products_csv = os.path.join(workdir, 'products.csv')
+    run('export_products_to_csv', lambda i: db.export_products_to_csv(products_csv), 3,
+        rows=lambda count: count)
+    orders_csv = os.path.join(workdir, 'orders.csv')
+    start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    run('export_orders_to_csv_30_days',
+        lambda i: db.export_orders_to_csv(orders_csv, start_date=start_date), 3,
+        rows=lambda count: count)
+    # 导入刚导出的商品文件，全部为原地更新
+    run('import_products_from_csv', lambda i: db.import_products_from_csv(products_csv), 2,
+        rows=lambda report: report['imported'])
+    return results
+
+def compare(results, baseline, tolerance):
+    """返回超过基线(1 + tolerance)倍的项目: [(名称, 本次ms, 基线ms, 倍数), ...]"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('mean_ms'):
+            continue
+        ratio = stats['mean_ms'] / base['mean_ms']
+        print(f"{name:<32} {stats['mean_ms']:>10.3f} ms  基线 {base['mean_ms']:>10.3f} ms  {ratio:>6.2f}x")
+        if ratio > 1 + tolerance:
+            regressions.append((name, stats['mean_ms'], base['mean_ms'], ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Database层基准测试')
+    parser.add_argument('--db', help='datagen.py生成的数据库，测试在其副本上进行')
+    parser.add_argument('--products', type=int, default=20000, help='未指定--db时生成的商品数')
+    parser.add_argument('--order-lines', type=int, default=300000, help='未指定--db时生成的订单明细数')
+    parser.add_argument('--members', type=int, default=5000, help='未指定--db时生成的会员数')
+    parser.add_argument('--scale', type=float, default=1.0, help='各项测试重复次数的倍数')
+    parser.add_argument('--output', help='把本次结果写入JSON文件')
+    parser.add_argument('--baseline', help='与该基线文件比较')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='允许比基线慢的比例')
+    parser.add_argument('--write-baseline', help='把本次结果写为新的基线文件')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.db')
+        if args.db:
+            # 先把WAL合并到主文件，再复制副本
+            source = sqlite3.connect(args.db)
+            source.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            source.close()
+            shutil.copyfile(args.db, path)
+        else:
+            print(datagen.generate(path, args.products, args.order_lines, args.members))
+
+        db = Database(path)
+        try:
+            dataset = dataset_info(db)
+            print(f"数据集: {dataset}")
+            results = run_benchmarks(db, workdir, args.scale)
+        finally:
+            db.close()
+
+    report = {
+        'created': datetime.now().isoformat(sep=' ', timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'dataset': dataset,
+        'results': results,
+    }
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"结果已写入 {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('dataset') != dataset:
+            print(f"注意: 基线的数据集 {baseline.get('dataset')} 与本次不同，比较结果仅供参考")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("以下项目比基线慢:")
+            for name, current, base, ratio in regressions:
+                print(f"  {name}: {current:.3f} ms，基线 {base:.3f} ms（{ratio:.2f}x）")
+            return 1
+        print("没有超过基线的项目")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+订单写入吞吐量基准测试
+比较逐单提交(Database.create_order)与分组提交(OrderWriter)在单台和多台收银机下的每秒订单数，
+以及写订单日志(OrderJournal)时收银台每秒可结账的订单数（追加日志后即返回，不等待数据库提交）
+
+用法: python benchmarks/bench_order_writer.py [--orders 2000] [--registers 1 4 8]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from models import Database
+from money import Money
+from order_journal import OrderJournal
+from order_writer import OrderWriter
+
+PRODUCT_COUNT = 1000
+
+def create_database(path):
+    db = Database(path)
+    with db.pool.writer() as conn:
+        conn.executemany(
+            'INSERT INTO products (barcode, model, price_cents, stock) VALUES (?, ?, ?, ?)',
+            [(f'69{i:011d}', f'商品{i}', 100 + i, 10 ** 9) for i in range(PRODUCT_COUNT)])
+    return db
+
+def random_cart(rng):
+    return [{'product_id': rng.randint(1, PRODUCT_COUNT),
+             'price': Money(rng.randint(100, 10000)),
+             'quantity': rng.randint(1, 3)}
+            for _ in range(rng.randint(1, 8))]
+
+def run_registers(create_order, total_orders, registers):
+    """模拟多台收银机同时结账，每台收银机等待上一单完成后再结下一单"""
+    per_register = total_orders // registers
+
+    def register(seed):
+        rng = random.Random(seed)
+        for _ in range(per_register):
+            create_order(random_cart(rng), '现金')
+
+    threads = [threading.Thread(target=register, args=(seed,)) for seed in range(registers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return per_register * registers / elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='订单写入吞吐量基准测试')
+    parser.add_argument('--orders', type=int, default=2000, help='每个场景的订单总数')
+    parser.add_argument('--registers', type=int, nargs='+', default=[1, 4, 8],
+                        help='模拟的收银机数量')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'收银机':>6} {'逐单提交(单/秒)':>16} {'分组提交(单/秒)':>16} {'平均每组订单':>12}"
+              f" {'日志结账(单/秒)':>16}")
+        for registers in args.registers:
+            db = create_database(os.path.join(workdir, f'direct_{registers}.db'))
+            direct = run_registers(db.create_order, args.orders, registers)
+            db.close()
+
+            db = create_database(os.path.join(workdir, f'grouped_{registers}.db'))
+            writer = OrderWriter(db)
+            grouped = run_registers(writer.create_order, args.orders, registers)
+            writer.close()
+            per_group = writer.committed_orders / max(writer.committed_groups, 1)
+            db.close()
+
+            db = create_database(os.path.join(workdir, f'journal_{registers}.db'))
+            journal = OrderJournal(os.path.join(workdir, f'journal_{registers}.journal'))
+            writer = OrderWriter(db, journal)
+            journaled = run_registers(writer.submit, args.orders, registers)
+            writer.close()
+            journal.close()
+            db.close()
+
+            print(f"{registers:>6} {direct:>16.0f} {grouped:>16.0f} {per_group:>12.1f} {journaled:>16.0f}")
+
+if __name__ == '__main__':
+    main()
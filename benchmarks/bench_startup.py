@@ -0,0 +1,105 @@
+"""
+启动耗时测试
+多次启动收银程序（src/main.py），测量从进程创建到首次绘制、可以扫码和第一次扫码完成的时间
+每次启动都在临时目录中使用同一个数据库的新副本，通过环境变量让程序在可以扫码后自动扫描一个条码，
+保存启动耗时后退出；没有显示器时使用Qt的offscreen平台
+
+用法:
+    python benchmarks/bench_startup.py [--db bench.db] [--runs 5] [--output results.json]
+不指定--db时在临时目录中生成一个小数据库
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(BENCH_DIR, '..', 'src', 'main.py')
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+import datagen
+
+# 与main.py中的STARTUP_PROFILE_ENV、STARTUP_SCAN_ENV相同，不导入main.py以免加载PyQt5
+STARTUP_PROFILE_ENV = 'SHOP_STARTUP_PROFILE'
+STARTUP_SCAN_ENV = 'SHOP_STARTUP_SCAN'
+
+# 统计的时间点，均从进程创建算起
+MARKS = ('imports', 'first_paint', 'ready_for_scan', 'first_scan')
+
+def pick_barcode(path):
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute('SELECT barcode FROM products WHERE stock > 0 ORDER BY id LIMIT 1').fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise Exception("数据库中没有有库存的商品")
+    return row[0]
+
+def run_once(source, barcode, workdir, timeout):
+    """在workdir中启动一次程序，返回启动耗时报告"""
+    shutil.copyfile(source, os.path.join(workdir, 'shop.db'))
+    profile_path = os.path.join(workdir, 'startup.json')
+    env = dict(os.environ)
+    env.pop('SHOP_SERVER', None)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    env[STARTUP_PROFILE_ENV] = profile_path
+    env[STARTUP_SCAN_ENV] = barcode
+    completed = subprocess.run([sys.executable, os.path.abspath(MAIN_SCRIPT)], cwd=workdir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+    if not os.path.exists(profile_path):
+        output = completed.stdout.decode('utf-8', errors='replace')
+        raise Exception(f"程序没有保存启动耗时（退出码 {completed.returncode}）:\n{output[-2000:]}")
+    with open(profile_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='收银程序启动耗时测试')
+    parser.add_argument('--db', help='datagen.py生成的数据库，每次启动使用其副本')
+    parser.add_argument('--runs', type=int, default=5, help='启动次数')
+    parser.add_argument('--timeout', type=float, default=60, help='每次启动的最长时间（秒）')
+    parser.add_argument('--output', help='把每次启动的报告和汇总写入JSON文件')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'source.db')
+        if args.db:
+            conn = sqlite3.connect(args.db)
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.close()
+            shutil.copyfile(args.db, source)
+        else:
+            print(datagen.generate(source, products=5000, order_lines=50000, member_count=1000))
+        barcode = pick_barcode(source)
+
+        reports = []
+        for run in range(args.runs):
+            run_dir = os.path.join(workdir, f'run{run}')
+            os.mkdir(run_dir)
+            report = run_once(source, barcode, run_dir, args.timeout)
+            reports.append(report)
+            marks = report['marks']
+            print(f"第 {run + 1} 次: " + '，'.join(f"{name} {marks.get(name, '-')} ms" for name in MARKS))
+
+    summary = {}
+    for name in MARKS:
+        values = [report['marks'][name] for report in reports if name in report['marks']]
+        if values:
+            summary[name] = {'median_ms': statistics.median(values), 'min_ms': min(values),
+                             'max_ms': max(values)}
+    print(f"{'时间点':<16}{'中位数':>10}{'最小':>10}{'最大':>10}")
+    for name, values in summary.items():
+        print(f"{name:<16}{values['median_ms']:>10}{values['min_ms']:>10}{values['max_ms']:>10}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'runs': reports}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+门店服务器负载测试
+在本机启动store_server，模拟多台收银机通过TCP同时扫码和结账，统计每秒订单数和扫码查询延迟
+每台收银机每单先扫若干个条码，再提交订单，等待服务器确认后结下一单
+--pipeline 表示一单中的条码查询一次性流水线发送，否则逐个等待响应
+
+用法: python benchmarks/bench_store_server.py [--orders 2000] [--registers 1 4 8] [--pipeline]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from models import Database
+from order_journal import OrderJournal
+from store_server import StoreServer
+
+PRODUCT_COUNT = 5000
+
+def create_database(path):
+    db = Database(path)
+    with db.pool.writer() as conn:
+        conn.executemany(
+            'INSERT INTO products (barcode, model, price_cents, stock) VALUES (?, ?, ?, ?)',
+            [(f'69{i:011d}', f'商品{i}', 100 + i, 10 ** 9) for i in range(PRODUCT_COUNT)])
+    return db
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run_registers(port, total_orders, registers, pipeline):
+    per_register = total_orders // registers
+    lookup_times = []
+    lock = threading.Lock()
+
+    def register(seed):
+        rng = random.Random(seed)
+        client = Database.remote('127.0.0.1', port)
+        times = []
+        try:
+            for _ in range(per_register):
+                barcodes = [f'69{rng.randrange(PRODUCT_COUNT):011d}' for _ in range(rng.randint(1, 8))]
+                start = time.perf_counter()
+                if pipeline:
+                    products = client.get_products_by_barcodes(barcodes)
+                else:
+                    products = [client.get_product_by_barcode(barcode) for barcode in barcodes]
+                times.append((time.perf_counter() - start) / len(barcodes))
+                items = [{'product_id': product[0], 'price': product[3], 'quantity': 1}
+                         for product in products]
+                client.submit_record(OrderJournal.new_record(items, '现金')).result()
+        finally:
+            client.close()
+        with lock:
+            lookup_times.extend(times)
+
+    threads = [threading.Thread(target=register, args=(seed,)) for seed in range(registers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (per_register * registers / elapsed,
+            percentile(lookup_times, 0.5) * 1000, percentile(lookup_times, 0.99) * 1000)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='门店服务器负载测试')
+    parser.add_argument('--orders', type=int, default=2000, help='每个场景的订单总数')
+    parser.add_argument('--registers', type=int, nargs='+', default=[1, 4, 8],
+                        help='模拟的收银机数量')
+    parser.add_argument('--pipeline', action='store_true', help='一单中的条码查询流水线发送')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'收银机':>6} {'订单(单/秒)':>12} {'查询P50(毫秒)':>14} {'查询P99(毫秒)':>14} {'平均每组订单':>12}")
+        for registers in args.registers:
+            db = create_database(os.path.join(workdir, f'store_{registers}.db'))
+            server = StoreServer(db, port=0)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                rate, p50, p99 = run_registers(server.server_address[1], args.orders,
+                                               registers, args.pipeline)
+            finally:
+                server.shutdown()
+                server.server_close()
+            writer = server.order_writer
+            per_group = writer.committed_orders / max(writer.committed_groups, 1)
+            db.close()
+            print(f"{registers:>6} {rate:>12.0f} {p50:>14.3f} {p99:>14.3f} {per_group:>12.1f}")
+
+if __name__ == '__main__':
+    main()
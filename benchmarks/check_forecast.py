@@ -0,0 +1,66 @@
+"""
+需求预测的回归检查
+用构造的销量矩阵调用forecast.forecast_demand和reorder_plan，检查几种典型商品的结果：
+- 统计期内只在昨天卖出过一次的商品，日均需求不能等于那一天的销量（曾经导致再订货点被高估）
+- 每天销量相同的商品，日均需求等于该销量，标准差为0
+- 最近一周才开始销售的新商品，不被之前没上架的日子拉低到不足实际日销量的一半
+- 没有销售的商品没有补货建议
+有任何不符合时以非0状态退出，修改forecast.py后运行
+
+用法:
+    python benchmarks/check_forecast.py [--history-days 56] [--half-life 14]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import forecast
+
+def build_cases(days):
+    """检查项: [(名称, 每天的销量数组, 检查函数(日均需求, 标准差, 再订货点, 建议补货量) -> 是否通过), ...]"""
+    single_sale = np.zeros(days)
+    single_sale[-1] = 10
+    steady = np.full(days, 5.0)
+    new_product = np.zeros(days)
+    new_product[-7:] = 10
+    return [
+        ('single_sale', single_sale,
+         lambda mean, std, reorder_point, suggested: mean < 10 / 5 and std > 0 and reorder_point < 30),
+        ('steady', steady,
+         lambda mean, std, reorder_point, suggested: abs(mean - 5) < 1e-9 and std < 1e-9),
+        ('new_product', new_product,
+         lambda mean, std, reorder_point, suggested: 5 < mean <= 10),
+        ('no_sales', np.zeros(days),
+         lambda mean, std, reorder_point, suggested: mean == 0 and suggested == 0),
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='检查需求预测的结果')
+    parser.add_argument('--history-days', type=int, default=56, help='销量矩阵的天数')
+    parser.add_argument('--half-life', type=float, default=14, help='需求加权的半衰期（天）')
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.history_days)
+    demand = np.array([series for _, series, _ in cases])
+    mean, std = forecast.forecast_demand(demand, args.half_life)
+    _, reorder_point, suggested = forecast.reorder_plan(mean, std, np.zeros(len(cases), dtype=np.int64))
+
+    problems = []
+    for index, (name, _, passed) in enumerate(cases):
+        result = (float(mean[index]), float(std[index]), int(reorder_point[index]), int(suggested[index]))
+        print(f"[{name}] 日均需求 {result[0]:.2f}，标准差 {result[1]:.2f}，"
+              f"再订货点 {result[2]}，建议补货 {result[3]}")
+        if not passed(*result):
+            problems.append(name)
+    if problems:
+        print(f"需求预测检查未通过: {', '.join(problems)}")
+        return 1
+    print("需求预测检查通过")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
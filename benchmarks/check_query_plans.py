@@ -0,0 +1,259 @@
+"""
+热点SQL的查询计划检查
+在datagen.py生成的数据库上调用Database的常用方法，记录每个方法执行的全部SQL语句并逐条EXPLAIN QUERY PLAN：
+- 每个方法的查询计划中必须出现预期的索引
+- 不允许对orders、order_items、products全表扫描（SCAN），有意扫描整表的方法在ALLOWED_SCANS中列出
+有任何不符合时以非0状态退出，修改SQL、索引或迁移后运行
+
+用法:
+    python benchmarks/check_query_plans.py [--db bench.db] [--verbose]
+不指定--db时在临时目录中生成一个小数据库
+"""
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import datagen
+from models import Database
+from money import Money
+
+# 不允许全表扫描的表
+GUARDED_TABLES = ('orders', 'order_items', 'products')
+
+# 有意读取整表的检查项及允许扫描的表
+ALLOWED_SCANS = {
+    'get_all_products': {'products'},
+    'get_all_orders': {'orders'},
+    'count_orders': {'orders'},
+    # 少于3个字符的关键字无法使用trigram索引，按LIKE扫描商品表
+    'search_products_short': {'products'},
+    'get_low_stock_products_threshold': {'products'},
+    'export_products_to_csv': {'products'},
+    'import_products_from_csv': {'products'},
+    'update_reorder_suggestions': {'products'},
+    'rebuild_sales_rollups': {'orders', 'order_items', 'products'},
+}
+
+# 只解释这些语句，事务控制、PRAGMA等没有查询计划
+_EXPLAINED_KEYWORDS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# 跟踪回调报告的是代入参数后的SQL，去掉字面量后作为去重的键
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# FROM/JOIN后面的表名和可选的别名
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIASES = {'where', 'join', 'left', 'inner', 'cross', 'on', 'group', 'order', 'limit',
+                'union', 'using', 'set', 'natural', 'outer', 'as', 'values'}
+
+def table_aliases(sql):
+    """语句中别名（及表名本身）到表名的对应关系"""
+    aliases = {}
+    for table, alias in _TABLE_PATTERN.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+def scanned_tables(sql, plan):
+    """
+    查询计划中被全表扫描（包括按索引顺序读完整个索引）的表
+    带LIMIT的语句按索引顺序读取时读够行数即停止（如订单分页的第一页），不算全表扫描
+    """
+    aliases = table_aliases(sql)
+    limited = re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+    tables = set()
+    for detail in plan:
+        match = re.match(r'SCAN (?:\w+\.)?(\w+)', detail)
+        if match and not (limited and ' USING ' in detail):
+            name = match.group(1).lower()
+            tables.add(aliases.get(name, name))
+    return tables
+
+def build_cases(db):
+    """
+    检查项: [(名称, 调用, 计划中必须出现的片段列表), ...]
+    调用使用数据库中的实际数据作为参数
+    """
+    conn = db.pool.reader()
+    product_id, barcode, model, price = conn.execute(
+        'SELECT id, barcode, model, price_cents FROM products ORDER BY id LIMIT 1 OFFSET 10').fetchone()
+    member_id, phone, card_no = conn.execute(
+        'SELECT id, phone, card_no FROM members ORDER BY id LIMIT 1').fetchone()
+    order_id, order_time = conn.execute(
+        'SELECT id, order_time FROM orders ORDER BY id DESC LIMIT 1').fetchone()
+    order_ids = [row[0] for row in conn.execute('SELECT id FROM orders ORDER BY id DESC LIMIT 20')]
+    start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    end_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    with db.pool.writer() as writer:
+        writer.execute('UPDATE products SET stock = 1000 WHERE id = ?', (product_id,))
+
+    workdir = tempfile.mkdtemp()
+    products_csv = os.path.join(workdir, 'products.csv')
+    orders_csv = os.path.join(workdir, 'orders.csv')
+    cart = [{'product_id': product_id, 'quantity': 1, 'price': Money(price)}]
+
+    def first_page_cursor():
+        return db.get_orders_page(10)[1]
+
+    def export_and_import():
+        db.export_products_to_csv(products_csv)
+        return db.import_products_from_csv(products_csv)
+
+    cases = [
+        ('get_product_by_barcode',
+         lambda: (db.product_cache.clear(), db.get_product_by_barcode(barcode)),
+         ['USING INDEX sqlite_autoindex_products']),
+        ('search_products_fts', lambda: db.search_products(model[2:8]), ['VIRTUAL TABLE INDEX']),
+        ('search_products_short', lambda: db.search_products(model[-2:]), []),
+        ('check_stock', lambda: db.check_stock(cart), ['USING INTEGER PRIMARY KEY']),
+        ('create_order', lambda: db.create_order(cart, '现金', member_id=member_id),
+         ['USING INTEGER PRIMARY KEY']),
+        ('get_order_details', lambda: db.get_order_details(order_id), ['idx_order_items_order_id']),
+        ('get_order_details_batch', lambda: db.get_order_details_batch(order_ids),
+         ['idx_order_items_order_id']),
+        ('get_order_items', lambda: db.get_order_items(order_id), ['idx_order_items_order_id']),
+        ('get_order', lambda: db.get_order(order_id), ['idx_order_items_order_id']),
+        ('get_orders_page', lambda: db.get_orders_page(100), ['idx_orders_order_time']),
+        ('get_orders_page_next', lambda: db.get_orders_page(100, after=first_page_cursor()),
+         ['idx_orders_order_time']),
+        ('get_orders_page_range',
+         lambda: db.get_orders_page(100, start_date=start_date, end_date=end_date),
+         ['idx_orders_order_time']),
+        ('get_orders_page_payment', lambda: db.get_orders_page(100, payment_method='现金'),
+         ['idx_orders_payment_time']),
+        ('count_orders', lambda: db.count_orders(), []),
+        ('count_orders_range', lambda: db.count_orders(start_date, end_date),
+         ['idx_orders_order_time']),
+        ('get_all_products', lambda: db.get_all_products(), []),
+        ('get_all_orders', lambda: db.get_all_orders(), []),
+        ('get_low_stock_products', lambda: db.get_low_stock_products(), []),
+        ('get_low_stock_products_threshold', lambda: db.get_low_stock_products(5), []),
+        ('get_low_stock_events', lambda: db.get_low_stock_events(), []),
+        ('get_reorder_threshold', lambda: db.get_reorder_threshold(product_id),
+         ['USING INTEGER PRIMARY KEY']),
+        ('get_product_cost', lambda: db.get_product_cost(product_id), ['USING INTEGER PRIMARY KEY']),
+        ('find_member_card', lambda: (db.member_cache.clear(), db.find_member(card_no)),
+         ['idx_members_card_no']),
+        ('find_member_phone', lambda: (db.member_cache.clear(), db.find_member(phone)),
+         ['sqlite_autoindex_members']),
+        ('get_sales_statistics', lambda: db.get_sales_statistics(30), []),
+        ('export_orders_to_csv', lambda: db.export_orders_to_csv(orders_csv, start_date, end_date),
+         ['idx_orders_order_time']),
+        ('update_product', lambda: db.update_product(product_id, stock=1000),
+         ['USING INTEGER PRIMARY KEY']),
+        ('export_products_to_csv', lambda: db.export_products_to_csv(products_csv), []),
+        ('import_products_from_csv', export_and_import, []),
+        ('update_reorder_suggestions', lambda: db.update_reorder_suggestions(), []),
+        ('rebuild_sales_rollups', lambda: db.rebuild_sales_rollups(), []),
+    ]
+    return cases, workdir
+
+def record_statements(db, cases):
+    """
+    执行各检查项，返回{名称: [SQL, ...]}
+    只参数不同的语句只保留第一条，保持执行顺序
+    """
+    statements = {}
+    seen = set()
+    current = [None]
+
+    def trace(sql):
+        # 触发器内的语句以注释形式报告，由触发它的语句的计划覆盖
+        if current[0] is None or sql.lstrip().startswith('--'):
+            return
+        sql = ' '.join(sql.split())
+        keyword = sql.split(None, 1)[0].upper() if sql else ''
+        key = (current[0], _LITERAL_PATTERN.sub('?', sql))
+        if keyword in _EXPLAINED_KEYWORDS and key not in seen:
+            seen.add(key)
+            statements[current[0]].append(sql)
+
+    db.pool.set_hooks(trace, None)
+    try:
+        for name, call, _ in cases:
+            statements[name] = []
+            current[0] = name
+            call()
+            current[0] = None
+    finally:
+        db.pool.set_hooks(None, None)
+    return statements
+
+def check(db, statements, cases, verbose=False):
+    """
+    逐条解释语句并检查，返回问题列表 [(名称, 说明), ...]
+    在写连接上解释，下单等方法在写连接上创建的临时表仍然可用
+    """
+    problems = []
+    with db.pool.writer_connection() as conn:
+        for name, _, expected in cases:
+            plans = []
+            for sql in statements[name]:
+                try:
+                    plan = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+                except sqlite3.Error as e:
+                    # 读连接上的临时表和方法返回时已分离的归档分区无法解释
+                    print(f"[{name}] 跳过无法解释的语句（{str(e)}）: {sql[:120]}")
+                    continue
+                plans.append((sql, plan))
+                scans = scanned_tables(sql, plan) & set(GUARDED_TABLES)
+                scans -= ALLOWED_SCANS.get(name, set())
+                for table in sorted(scans):
+                    problems.append((name, f"全表扫描 {table}: {sql[:200]}\n      计划: {plan}"))
+                if verbose:
+                    print(f"[{name}] {sql[:200]}")
+                    for detail in plan:
+                        print(f"      {detail}")
+
+            all_details = [detail for _, plan in plans for detail in plan]
+            for fragment in expected:
+                if not any(fragment in detail for detail in all_details):
+                    problems.append((name, f"查询计划中没有 {fragment}"))
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='检查热点SQL的查询计划')
+    parser.add_argument('--db', help='datagen.py生成的数据库，检查在其副本上进行')
+    parser.add_argument('--verbose', action='store_true', help='输出每条语句的查询计划')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'plans.db')
+        if args.db:
+            source = sqlite3.connect(args.db)
+            source.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            source.close()
+            shutil.copyfile(args.db, path)
+        else:
+            datagen.generate(path, products=5000, order_lines=50000, member_count=1000)
+
+        db = Database(path)
+        try:
+            cases, files_dir = build_cases(db)
+            try:
+                statements = record_statements(db, cases)
+            finally:
+                shutil.rmtree(files_dir, ignore_errors=True)
+            problems = check(db, statements, cases, args.verbose)
+        finally:
+            db.close()
+
+    total = sum(len(sqls) for sqls in statements.values())
+    print(f"检查了 {len(cases)} 项调用的 {total} 条语句")
+    if problems:
+        print(f"发现 {len(problems)} 个问题:")
+        for name, message in problems:
+            print(f"  [{name}] {message}")
+        return 1
+    print("查询计划检查通过")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
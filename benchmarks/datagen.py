@@ -0,0 +1,182 @@
+"""
+生成基准测试用的商店数据库
+相同的参数、截止日期和随机种子总是生成相同的数据：商品、分类、会员、订单和订单明细，
+订单时间分布在截止日期之前的若干天内，商品销量近似长尾分布，销售汇总表和会员积分按生成的订单计算
+
+用法: python benchmarks/datagen.py --db bench.db [--products 200000] [--order-lines 5000000]
+                                    [--members 50000] [--days 365] [--end-date 2025-01-01] [--seed 1]
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import members
+from models import Database
+
+PAYMENT_METHODS = ['现金', '微信支付', '支付宝', '会员卡']
+PAYMENT_WEIGHTS = [20, 45, 30, 5]
+# 有会员的订单比例
+MEMBER_ORDER_RATIO = 0.3
+# 每个事务写入的订单数
+ORDER_CHUNK_SIZE = 20000
+
+def barcode_for(index):
+    """第index个商品（从0开始）的条码，基准测试按同样的规则取条码"""
+    return f'69{index:011d}'
+
+def model_for(index):
+    return f'商品{index:06d}-{index * 7919 % 100003:05d}'
+
+def generate_products(conn, rng, count, categories):
+    conn.executemany('INSERT INTO categories (name, description) VALUES (?, ?)',
+                     [(f'分类{i}', f'基准测试分类{i}') for i in range(categories)])
+    rows = []
+    for index in range(count):
+        price = rng.randint(100, 50000)
+        rows.append((barcode_for(index), model_for(index), price, rng.randint(0, 500),
+                     rng.randint(1, categories), rng.choice([5, 10, 20]),
+                     price * rng.randint(50, 90) // 100))
+    conn.executemany('''
+    INSERT INTO products (barcode, model, price_cents, stock, category_id, reorder_threshold, cost_cents)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return [row[2] for row in rows]
+
+def generate_members(conn, rng, count, start):
+    conn.executemany('''
+    INSERT INTO members (name, phone, card_no, register_time)
+    VALUES (?, ?, ?, ?)
+    ''', [(f'会员{i}', f'139{i:08d}', f'M{i:08d}',
+           start + timedelta(seconds=rng.randint(0, 86400 * 30)))
+          for i in range(count)])
+
+def generate_orders(db, rng, prices, member_count, order_lines, days, now):
+    """按时间顺序生成订单，返回(订单数, 明细数)"""
+    # 商品销量权重 1/(排名+1)，排名随机打乱，热销商品分散在整个ID范围
+    ranks = list(range(len(prices)))
+    rng.shuffle(ranks)
+    cumulative = list(itertools.accumulate(1.0 / (rank + 1) for rank in ranks))
+    total_weight = cumulative[-1]
+
+    start = now - timedelta(days=days)
+    span = days * 86400
+    average_lines = 4.5
+    order_count = max(int(order_lines / average_lines), 1)
+    lines_written = 0
+    order_id = 0
+    item_id = 0
+    while lines_written < order_lines:
+        orders = []
+        items = []
+        for _ in range(ORDER_CHUNK_SIZE):
+            if lines_written >= order_lines:
+                break
+            order_id += 1
+            offset = span * order_id / order_count
+            order_time = start + timedelta(seconds=min(offset, span - 1))
+            lines = min(rng.randint(1, 8), order_lines - lines_written)
+            total = 0
+            for _ in range(lines):
+                product = bisect.bisect_left(cumulative, rng.random() * total_weight)
+                quantity = rng.randint(1, 3)
+                item_id += 1
+                items.append((item_id, order_id, product + 1, quantity, prices[product]))
+                total += quantity * prices[product]
+            lines_written += lines
+            member_id = None
+            if member_count and rng.random() < MEMBER_ORDER_RATIO:
+                member_id = rng.randint(1, member_count)
+            orders.append((order_id, order_time, total,
+                           rng.choices(PAYMENT_METHODS, PAYMENT_WEIGHTS)[0], member_id))
+        with db.pool.writer() as conn:
+            conn.executemany('''
+            INSERT INTO orders (id, order_time, total_cents, payment_method, member_id)
+            VALUES (?, ?, ?, ?, ?)
+            ''', orders)
+            conn.executemany('''
+            INSERT INTO order_items (id, order_id, product_id, quantity, price_cents)
+            VALUES (?, ?, ?, ?, ?)
+            ''', items)
+        print(f"已生成 {order_id} 个订单，{lines_written}/{order_lines} 条明细")
+    return order_id, lines_written
+
+def generate(path, products=200000, order_lines=5000000, member_count=50000, days=365,
+             categories=50, seed=1, end_date=None):
+    """
+    生成数据库，返回生成参数和各部分耗时
+    end_date: 订单截止日期'YYYY-MM-DD'，默认为明天零点，使最近的统计范围内有数据
+    """
+    if os.path.exists(path):
+        raise Exception(f"{path} 已存在，请指定新的文件")
+    rng = random.Random(seed)
+    if end_date:
+        now = datetime.strptime(end_date, '%Y-%m-%d')
+    else:
+        now = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    timings = {}
+
+    db = Database(path)
+    try:
+        start = time.perf_counter()
+        with db.pool.writer() as conn:
+            prices = generate_products(conn, rng, products, categories)
+            generate_members(conn, rng, member_count, now - timedelta(days=days + 30))
+        timings['catalog_seconds'] = round(time.perf_counter() - start, 1)
+
+        start = time.perf_counter()
+        order_count, line_count = generate_orders(db, rng, prices, member_count, order_lines,
+                                                  days, now)
+        timings['orders_seconds'] = round(time.perf_counter() - start, 1)
+
+        start = time.perf_counter()
+        with db.pool.writer() as conn:
+            conn.execute('''
+            UPDATE members
+            SET points = COALESCE((SELECT SUM(total_cents) / 100 FROM orders
+                                   WHERE orders.member_id = members.id), 0)
+            ''')
+            conn.execute(f"UPDATE members SET level = {members.level_case('points')}")
+        db.rebuild_sales_rollups()
+        with db.pool.writer_connection() as conn:
+            conn.execute('ANALYZE')
+        timings['rollups_seconds'] = round(time.perf_counter() - start, 1)
+    finally:
+        db.close()
+
+    return {
+        'products': products, 'orders': order_count, 'order_lines': line_count,
+        'members': member_count, 'days': days, 'seed': seed,
+        'end_date': now.strftime('%Y-%m-%d'),
+        'size_mb': round(os.path.getsize(path) / 1024 / 1024, 1), **timings
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成基准测试用的商店数据库')
+    parser.add_argument('--db', required=True, help='生成的数据库文件路径（不能已存在）')
+    parser.add_argument('--products', type=int, default=200000, help='商品数')
+    parser.add_argument('--order-lines', type=int, default=5000000, help='订单明细条数')
+    parser.add_argument('--members', type=int, default=50000, help='会员数')
+    parser.add_argument('--days', type=int, default=365, help='订单时间分布在最近多少天内')
+    parser.add_argument('--categories', type=int, default=50, help='商品分类数')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--end-date', help='订单截止日期YYYY-MM-DD，默认为今天结束')
+    args = parser.parse_args(argv)
+
+    try:
+        summary = generate(args.db, args.products, args.order_lines, args.members, args.days,
+                           args.categories, args.seed, args.end_date)
+    except Exception as e:
+        print(f"生成失败: {str(e)}")
+        return 1
+    print(summary)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
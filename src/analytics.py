@@ -0,0 +1,247 @@
+import threading
+import time
+import numpy as np
+import archive
+from money import Money
+
+SECONDS_PER_DAY = 86400
+WEEKDAY_NAMES = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+# 一次从游标读取的行数
+LOAD_CHUNK_SIZE = 50000
+
+class SalesAnalytics:
+    """
+    列式销售分析引擎
+    - 第一次使用时把订单明细（含已归档的月份）连同下单时间一次性读入NumPy数组，
+      之后refresh()只追加order_items.id更大的新明细
+    - 各项指标都是对整列的向量化计算，切换时间范围只需重新计算掩码，不再查询数据库
+    - 毛利按商品当前进价(products.cost_cents)计算，未设置进价的商品不计入毛利
+    """
+
+    # 列名和类型
+    COLUMNS = [('item_id', np.int64), ('order_id', np.int64), ('ts', np.int64),
+               ('product_id', np.int64), ('quantity', np.int64), ('price_cents', np.int64)]
+
+    _ITEMS_QUERY = '''
+    SELECT oi.id, oi.order_id, CAST(strftime('%s', o.order_time) AS INTEGER),
+           oi.product_id, oi.quantity, oi.price_cents
+    FROM {schema}.order_items oi
+    JOIN {schema}.orders o ON o.id = oi.order_id
+    WHERE oi.id > ?
+    '''
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._last_item_id = None
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self.amount_cents = np.empty(0, dtype=np.int64)
+        self.day = np.empty(0, dtype=np.int64)
+        self.hour = np.empty(0, dtype=np.int64)
+        self.weekday = np.empty(0, dtype=np.int64)
+        self.load_seconds = 0.0
+
+    def __len__(self):
+        return len(self.item_id)
+
+    def refresh(self):
+        """
+        读入上次加载之后新增的订单明细
+        返回: 新增的明细行数
+        """
+        with self._lock:
+            start = time.perf_counter()
+            conn = self.db.pool.reader()
+            chunks = []
+            if self._last_item_id is None:
+                # 首次加载包括全部归档分区
+                schemas = archive.sources(conn, archive.list_partitions(conn))
+                after = 0
+            else:
+                schemas = ['main']
+                after = self._last_item_id
+            for schema in schemas:
+                cursor = conn.execute(self._ITEMS_QUERY.format(schema=schema), (after,))
+                while True:
+                    rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    chunks.append(np.array(rows, dtype=np.int64))
+
+            added = sum(len(chunk) for chunk in chunks)
+            if added:
+                data = np.concatenate(chunks)
+                self._append(data)
+            if len(self.item_id):
+                self._last_item_id = int(self.item_id.max())
+            else:
+                self._last_item_id = 0
+            self.load_seconds = time.perf_counter() - start
+            return added
+
+    def _append(self, data):
+        for index, (name, _) in enumerate(self.COLUMNS):
+            setattr(self, name, np.concatenate([getattr(self, name), data[:, index]]))
+        ts = data[:, 2]
+        self.amount_cents = np.concatenate([self.amount_cents, data[:, 4] * data[:, 5]])
+        day = ts // SECONDS_PER_DAY
+        self.day = np.concatenate([self.day, day])
+        self.hour = np.concatenate([self.hour, (ts % SECONDS_PER_DAY) // 3600])
+        # 1970-01-01是周四，周一为0
+        self.weekday = np.concatenate([self.weekday, (day + 3) % 7])
+
+    def mask(self, start_date=None, end_date=None):
+        """
+        时间范围[start_date, end_date)内明细的布尔掩码
+        start_date/end_date: 'YYYY-MM-DD'字符串，None表示不限
+        """
+        selected = np.ones(len(self.day), dtype=bool)
+        if start_date:
+            selected &= self.day >= _day_number(start_date)
+        if end_date:
+            selected &= self.day < _day_number(end_date)
+        return selected
+
+    def summary(self, start_date=None, end_date=None):
+        selected = self.mask(start_date, end_date)
+        return {
+            'total_sales': Money(int(self.amount_cents[selected].sum())),
+            'total_orders': int(np.unique(self.order_id[selected]).size),
+            'total_quantity': int(self.quantity[selected].sum()),
+            'items': int(selected.sum())
+        }
+
+    def heatmap(self, start_date=None, end_date=None, value='amount'):
+        """
+        星期×小时销售热力图
+        value: 'amount'为销售额（分），'quantity'为销量，'orders'为订单数
+        返回: 7×24的数组，行为周一到周日，列为0-23点
+        """
+        selected = self.mask(start_date, end_date)
+        cell = self.weekday[selected] * 24 + self.hour[selected]
+        if value == 'orders':
+            # 每个订单只计一次
+            _, first = np.unique(self.order_id[selected], return_index=True)
+            counts = np.bincount(cell[first], minlength=7 * 24)
+        elif value == 'quantity':
+            counts = np.bincount(cell, weights=self.quantity[selected], minlength=7 * 24)
+        else:
+            counts = np.bincount(cell, weights=self.amount_cents[selected], minlength=7 * 24)
+        return counts.reshape(7, 24)
+
+    def product_totals(self, start_date=None, end_date=None):
+        """
+        按商品汇总
+        返回: (商品ID数组, 销量数组, 销售额(分)数组)，只包含有销售的商品
+        """
+        selected = self.mask(start_date, end_date)
+        product_ids, inverse = np.unique(self.product_id[selected], return_inverse=True)
+        quantity = np.bincount(inverse, weights=self.quantity[selected],
+                               minlength=len(product_ids)).astype(np.int64)
+        amount = np.bincount(inverse, weights=self.amount_cents[selected],
+                             minlength=len(product_ids)).astype(np.int64)
+        return product_ids, quantity, amount
+
+    def abc_classification(self, start_date=None, end_date=None, a_share=0.8, b_share=0.95):
+        """
+        ABC分类：按销售额从高到低累计，累计占比不超过a_share的为A类，不超过b_share的为B类，其余为C类
+        返回: [(商品ID, 销售额Money, 占比, 累计占比, 类别), ...]，按销售额从高到低
+        """
+        product_ids, _, amount = self.product_totals(start_date, end_date)
+        total = amount.sum()
+        if total <= 0:
+            return []
+        order = np.argsort(-amount, kind='stable')
+        share = amount[order] / total
+        cumulative = np.cumsum(share)
+        # 以进入该商品之前的累计占比判断，保证销售额最高的商品总是A类
+        before = cumulative - share
+        classes = np.where(before < a_share, 'A', np.where(before < b_share, 'B', 'C'))
+        return [(int(product_ids[i]), Money(int(amount[i])), float(s), float(c), str(k))
+                for i, s, c, k in zip(order, share, cumulative, classes)]
+
+    def margins(self, start_date=None, end_date=None):
+        """
+        按商品计算毛利
+        返回: {
+            'products': [(商品ID, 销量, 销售额Money, 成本Money, 毛利Money, 毛利率), ...] 按毛利从高到低,
+            'total_sales': Money, 'total_cost': Money, 'total_margin': Money,
+            'margin_rate': float,    # 有进价的商品的整体毛利率
+            'unknown_cost_sales': Money  # 没有进价、未计入毛利的销售额
+        }
+        """
+        product_ids, quantity, amount = self.product_totals(start_date, end_date)
+        costs = _product_costs(self.db, product_ids)
+        known = costs >= 0
+        cost = np.where(known, costs * quantity, 0)
+        margin = np.where(known, amount - cost, 0)
+        order = np.argsort(-margin, kind='stable')
+
+        products = []
+        for i in order:
+            if not known[i]:
+                continue
+            rate = float(margin[i] / amount[i]) if amount[i] else 0.0
+            products.append((int(product_ids[i]), int(quantity[i]), Money(int(amount[i])),
+                             Money(int(cost[i])), Money(int(margin[i])), rate))
+        known_sales = int(amount[known].sum())
+        total_margin = int(margin.sum())
+        return {
+            'products': products,
+            'total_sales': Money(known_sales),
+            'total_cost': Money(int(cost.sum())),
+            'total_margin': Money(total_margin),
+            'margin_rate': total_margin / known_sales if known_sales else 0.0,
+            'unknown_cost_sales': Money(int(amount[~known].sum()))
+        }
+
+    def daily_sales(self, start_date, end_date, window=7):
+        """
+        每日销售额及其移动平均
+        start_date/end_date: 'YYYY-MM-DD'，范围[start_date, end_date)
+        window: 移动平均的天数，不足window天的开头几天按已有天数平均
+        返回: [(日期, 销售额Money, 移动平均Money), ...]
+        """
+        first = _day_number(start_date)
+        days = _day_number(end_date) - first
+        if days <= 0:
+            return []
+        selected = self.mask(start_date, end_date)
+        daily = np.bincount(self.day[selected] - first, weights=self.amount_cents[selected],
+                            minlength=days)[:days]
+        cumulative = np.concatenate([[0.0], np.cumsum(daily)])
+        index = np.arange(1, days + 1)
+        lower = np.maximum(index - window, 0)
+        rolling = (cumulative[index] - cumulative[lower]) / (index - lower)
+
+        dates = np.arange(first, first + days).astype('datetime64[D]').astype(str)
+        return [(str(date), Money(int(amount)), Money(int(round(avg))))
+                for date, amount, avg in zip(dates, daily, rolling)]
+
+    def product_models(self, product_ids):
+        """商品ID到型号的映射，已删除的商品显示为ID"""
+        models = {int(product_id): f'#{product_id}' for product_id in product_ids}
+        for product_id, model in self.db.pool.reader().execute('SELECT id, model FROM products'):
+            if product_id in models:
+                models[product_id] = model
+        return models
+
+def _day_number(date_text):
+    """'YYYY-MM-DD'转换为1970-01-01起的天数"""
+    return int(np.datetime64(str(date_text)[:10], 'D').astype(np.int64))
+
+def _product_costs(db, product_ids):
+    """商品进价（分），未设置进价的为-1"""
+    costs = np.full(len(product_ids), -1, dtype=np.int64)
+    if not len(product_ids):
+        return costs
+    position = {int(product_id): i for i, product_id in enumerate(product_ids)}
+    cursor = db.pool.reader().execute(
+        'SELECT id, cost_cents FROM products WHERE cost_cents IS NOT NULL')
+    for product_id, cost in cursor:
+        i = position.get(product_id)
+        if i is not None:
+            costs[i] = cost
+    return costs
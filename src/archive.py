@@ -0,0 +1,273 @@
+import argparse
+import gzip
+import os
+import pathlib
+import shutil
+import sqlite3
+import stat
+import sys
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+# 归档分区目录，位于数据库文件所在目录下
+ARCHIVE_DIR_NAME = 'archive'
+# 压缩的归档分区解压后的缓存目录
+ARCHIVE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'shop_archive_cache')
+
+Partition = namedtuple('Partition', ['month', 'path', 'compressed', 'order_count',
+                                     'min_order_id', 'max_order_id'])
+
+# 归档分区文件的表结构，只包含订单查询用到的列
+_PARTITION_SCHEMA = [
+    '''
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY,
+        order_time DATETIME,
+        total_cents INTEGER,
+        payment_method TEXT,
+        member_id INTEGER,
+        journal_id TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE order_items (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER,
+        product_id INTEGER,
+        quantity INTEGER,
+        price_cents INTEGER
+    )
+    ''',
+    'CREATE INDEX idx_orders_order_time ON orders (order_time)',
+    'CREATE INDEX idx_orders_payment_time ON orders (payment_method, order_time)',
+    'CREATE INDEX idx_order_items_order_id ON order_items (order_id)',
+]
+
+def month_range(month):
+    """'2024-01' -> ('2024-01-01', '2024-02-01')"""
+    year, mon = (int(part) for part in month.split('-'))
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f'{month}-01', f'{year:04d}-{mon:02d}-01'
+
+def archive_dir(conn):
+    """主数据库所在目录下的归档目录"""
+    for _, name, path in conn.execute('PRAGMA database_list'):
+        if name == 'main':
+            return os.path.join(os.path.dirname(os.path.abspath(path)), ARCHIVE_DIR_NAME)
+    return ARCHIVE_DIR_NAME
+
+def list_partitions(conn, start_date=None, end_date=None, end_inclusive=False):
+    """
+    与订单时间范围相交的归档分区，按月份从新到旧排列
+    start_date/end_date: 与订单查询相同的日期字符串，None表示不限
+    """
+    partitions = []
+    for row in conn.execute('''
+    SELECT month, path, compressed, order_count, min_order_id, max_order_id
+    FROM archive_partitions
+    ORDER BY month DESC
+    '''):
+        partition = Partition(*row)
+        first_day, next_month = month_range(partition.month)
+        if start_date and str(start_date) >= next_month:
+            continue
+        if end_date and (str(end_date) < first_day if end_inclusive else str(end_date) <= first_day):
+            continue
+        partitions.append(partition)
+    return partitions
+
+def partitions_for_orders(conn, order_ids):
+    """按订单ID范围找出可能包含这些订单的分区，返回[(分区, [订单ID, ...]), ...]"""
+    result = []
+    for partition in list_partitions(conn):
+        ids = [order_id for order_id in order_ids
+               if partition.min_order_id <= order_id <= partition.max_order_id]
+        if ids:
+            result.append((partition, ids))
+    return result
+
+def _partition_file(conn, partition):
+    """分区数据库文件路径，压缩的分区先解压到缓存目录"""
+    path = os.path.join(archive_dir(conn), partition.path)
+    if not partition.compressed:
+        return path
+    os.makedirs(ARCHIVE_CACHE_DIR, exist_ok=True)
+    cached = os.path.join(ARCHIVE_CACHE_DIR, os.path.basename(path)[:-len('.gz')])
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+        partial = cached + '.partial'
+        with gzip.open(path, 'rb') as src, open(partial, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(partial, cached)
+    return cached
+
+@contextmanager
+def attached(conn, partition):
+    """
+    以只读方式把分区附加到连接上，返回附加库名
+    须在事务外调用，连接须以uri=True打开
+    """
+    schema = 'archive_' + partition.month.replace('-', '_')
+    uri = pathlib.Path(_partition_file(conn, partition)).absolute().as_uri()
+    # 分区文件归档后不再修改，immutable=1省去文件锁
+    conn.execute(f'ATTACH DATABASE ? AS {schema}', (uri + '?mode=ro&immutable=1',))
+    try:
+        yield schema
+    finally:
+        conn.execute(f'DETACH DATABASE {schema}')
+
+def archived_journal_order(conn, journal_id, order_time):
+    """
+    在订单时间所在月份的归档分区中按订单日志记录ID查找订单，返回订单ID或None
+    用单独的只读连接打开分区文件，可以在写事务中调用（事务中不能ATTACH）
+    """
+    row = conn.execute('''
+    SELECT month, path, compressed, order_count, min_order_id, max_order_id
+    FROM archive_partitions
+    WHERE month = ?
+    ''', (str(order_time)[:7],)).fetchone()
+    if row is None:
+        return None
+    uri = pathlib.Path(_partition_file(conn, Partition(*row))).absolute().as_uri()
+    partition_conn = sqlite3.connect(uri + '?mode=ro&immutable=1', uri=True)
+    try:
+        found = partition_conn.execute('SELECT id FROM orders WHERE journal_id = ?',
+                                       (journal_id,)).fetchone()
+    finally:
+        partition_conn.close()
+    return found[0] if found else None
+
+def sources(conn, partitions):
+    """依次给出订单数据所在的库名：先是热库main，再是各归档分区（逐个附加，用完即分离）"""
+    yield 'main'
+    for partition in partitions:
+        with attached(conn, partition) as schema:
+            yield schema
+
+def archive_month(db, month, compress=False):
+    """
+    把一个已结束月份的订单和订单明细移到归档分区文件
+    1. 从读连接的快照复制到新的分区文件并提交
+    2. 在一个写事务中从热库删除已复制的订单，并登记到archive_partitions
+    中途失败时热库数据不变，残留的分区文件在下次归档该月时覆盖
+    销售汇总表不受影响，统计仍按汇总表计算
+    返回: 归档的订单数
+    """
+    first_day, next_month = month_range(month)
+    if next_month > datetime.now().strftime('%Y-%m-%d'):
+        raise Exception(f"{month} 尚未结束，不能归档")
+
+    reader = db.pool.reader()
+    if reader.execute('SELECT 1 FROM archive_partitions WHERE month = ?', (month,)).fetchone():
+        raise Exception(f"{month} 已经归档")
+
+    directory = archive_dir(reader)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'orders_{month}.db')
+    for leftover in (path, path + '-journal', path + '.gz'):
+        if os.path.exists(leftover):
+            os.chmod(leftover, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(leftover)
+
+    # 复制到分区文件
+    reader.execute('BEGIN')
+    try:
+        orders = reader.execute('''
+        SELECT id, order_time, total_cents, payment_method, member_id, journal_id
+        FROM orders
+        WHERE order_time >= ? AND order_time < ?
+        ''', (first_day, next_month)).fetchall()
+        items = reader.execute('''
+        SELECT oi.id, oi.order_id, oi.product_id, oi.quantity, oi.price_cents
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.order_time >= ? AND o.order_time < ?
+        ''', (first_day, next_month)).fetchall()
+    finally:
+        reader.execute('COMMIT')
+    if not orders:
+        return 0
+
+    dest = sqlite3.connect(path, isolation_level=None)
+    try:
+        dest.execute('BEGIN')
+        for statement in _PARTITION_SCHEMA:
+            dest.execute(statement)
+        dest.executemany('INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?)', orders)
+        dest.executemany('INSERT INTO order_items VALUES (?, ?, ?, ?, ?)', items)
+        dest.execute('COMMIT')
+    finally:
+        dest.close()
+
+    if compress:
+        with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        path += '.gz'
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.chmod(path, stat.S_IREAD)
+
+    # 从热库删除并登记分区
+    order_ids = [row[0] for row in orders]
+    with db.pool.writer(immediate=True) as conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.archive_ids')
+        conn.executemany('INSERT INTO temp.archive_ids VALUES (?)', [(i,) for i in order_ids])
+        conn.execute('DELETE FROM order_items WHERE order_id IN (SELECT id FROM temp.archive_ids)')
+        conn.execute('DELETE FROM orders WHERE id IN (SELECT id FROM temp.archive_ids)')
+        conn.execute('''
+        INSERT INTO archive_partitions (month, path, compressed, order_count, item_count,
+                                        total_cents, min_order_id, max_order_id, archived_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (month, os.path.basename(path), int(compress), len(orders), len(items),
+              sum(row[2] or 0 for row in orders), min(order_ids), max(order_ids),
+              datetime.now()))
+        conn.execute('DELETE FROM temp.archive_ids')
+    print(f"{month} 已归档 {len(orders)} 个订单到 {path}")
+    return len(orders)
+
+def closed_months(db, keep_months):
+    """热库中可以归档的月份：早于最近keep_months个月（含当月）的月份"""
+    now = datetime.now()
+    year, month = now.year, now.month - (keep_months - 1)
+    while month <= 0:
+        year, month = year - 1, month + 12
+    cutoff = f'{year:04d}-{month:02d}-01'
+    return [row[0] for row in db.pool.reader().execute('''
+    SELECT DISTINCT strftime('%Y-%m', order_time)
+    FROM orders
+    WHERE order_time < ?
+      AND strftime('%Y-%m', order_time) NOT IN (SELECT month FROM archive_partitions)
+    ORDER BY 1
+    ''', (cutoff,))]
+
+def main(argv=None):
+    from models import Database
+
+    parser = argparse.ArgumentParser(description='把已结束月份的订单归档到按月分区的只读数据库文件')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--keep-months', type=int, default=3, help='热库中保留的最近月份数（含当月）')
+    parser.add_argument('--compress', action='store_true', help='用gzip压缩分区文件')
+    parser.add_argument('--vacuum', action='store_true', help='归档后执行VACUUM收缩热库文件')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        months = closed_months(db, args.keep_months)
+        if not months:
+            print("没有需要归档的月份")
+            return 0
+        for month in months:
+            archive_month(db, month, args.compress)
+        if args.vacuum:
+            with db.pool.writer_connection() as conn:
+                conn.execute('VACUUM')
+            print("热库已收缩")
+        return 0
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from archive import ARCHIVE_DIR_NAME
+
+# 备份文件名前缀和时间格式，按文件名排序即按时间排序
+BACKUP_PREFIX = 'shop-'
+BACKUP_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+class BackupWorker:
+    """
+    后台在线备份
+    - 使用SQLite备份API(sqlite3.Connection.backup)复制数据库，每步复制pages_per_step页后休眠step_sleep秒，
+      限制备份占用的磁盘带宽
+    - 备份期间源连接保持一个读事务：WAL模式下读事务不阻塞写入，create_order照常提交；
+      备份复制的是开始时的快照，不会因为期间的写入而反复重来
+    - 备份写入.partial临时文件，PRAGMA integrity_check通过后才改名为正式备份
+    - 保留最近generations个备份，更早的自动删除；每次备份的耗时和大小追加到metrics.jsonl
+    - 归档分区文件不会再修改，备份时只复制备份目录中还没有的分区
+    """
+
+    def __init__(self, db_path='shop.db', backup_dir='backups', interval=6 * 3600,
+                 generations=7, pages_per_step=256, step_sleep=0.05):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.generations = generations
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.metrics_path = os.path.join(backup_dir, 'metrics.jsonl')
+        self.last_result = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动定时备份线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='BackupWorker', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def request_backup(self):
+        """让后台线程立即执行一次备份"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self._seconds_until_due())
+            if self._stop.is_set():
+                break
+            self._wake.clear()
+            try:
+                self.backup_now()
+            except Exception as e:
+                print(f"数据库备份失败: {str(e)}")
+
+    def _seconds_until_due(self):
+        backups = self.list_backups()
+        if not backups:
+            return 0
+        age = time.time() - os.path.getmtime(backups[-1])
+        return max(self.interval - age, 0)
+
+    def list_backups(self):
+        """已完成的备份文件，从旧到新"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return [os.path.join(self.backup_dir, name)
+                for name in sorted(os.listdir(self.backup_dir))
+                if name.startswith(BACKUP_PREFIX) and name.endswith('.db')]
+
+    def backup_now(self):
+        """
+        执行一次备份
+        返回: 本次备份的指标，同时写入metrics.jsonl
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        started = datetime.now()
+        target_path = os.path.join(self.backup_dir,
+                                   f'{BACKUP_PREFIX}{started.strftime(BACKUP_TIME_FORMAT)}.db')
+        partial_path = target_path + '.partial'
+        result = {'time': started.isoformat(sep=' ', timespec='seconds'),
+                  'file': os.path.basename(target_path), 'ok': False}
+        steps = [0]
+
+        def progress(status, remaining, total):
+            steps[0] += 1
+            result['pages'] = total
+            # backup()的sleep参数只在数据库繁忙时生效，限速在每步之后自行休眠
+            if remaining and self.step_sleep:
+                time.sleep(self.step_sleep)
+
+        start = time.perf_counter()
+        try:
+            source_uri = pathlib.Path(self.db_path).absolute().as_uri() + '?mode=ro'
+            source = sqlite3.connect(source_uri, uri=True, isolation_level=None)
+            target = sqlite3.connect(partial_path, isolation_level=None)
+            try:
+                # 固定读快照，备份期间其他连接的写入不会使备份重来
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchall()
+                source.backup(target, pages=self.pages_per_step, progress=progress,
+                              sleep=self.step_sleep)
+                source.execute('COMMIT')
+                result['copy_seconds'] = round(time.perf_counter() - start, 3)
+
+                verify_start = time.perf_counter()
+                integrity = target.execute('PRAGMA integrity_check').fetchall()
+                result['verify_seconds'] = round(time.perf_counter() - verify_start, 3)
+                result['integrity'] = integrity[0][0] if len(integrity) == 1 else 'errors'
+            finally:
+                source.close()
+                target.close()
+
+            if result['integrity'] != 'ok':
+                os.remove(partial_path)
+                raise Exception(f"备份文件完整性校验失败: {integrity[:5]}")
+            os.replace(partial_path, target_path)
+
+            result['size'] = os.path.getsize(target_path)
+            result['steps'] = steps[0]
+            result['archives_copied'] = self._copy_archives()
+            result['deleted'] = self._rotate()
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        finally:
+            result['seconds'] = round(time.perf_counter() - start, 3)
+            self.last_result = result
+            self._write_metrics(result)
+
+        print(f"数据库已备份到 {target_path}，{result['size'] / 1024 / 1024:.1f} MB，"
+              f"用时 {result['seconds']:.1f} 秒")
+        return result
+
+    def _copy_archives(self):
+        """复制备份目录中还没有的归档分区文件"""
+        source_dir = os.path.join(os.path.dirname(os.path.abspath(self.db_path)), ARCHIVE_DIR_NAME)
+        if not os.path.isdir(source_dir):
+            return 0
+        target_dir = os.path.join(self.backup_dir, ARCHIVE_DIR_NAME)
+        os.makedirs(target_dir, exist_ok=True)
+        copied = 0
+        for name in os.listdir(source_dir):
+            if not os.path.exists(os.path.join(target_dir, name)):
+                shutil.copy2(os.path.join(source_dir, name), os.path.join(target_dir, name))
+                copied += 1
+        return copied
+
+    def _rotate(self):
+        """删除超出保留代数的旧备份"""
+        backups = self.list_backups()
+        expired = backups[:-self.generations] if self.generations > 0 else []
+        for path in expired:
+            os.remove(path)
+        return len(expired)
+
+    def _write_metrics(self, result):
+        try:
+            with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"写入备份指标失败: {str(e)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在线备份数据库（不需要停止收银程序）')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--dir', default='backups', help='备份目录')
+    parser.add_argument('--generations', type=int, default=7, help='保留的备份份数')
+    parser.add_argument('--pages', type=int, default=256, help='每步复制的页数')
+    parser.add_argument('--sleep', type=float, default=0.05, help='每步之间休眠的秒数')
+    args = parser.parse_args(argv)
+
+    worker = BackupWorker(args.db, args.dir, generations=args.generations,
+                          pages_per_step=args.pages, step_sleep=args.sleep)
+    try:
+        result = worker.backup_now()
+    except Exception as e:
+        print(f"数据库备份失败: {str(e)}")
+        return 1
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
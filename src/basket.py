@@ -0,0 +1,222 @@
+import argparse
+import csv
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+from analytics import SalesAnalytics
+
+# 每个字节中1的个数，NumPy 2.0以下没有bitwise_count时用于统计位集中1的个数
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _popcount(bits):
+    """位集(uint64数组)中1的个数"""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bits).sum())
+    return int(_POPCOUNT[bits.view(np.uint8)].sum())
+
+class BasketAnalysis:
+    """
+    购物篮分析（频繁项集与关联规则）
+    - 每个订单是一笔交易，同一订单中同一商品只计一次
+    - 先按min_support筛出频繁商品，只保留含两件以上频繁商品的订单
+    - 商品对直接在按订单排序的明细上成对计数（向量化），不需要订单×商品矩阵
+    - 三件及以上的项集用Eclat深度优先搜索：只为出现在频繁商品对中的商品建立订单位集（每个订单1位），
+      项集的位集是各商品位集的按位与，支持度是其中1的个数
+    位集内存约为 参与组合的商品数 × 订单数 / 8 字节，百万订单、千个商品约125MB
+    """
+
+    def __init__(self, order_ids, product_ids, min_support=0.01, max_size=3, min_count=2):
+        """
+        order_ids/product_ids: 订单明细的订单ID和商品ID，长度相同
+        min_support: 最小支持度（包含该项集的订单占全部订单的比例）
+        max_size: 项集最多包含的商品数
+        min_count: 项集至少出现的订单数，避免订单很少时偶然的组合
+        """
+        self.min_support = min_support
+        self.max_size = max_size
+        # 项集(商品ID升序元组) -> 出现的订单数
+        self.counts = {}
+
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        orders, order_index = np.unique(order_ids, return_inverse=True)
+        products, item_index = np.unique(product_ids, return_inverse=True)
+        self.transaction_count = len(orders)
+        if not self.transaction_count:
+            return
+        self.min_count = max(min_count, int(np.ceil(min_support * self.transaction_count)))
+
+        # 订单×商品去重，结果按订单、商品排序
+        pairs = np.sort(order_index * len(products) + item_index)
+        pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+        transaction, item = pairs // len(products), pairs % len(products)
+
+        item_counts = np.bincount(item, minlength=len(products))
+        frequent = np.flatnonzero(item_counts >= self.min_count)
+        self._products = products[frequent]
+        for product_id, count in zip(self._products, item_counts[frequent]):
+            self.counts[(int(product_id),)] = int(count)
+        if len(frequent) < 2 or max_size < 2:
+            return
+
+        # 只保留频繁商品（改用0..n-1编号），并去掉其中频繁商品不足两件的订单
+        keep = np.isin(item, frequent)
+        transaction, item = transaction[keep], np.searchsorted(frequent, item[keep])
+        per_transaction = np.bincount(transaction, minlength=self.transaction_count)
+        keep = per_transaction[transaction] >= 2
+        transaction, item = transaction[keep], item[keep]
+        _, transaction = np.unique(transaction, return_inverse=True)
+
+        pair_counts = self._count_pairs(transaction, item, len(frequent))
+        if max_size >= 3 and pair_counts:
+            self._mine_larger(transaction, item, pair_counts)
+
+    def _count_pairs(self, transaction, item, item_total):
+        """统计同一订单中的商品对，返回{(编号a, 编号b): 订单数}，a < b"""
+        codes = []
+        # 明细按订单、商品排序，相隔distance行且属于同一订单的两行组成一个商品对
+        distance = 1
+        while distance < len(item):
+            same = transaction[distance:] == transaction[:-distance]
+            if not same.any():
+                break
+            codes.append(item[:-distance][same] * item_total + item[distance:][same])
+            distance += 1
+        if not codes:
+            return {}
+        values, counts = np.unique(np.concatenate(codes), return_counts=True)
+        frequent = counts >= self.min_count
+        pair_counts = {}
+        for code, count in zip(values[frequent], counts[frequent]):
+            a, b = divmod(int(code), item_total)
+            pair_counts[(a, b)] = int(count)
+            self.counts[(int(self._products[a]), int(self._products[b]))] = int(count)
+        return pair_counts
+
+    def _mine_larger(self, transaction, item, pair_counts):
+        """从频繁商品对出发用Eclat搜索三件及以上的频繁项集"""
+        # 位集长度取64位的整数倍，按uint64做按位与和计数
+        width = (int(transaction.max()) // 64 + 1) * 64
+        order = np.argsort(item, kind='stable')
+        bounds = np.searchsorted(item[order], np.arange(int(item.max()) + 2))
+        bitsets = {}
+        for index in sorted({index for pair in pair_counts for index in pair}):
+            present = np.zeros(width, dtype=bool)
+            present[transaction[order[bounds[index]:bounds[index + 1]]]] = True
+            bitsets[index] = np.packbits(present).view(np.uint64)
+
+        partners = {}
+        for a, b in sorted(pair_counts):
+            partners.setdefault(a, []).append(b)
+        for a, others in partners.items():
+            if len(others) < 2:
+                continue
+            # 候选: (商品编号, 前缀{a}加上该商品后的订单位集)
+            candidates = [(b, bitsets[a] & bitsets[b]) for b in others]
+            self._eclat((a,), candidates)
+
+    def _eclat(self, prefix, candidates):
+        """candidates: [(商品编号, 位集), ...]，每一项与prefix组成频繁项集，位集是该项集的订单位集"""
+        for index, (item, bits) in enumerate(candidates):
+            itemset = prefix + (item,)
+            if len(itemset) >= self.max_size:
+                continue
+            extensions = []
+            for other, other_bits in candidates[index + 1:]:
+                joined = bits & other_bits
+                count = _popcount(joined)
+                if count >= self.min_count:
+                    key = tuple(sorted(int(self._products[i]) for i in itemset + (other,)))
+                    self.counts[key] = count
+                    extensions.append((other, joined))
+            if extensions:
+                self._eclat(itemset, extensions)
+
+    def support(self, itemset):
+        return self.counts.get(tuple(sorted(itemset)), 0) / self.transaction_count
+
+    def itemsets(self, min_size=2):
+        """
+        频繁项集
+        返回: [(商品ID元组, 订单数, 支持度), ...]，按订单数从多到少
+        """
+        result = [(itemset, count, count / self.transaction_count)
+                  for itemset, count in self.counts.items() if len(itemset) >= min_size]
+        result.sort(key=lambda row: (-row[1], row[0]))
+        return result
+
+    def rules(self, min_confidence=0.2, min_lift=1.0):
+        """
+        关联规则 前项 -> 后项（后项为单个商品）
+        置信度 = 支持度(前项∪后项) / 支持度(前项)
+        提升度 = 置信度 / 支持度(后项)，大于1表示一起购买的概率高于随机
+        返回: [(前项商品ID元组, 后项商品ID, 支持度, 置信度, 提升度), ...]，按提升度从高到低
+        """
+        result = []
+        for itemset, count in self.counts.items():
+            if len(itemset) < 2:
+                continue
+            for consequent in itemset:
+                antecedent = tuple(product_id for product_id in itemset if product_id != consequent)
+                confidence = count / self.counts[antecedent]
+                lift = confidence / (self.counts[(consequent,)] / self.transaction_count)
+                if confidence >= min_confidence and lift >= min_lift:
+                    result.append((antecedent, consequent, count / self.transaction_count,
+                                   confidence, lift))
+        result.sort(key=lambda row: (-row[4], -row[3], row[0], row[1]))
+        return result
+
+    @classmethod
+    def from_analytics(cls, analytics, start_date=None, end_date=None, **kwargs):
+        """用SalesAnalytics已加载的明细做分析，时间范围与SalesAnalytics.mask相同"""
+        selected = analytics.mask(start_date, end_date)
+        return cls(analytics.order_id[selected], analytics.product_id[selected], **kwargs)
+
+def main(argv=None):
+    from models import Database
+
+    parser = argparse.ArgumentParser(description='购物篮分析：找出经常一起购买的商品')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--days', type=int, default=90, help='统计最近多少天的订单，0表示全部')
+    parser.add_argument('--min-support', type=float, default=0.01, help='最小支持度')
+    parser.add_argument('--min-confidence', type=float, default=0.2, help='最小置信度')
+    parser.add_argument('--min-lift', type=float, default=1.0, help='最小提升度')
+    parser.add_argument('--max-size', type=int, default=3, help='项集最多包含的商品数')
+    parser.add_argument('--top', type=int, default=20, help='输出的规则条数')
+    parser.add_argument('--csv', help='把全部规则写入CSV文件')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        analytics = SalesAnalytics(db)
+        analytics.refresh()
+        start_date = None
+        if args.days > 0:
+            start_date = (datetime.now() - timedelta(days=args.days)).strftime('%Y-%m-%d')
+        basket = BasketAnalysis.from_analytics(analytics, start_date,
+                                               min_support=args.min_support, max_size=args.max_size)
+        rules = basket.rules(args.min_confidence, args.min_lift)
+        models = analytics.product_models({product_id for itemset in basket.counts
+                                           for product_id in itemset})
+    finally:
+        db.close()
+
+    def names(product_ids):
+        return ' + '.join(models[product_id] for product_id in product_ids)
+
+    print(f"订单数: {basket.transaction_count}，频繁项集: {len(basket.itemsets())}，规则: {len(rules)}")
+    for antecedent, consequent, support, confidence, lift in rules[:args.top]:
+        print(f"{names(antecedent)} -> {models[consequent]}  "
+              f"支持度 {support:.2%}  置信度 {confidence:.2%}  提升度 {lift:.2f}")
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['前项', '后项', '支持度', '置信度', '提升度'])
+            for antecedent, consequent, support, confidence, lift in rules:
+                writer.writerow([names(antecedent), models[consequent],
+                                 f'{support:.4f}', f'{confidence:.4f}', f'{lift:.4f}'])
+        print(f"规则已导出到 {args.csv}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
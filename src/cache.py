@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+class ProductCache:
+    """
+    按条码缓存商品行的LRU缓存
+    - 容量有限，超出时淘汰最久未使用的条目
+    - 同时记录商品ID到条码的映射，便于按商品ID失效
+    - 每次失效都会增加版本号，查询开始前取得的版本号与写入时不一致则放弃写入，
+      避免并发修改时把旧数据写回缓存
+    """
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._barcode_by_id = {}
+        self._lock = threading.Lock()
+
+    def get(self, barcode):
+        """返回缓存的商品行，未命中返回None"""
+        with self._lock:
+            product = self._data.get(barcode)
+            if product is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(barcode)
+            self.hits += 1
+            return product
+
+    def put(self, barcode, product, generation):
+        """
+        写入缓存
+        generation: 查询数据库之前读取的版本号
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[barcode] = product
+            self._data.move_to_end(barcode)
+            self._barcode_by_id[product[0]] = barcode
+            while len(self._data) > self.maxsize:
+                _, evicted = self._data.popitem(last=False)
+                self._barcode_by_id.pop(evicted[0], None)
+
+    def invalidate_barcode(self, barcode):
+        with self._lock:
+            self.generation += 1
+            product = self._data.pop(barcode, None)
+            if product is not None:
+                self._barcode_by_id.pop(product[0], None)
+
+    def invalidate_ids(self, product_ids):
+        with self._lock:
+            self.generation += 1
+            for product_id in product_ids:
+                barcode = self._barcode_by_id.pop(product_id, None)
+                if barcode is not None:
+                    self._data.pop(barcode, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._barcode_by_id.clear()
+
+    def stats(self):
+        """
+        获取缓存统计
+        返回: {'size': int, 'maxsize': int, 'hits': int, 'misses': int, 'hit_rate': float}
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+class MemberCache:
+    """
+    会员手机号/卡号到会员ID的LRU缓存
+    只缓存不常变化的对应关系，积分和等级每次按主键读取最新值
+    修改会员的手机号或卡号时整体清空
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, code):
+        """返回缓存的会员ID，未命中返回None"""
+        with self._lock:
+            member_id = self._data.get(code)
+            if member_id is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(code)
+            self.hits += 1
+            return member_id
+
+    def put(self, code, member_id, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[code] = member_id
+            self._data.move_to_end(code)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
@@ -0,0 +1,54 @@
+from money import Money
+
+class Cart:
+    """
+    收银台的购物车
+    items中的商品为 {'product_id': int, 'model': str, 'price': Money, 'quantity': int}，
+    可以直接传给OrderJournal.new_record、Database.create_order和小票打印
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add_product(self, product, quantity=1):
+        """
+        加入商品，已在购物车中的商品累加数量
+        product: get_product_by_barcode返回的 (id, barcode, model, price, stock, category_id)
+        返回: 商品所在的行号
+        """
+        for row, item in enumerate(self.items):
+            if item['product_id'] == product[0]:
+                item['quantity'] += quantity
+                return row
+        self.items.append({
+            'product_id': product[0],
+            'model': product[2],
+            'price': product[3],
+            'quantity': quantity
+        })
+        return len(self.items) - 1
+
+    def set_quantity(self, row, quantity):
+        if 0 <= row < len(self.items):
+            self.items[row]['quantity'] = quantity
+
+    def remove(self, row):
+        if 0 <= row < len(self.items):
+            self.items.pop(row)
+
+    def clear(self):
+        # 换成新的列表，已经交给订单日志或打印的商品列表不受影响
+        self.items = []
+
+    @staticmethod
+    def subtotal(item):
+        return item['price'] * item['quantity']
+
+    def total(self):
+        return sum((self.subtotal(item) for item in self.items), Money())
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+class ConnectionPool:
+    """
+    SQLite连接池
+    - 数据库使用WAL日志模式，读操作不会阻塞写操作，写操作也不会阻塞读操作
+    - 每个线程拥有自己的只读连接
+    - 所有写操作共用一个写连接，由锁串行化
+    """
+
+    def __init__(self, db_path='shop.db', timeout=30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        # 性能监控的跟踪回调和进度回调，None表示未启用
+        self._hooks = (None, None, 0)
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        # 每次提交都fsync，提交返回后订单即已持久化；多个订单可通过OrderWriter分组共用一次提交
+        self._writer.execute('PRAGMA synchronous = FULL')
+
+    def _connect(self):
+        # uri=True使ATTACH可以用file: URI以只读方式附加归档分区，普通文件路径不受影响
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, uri=True,
+                               check_same_thread=False, isolation_level=None)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.timeout * 1000)}')
+        # INSERT OR REPLACE删除旧行时也要触发DELETE触发器，保证全文索引同步
+        conn.execute('PRAGMA recursive_triggers = ON')
+        self._apply_hooks(conn)
+        return conn
+
+    def _apply_hooks(self, conn):
+        trace, progress, interval = self._hooks
+        conn.set_trace_callback(trace)
+        conn.set_progress_handler(progress, interval)
+
+    def set_hooks(self, trace, progress, interval=1000):
+        """
+        为现有和以后创建的所有连接设置跟踪回调和进度回调，都为None时移除
+        trace: trace(sql)，每条语句开始执行时调用
+        progress: progress()，每执行interval条虚拟机指令调用一次，返回非0会中断语句
+        """
+        self._hooks = (trace, progress, interval)
+        with self._readers_lock:
+            connections = list(self._readers)
+        with self._write_lock:
+            connections.append(self._writer)
+        for conn in connections:
+            self._apply_hooks(conn)
+
+    def reader(self):
+        """获取当前线程的读连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def release_reader(self):
+        """关闭当前线程的读连接，线程结束前调用，避免短期线程遗留连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._readers_lock:
+            if conn in self._readers:
+                self._readers.remove(conn)
+        conn.close()
+
+    @contextmanager
+    def writer_connection(self):
+        """获取写连接但不开启事务，由调用方自行管理事务"""
+        with self._write_lock:
+            yield self._writer
+
+    @contextmanager
+    def writer(self, immediate=False):
+        """
+        获取写连接并开启事务，正常退出时提交，发生异常时回滚
+        immediate: 是否使用BEGIN IMMEDIATE立即获取写锁
+        """
+        with self._write_lock:
+            conn = self._writer
+            if conn.in_transaction:
+                # 嵌套调用时复用外层事务
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+
+    def close(self):
+        """关闭所有连接"""
+        with self._readers_lock:
+            for conn in self._readers:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._readers.clear()
+        self._local = threading.local()
+        with self._write_lock:
+            self._writer.close()
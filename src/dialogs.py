@@ -1,10 +1,14 @@
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                            QLineEdit, QPushButton, QComboBox, QMessageBox,
                            QTableWidget, QTableWidgetItem, QHeaderView,
-                           QFileDialog, QTextEdit)
+                           QFileDialog, QTextEdit, QProgressDialog, QApplication,
+                           QTabWidget, QWidget)
 from PyQt5.QtCore import Qt, pyqtSlot
-from datetime import datetime
+from PyQt5.QtGui import QColor
+from datetime import datetime, timedelta
 from scanner import BarcodeScanner
+from models import ExportCancelled, DEFAULT_REORDER_THRESHOLD
+from money import Money
 
 class AddProductDialog(QDialog):
     def __init__(self, parent=None):
@@ -51,6 +55,24 @@ class AddProductDialog(QDialog):
         stock_layout.addWidget(self.stock_input)
         layout.addLayout(stock_layout)
         
+        # 补货阈值输入
+        threshold_layout = QHBoxLayout()
+        threshold_label = QLabel('补货阈值:')
+        self.threshold_input = QLineEdit()
+        self.threshold_input.setText(str(DEFAULT_REORDER_THRESHOLD))
+        threshold_layout.addWidget(threshold_label)
+        threshold_layout.addWidget(self.threshold_input)
+        layout.addLayout(threshold_layout)
+        
+        # 进价输入（可选）
+        cost_layout = QHBoxLayout()
+        cost_label = QLabel('进价:')
+        self.cost_input = QLineEdit()
+        self.cost_input.setPlaceholderText('可选，用于毛利统计')
+        cost_layout.addWidget(cost_label)
+        cost_layout.addWidget(self.cost_input)
+        layout.addLayout(cost_layout)
+        
         # 按钮
         button_layout = QHBoxLayout()
         ok_button = QPushButton('确定')
@@ -95,8 +117,8 @@ class AddProductDialog(QDialog):
             return
             
         try:
-            price = float(self.price_input.text())
-            if price <= 0:
+            price = Money.parse(self.price_input.text())
+            if price.cents <= 0:
                 raise ValueError()
         except ValueError:
             QMessageBox.warning(self, '错误', '请输入有效的价格')
@@ -110,6 +132,21 @@ class AddProductDialog(QDialog):
             QMessageBox.warning(self, '错误', '请输入有效的库存数量')
             return
             
+        try:
+            threshold = int(self.threshold_input.text())
+            if threshold < 0:
+                raise ValueError()
+        except ValueError:
+            QMessageBox.warning(self, '错误', '请输入有效的补货阈值')
+            return
+            
+        try:
+            if self.cost_input.text().strip() and Money.parse(self.cost_input.text()).cents < 0:
+                raise ValueError()
+        except ValueError:
+            QMessageBox.warning(self, '错误', '请输入有效的进价')
+            return
+            
         self.accept()
         
     def get_product_data(self):
@@ -117,8 +154,10 @@ class AddProductDialog(QDialog):
             return {
                 'barcode': self.barcode_input.text().strip(),
                 'model': self.model_input.text().strip(),
-                'price': float(self.price_input.text()),
-                'stock': int(self.stock_input.text())
+                'price': Money.parse(self.price_input.text()),
+                'stock': int(self.stock_input.text()),
+                'reorder_threshold': int(self.threshold_input.text()),
+                'cost': Money.parse(self.cost_input.text()) if self.cost_input.text().strip() else None
             }
         except ValueError:
             return None
@@ -130,10 +169,13 @@ class AddProductDialog(QDialog):
         super().closeEvent(event)
 
 class PaymentDialog(QDialog):
-    def __init__(self, total_amount, parent=None):
+    def __init__(self, total_amount, parent=None, db=None):
         super().__init__(parent)
         self.total_amount = total_amount
+        self.db = db
         self.payment_method = None
+        # 识别到的会员，订单积分累加到该会员
+        self.member = None
         self.scanner = BarcodeScanner()
         self.init_ui()
         
@@ -164,6 +206,21 @@ class PaymentDialog(QDialog):
         scan_layout.addWidget(scan_btn)
         layout.addLayout(scan_layout)
         
+        # 会员识别
+        if self.db is not None:
+            member_layout = QHBoxLayout()
+            self.member_input = QLineEdit()
+            self.member_input.setPlaceholderText('会员手机号/卡号（可选）')
+            self.member_input.returnPressed.connect(self.lookup_member)
+            self.member_input.textChanged.connect(self.on_member_input_changed)
+            member_btn = QPushButton('识别会员')
+            member_btn.clicked.connect(self.lookup_member)
+            member_layout.addWidget(self.member_input)
+            member_layout.addWidget(member_btn)
+            layout.addLayout(member_layout)
+            self.member_label = QLabel()
+            layout.addWidget(self.member_label)
+        
         # 按钮
         button_layout = QHBoxLayout()
         ok_button = QPushButton('确认支付')
@@ -208,9 +265,38 @@ class PaymentDialog(QDialog):
             if isinstance(child, QPushButton) and child.text() == '停止扫码':
                 child.setText('扫码')
                 break
+        # 会员卡支付时卡号同时用于识别会员
+        if self.db is not None and self.method_combo.currentText() == '会员卡' \
+                and not self.member_input.text().strip():
+            self.member_input.setText(code)
+            self.lookup_member()
         # 显示成功提示
         QMessageBox.information(self, '成功', '扫码成功！')
         
+    def on_member_input_changed(self, text):
+        """修改或清空会员号码后，之前识别到的会员作废，确认支付时需重新识别"""
+        self.member = None
+        self.member_label.clear()
+
+    def lookup_member(self):
+        """按手机号或卡号识别会员，返回是否找到"""
+        code = self.member_input.text().strip()
+        self.member = None
+        if not code:
+            self.member_label.clear()
+            return False
+        try:
+            self.member = self.db.find_member(code)
+        except Exception as e:
+            self.member_label.setText(f'查询会员失败: {str(e)}')
+            return False
+        if self.member is None:
+            self.member_label.setText('未找到会员')
+            return False
+        _, name, phone, points, level, _, card_no = self.member
+        self.member_label.setText(f'会员: {name}（{card_no or phone}）  积分: {points}  等级: {level}')
+        return True
+
     def process_payment(self):
         self.payment_method = self.method_combo.currentText()
         payment_code = self.code_input.text().strip()
@@ -219,9 +305,17 @@ class PaymentDialog(QDialog):
         if self.payment_method in ['微信支付', '支付宝', '会员卡'] and not payment_code:
             QMessageBox.warning(self, '错误', '请扫描付款码或会员卡号')
             return
+        
+        # 号码修改后识别结果已被清除（见on_member_input_changed），填写了号码但尚未识别时先识别
+        if self.db is not None and self.member_input.text().strip() and self.member is None:
+            if not self.lookup_member():
+                QMessageBox.warning(self, '错误', '未找到该会员，请核对手机号或卡号')
+                return
             
         # TODO: 实际支付处理逻辑
         success_msg = f'支付成功！\n金额: ¥{self.total_amount:.2f}\n方式: {self.payment_method}'
+        if self.member is not None:
+            success_msg += f'\n会员: {self.member[1]}'
         if payment_code:
             success_msg += f'\n付款码/卡号: {payment_code}'
         QMessageBox.information(self, '成功', success_msg)
@@ -279,6 +373,26 @@ class EditProductDialog(QDialog):
         stock_layout.addWidget(self.stock_input)
         layout.addLayout(stock_layout)
         
+        # 补货阈值输入
+        threshold_layout = QHBoxLayout()
+        threshold_label = QLabel('补货阈值:')
+        self.threshold_input = QLineEdit()
+        self.threshold_input.setText(str(self.product_data[5]))
+        threshold_layout.addWidget(threshold_label)
+        threshold_layout.addWidget(self.threshold_input)
+        layout.addLayout(threshold_layout)
+        
+        # 进价输入（可选）
+        cost_layout = QHBoxLayout()
+        cost_label = QLabel('进价:')
+        self.cost_input = QLineEdit()
+        self.cost_input.setPlaceholderText('可选，用于毛利统计')
+        if self.product_data[6] is not None:
+            self.cost_input.setText(str(self.product_data[6]))
+        cost_layout.addWidget(cost_label)
+        cost_layout.addWidget(self.cost_input)
+        layout.addLayout(cost_layout)
+        
         # 按钮
         button_layout = QHBoxLayout()
         ok_button = QPushButton('确定')
@@ -299,8 +413,8 @@ class EditProductDialog(QDialog):
             return
             
         try:
-            price = float(self.price_input.text())
-            if price <= 0:
+            price = Money.parse(self.price_input.text())
+            if price.cents <= 0:
                 raise ValueError()
         except ValueError:
             QMessageBox.warning(self, '错误', '请输入有效的价格')
@@ -314,6 +428,21 @@ class EditProductDialog(QDialog):
             QMessageBox.warning(self, '错误', '请输入有效的库存数量')
             return
             
+        try:
+            threshold = int(self.threshold_input.text())
+            if threshold < 0:
+                raise ValueError()
+        except ValueError:
+            QMessageBox.warning(self, '错误', '请输入有效的补货阈值')
+            return
+            
+        try:
+            if self.cost_input.text().strip() and Money.parse(self.cost_input.text()).cents < 0:
+                raise ValueError()
+        except ValueError:
+            QMessageBox.warning(self, '错误', '请输入有效的进价')
+            return
+            
         self.accept()
         
     def get_product_data(self):
@@ -322,26 +451,210 @@ class EditProductDialog(QDialog):
                 'id': self.product_data[0],
                 'barcode': self.barcode_input.text().strip(),
                 'model': self.model_input.text().strip(),
-                'price': float(self.price_input.text()),
-                'stock': int(self.stock_input.text())
+                'price': Money.parse(self.price_input.text()),
+                'stock': int(self.stock_input.text()),
+                'reorder_threshold': int(self.threshold_input.text()),
+                # 清空进价时传空字符串，update_product据此清除进价
+                'cost': Money.parse(self.cost_input.text()) if self.cost_input.text().strip() else ''
             }
         except ValueError:
             return None
 
 class SalesStatisticsDialog(QDialog):
-    def __init__(self, db, parent=None):
+    """
+    销售统计
+    - 概览页来自销售汇总表(get_sales_statistics)，连接门店服务器时也可用
+    - 热力图、ABC分类、毛利和趋势由SalesAnalytics在内存中计算，切换时间范围不再查询数据库
+    """
+
+    # (显示名称, 天数)，None表示全部
+    RANGES = [('最近7天', 7), ('最近30天', 30), ('最近90天', 90), ('最近一年', 365), ('全部', None)]
+
+    def __init__(self, db, analytics=None, parent=None):
         super().__init__(parent)
         self.db = db
+        self.analytics = analytics
         self.setWindowTitle('销售统计')
-        self.setGeometry(100, 100, 800, 600)
+        self.setGeometry(100, 100, 900, 650)
         
         layout = QVBoxLayout(self)
-        layout.addWidget(QLabel('销售统计功能开发中...'))
+        
+        # 时间范围选择
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel('时间范围:'))
+        self.range_combo = QComboBox()
+        for name, _ in self.RANGES:
+            self.range_combo.addItem(name)
+        self.range_combo.setCurrentIndex(1)
+        self.range_combo.currentIndexChanged.connect(self.update_statistics)
+        range_layout.addWidget(self.range_combo)
+        range_layout.addStretch()
+        self.status_label = QLabel()
+        range_layout.addWidget(self.status_label)
+        layout.addLayout(range_layout)
+        
+        self.tabs = QTabWidget()
+        layout.addWidget(self.tabs)
+        
+        # 概览
+        overview = QWidget()
+        overview_layout = QVBoxLayout(overview)
+        self.summary_label = QLabel()
+        overview_layout.addWidget(self.summary_label)
+        self.popular_table = self.create_table(['型号', '销量', '销售额'])
+        overview_layout.addWidget(QLabel('热销商品:'))
+        overview_layout.addWidget(self.popular_table)
+        self.payment_table = self.create_table(['支付方式', '订单数', '金额'])
+        overview_layout.addWidget(QLabel('支付方式:'))
+        overview_layout.addWidget(self.payment_table)
+        self.tabs.addTab(overview, '概览')
+        
+        if self.analytics is not None:
+            # 明细分析依赖numpy，打开销售统计时才导入
+            from analytics import WEEKDAY_NAMES
+            self.heatmap_table = QTableWidget(7, 24)
+            self.heatmap_table.setVerticalHeaderLabels(WEEKDAY_NAMES)
+            self.heatmap_table.setHorizontalHeaderLabels([str(hour) for hour in range(24)])
+            self.heatmap_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            self.heatmap_table.setEditTriggers(QTableWidget.NoEditTriggers)
+            self.tabs.addTab(self.heatmap_table, '时段热力图')
+            
+            self.abc_table = self.create_table(['型号', '销售额', '占比', '累计占比', '类别'])
+            self.tabs.addTab(self.abc_table, 'ABC分类')
+            
+            margin_page = QWidget()
+            margin_layout = QVBoxLayout(margin_page)
+            self.margin_label = QLabel()
+            margin_layout.addWidget(self.margin_label)
+            self.margin_table = self.create_table(['型号', '销量', '销售额', '成本', '毛利', '毛利率'])
+            margin_layout.addWidget(self.margin_table)
+            self.tabs.addTab(margin_page, '毛利')
+            
+            self.trend_table = self.create_table(['日期', '销售额', '7日移动平均'])
+            self.tabs.addTab(self.trend_table, '销售趋势')
+            
+            # 关联商品计算量较大，切换到该页时才计算
+            self.basket_table = self.create_table(['购买了', '也会购买', '支持度', '置信度', '提升度'])
+            self.basket_outdated = True
+            self.tabs.addTab(self.basket_table, '关联商品')
+            self.tabs.currentChanged.connect(self.on_tab_changed)
         
         # 关闭按钮
         close_btn = QPushButton('关闭')
         close_btn.clicked.connect(self.close)
         layout.addWidget(close_btn)
+        
+        self.update_statistics()
+
+    def create_table(self, headers):
+        table = QTableWidget()
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        return table
+
+    def fill_table(self, table, rows):
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+
+    def selected_range(self):
+        """当前时间范围，与get_sales_statistics一致，返回(开始日期, 结束日期(不含), 天数)"""
+        days = self.RANGES[self.range_combo.currentIndex()][1]
+        today = datetime.now().date()
+        end_date = (today + timedelta(days=1)).isoformat()
+        if days is None:
+            return None, end_date, None
+        return (today - timedelta(days=days)).isoformat(), end_date, days
+
+    def update_statistics(self):
+        start_date, end_date, days = self.selected_range()
+        try:
+            stats = self.db.get_sales_statistics(days if days is not None else 36500)
+        except Exception as e:
+            QMessageBox.warning(self, '错误', f'获取销售统计失败: {str(e)}')
+            return
+        self.summary_label.setText(
+            f"销售总额: ¥{stats['total_sales']}    订单数: {stats['total_orders']}")
+        self.fill_table(self.popular_table, [(model, quantity, f'¥{amount}')
+                                             for model, quantity, amount in stats['popular_products']])
+        self.fill_table(self.payment_table, [(method, count, f'¥{amount}')
+                                             for method, count, amount in stats['payment_methods']])
+        
+        if self.analytics is None:
+            return
+        try:
+            # 只读入上次打开之后新增的订单明细
+            added = self.analytics.refresh()
+        except Exception as e:
+            QMessageBox.warning(self, '错误', f'加载订单明细失败: {str(e)}')
+            return
+        self.status_label.setText(f'明细 {len(self.analytics)} 行，本次加载 {added} 行，'
+                                  f'用时 {self.analytics.load_seconds:.2f} 秒')
+        self.update_heatmap(start_date, end_date)
+        self.update_abc(start_date, end_date)
+        self.update_margins(start_date, end_date)
+        
+        if start_date is None and len(self.analytics):
+            start_date = str(self.analytics.day.min().astype('datetime64[D]'))
+        trend = self.analytics.daily_sales(start_date, end_date) if start_date else []
+        self.fill_table(self.trend_table, [(date, f'¥{amount}', f'¥{average}')
+                                           for date, amount, average in reversed(trend)])
+        
+        self.basket_outdated = True
+        if self.tabs.currentWidget() is self.basket_table:
+            self.update_basket()
+
+    def on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.basket_table and self.basket_outdated:
+            self.update_basket()
+
+    def update_basket(self):
+        from basket import BasketAnalysis
+        start_date, end_date, _ = self.selected_range()
+        basket = BasketAnalysis.from_analytics(self.analytics, start_date, end_date)
+        rules = basket.rules()[:200]
+        models = self.analytics.product_models({product_id for antecedent, consequent, *_ in rules
+                                                for product_id in antecedent + (consequent,)})
+        self.fill_table(self.basket_table, [
+            (' + '.join(models[product_id] for product_id in antecedent), models[consequent],
+             f'{support:.1%}', f'{confidence:.1%}', f'{lift:.2f}')
+            for antecedent, consequent, support, confidence, lift in rules])
+        self.basket_outdated = False
+
+    def update_heatmap(self, start_date, end_date):
+        grid = self.analytics.heatmap(start_date, end_date)
+        peak = grid.max()
+        for weekday in range(7):
+            for hour in range(24):
+                cents = int(grid[weekday, hour])
+                item = QTableWidgetItem(str(Money(cents)) if cents else '')
+                if peak > 0:
+                    # 销售额越高颜色越深
+                    level = int(255 - 200 * cents / peak)
+                    item.setBackground(QColor(255, level, level))
+                self.heatmap_table.setItem(weekday, hour, item)
+
+    def update_abc(self, start_date, end_date):
+        rows = self.analytics.abc_classification(start_date, end_date)
+        models = self.analytics.product_models([row[0] for row in rows])
+        self.fill_table(self.abc_table, [
+            (models[product_id], f'¥{amount}', f'{share:.1%}', f'{cumulative:.1%}', category)
+            for product_id, amount, share, cumulative, category in rows])
+
+    def update_margins(self, start_date, end_date):
+        result = self.analytics.margins(start_date, end_date)
+        text = (f"销售额: ¥{result['total_sales']}    成本: ¥{result['total_cost']}    "
+                f"毛利: ¥{result['total_margin']}    毛利率: {result['margin_rate']:.1%}")
+        if result['unknown_cost_sales'].cents:
+            text += f"\n未设置进价的商品销售额 ¥{result['unknown_cost_sales']} 未计入毛利"
+        self.margin_label.setText(text)
+        models = self.analytics.product_models([row[0] for row in result['products']])
+        self.fill_table(self.margin_table, [
+            (models[product_id], quantity, f'¥{amount}', f'¥{cost}', f'¥{margin}', f'{rate:.1%}')
+            for product_id, quantity, amount, cost, margin, rate in result['products']])
 
 class CategoryDialog(QDialog):
     def __init__(self, db, parent=None):
@@ -415,17 +728,20 @@ class MemberDialog(QDialog):
         self.name_input.setPlaceholderText('会员姓名')
         self.phone_input = QLineEdit()
         self.phone_input.setPlaceholderText('手机号码')
+        self.card_input = QLineEdit()
+        self.card_input.setPlaceholderText('会员卡号（可选）')
         add_btn = QPushButton('添加')
         add_btn.clicked.connect(self.add_member)
         add_layout.addWidget(self.name_input)
         add_layout.addWidget(self.phone_input)
+        add_layout.addWidget(self.card_input)
         add_layout.addWidget(add_btn)
         layout.addLayout(add_layout)
         
         # 会员查询
         search_layout = QHBoxLayout()
         self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText('输入手机号码查询')
+        self.search_input.setPlaceholderText('输入手机号码或会员卡号查询')
         search_btn = QPushButton('查询')
         search_btn.clicked.connect(self.search_member)
         search_layout.addWidget(self.search_input)
@@ -441,22 +757,24 @@ class MemberDialog(QDialog):
         phone = self.phone_input.text().strip()
         if name and phone:
             try:
-                self.db.add_member(name, phone)
+                self.db.add_member(name, phone, self.card_input.text().strip() or None)
                 self.name_input.clear()
                 self.phone_input.clear()
+                self.card_input.clear()
                 QMessageBox.information(self, '成功', '会员添加成功！')
             except Exception as e:
                 QMessageBox.warning(self, '错误', f'添加会员失败: {str(e)}')
                 
     def search_member(self):
-        phone = self.search_input.text().strip()
-        if phone:
-            member = self.db.get_member_by_phone(phone)
+        code = self.search_input.text().strip()
+        if code:
+            member = self.db.find_member(code)
             if member:
                 info = f'''
                 会员信息：
                 姓名：{member[1]}
                 手机：{member[2]}
+                卡号：{member[6] or '无'}
                 积分：{member[3]}
                 等级：{member[4]}
                 注册时间：{member[5]}
@@ -501,18 +819,49 @@ class ImportExportDialog(QDialog):
             self, '选择文件', '', 'CSV文件 (*.csv)')
         if filename:
             try:
-                self.db.import_products_from_csv(filename)
-                QMessageBox.information(self, '成功', '商品导入成功！')
+                report = self.db.import_products_from_csv(filename)
+                message = f"商品导入完成！\n成功: {report['imported']} 条"
+                rejected = report['rejected']
+                if rejected:
+                    message += f"\n失败: {len(rejected)} 条"
+                    for line_no, barcode, reason in rejected[:10]:
+                        message += f"\n第{line_no}行 {barcode}: {reason}"
+                    if len(rejected) > 10:
+                        message += '\n...'
+                    QMessageBox.warning(self, '导入结果', message)
+                else:
+                    QMessageBox.information(self, '成功', message)
             except Exception as e:
                 QMessageBox.warning(self, '错误', f'导入失败: {str(e)}')
     
+    def run_export(self, title, export_func, filename):
+        """显示进度条执行导出，可取消"""
+        progress = QProgressDialog(title, '取消', 0, 100, self)
+        progress.setWindowTitle('导出')
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def on_progress(done, total):
+            progress.setMaximum(max(total, 1))
+            progress.setValue(done)
+            progress.setLabelText(f'{title} {done}/{total}')
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+
+        try:
+            return export_func(filename, progress_callback=on_progress)
+        finally:
+            progress.close()
+
     def export_products(self):
         filename, _ = QFileDialog.getSaveFileName(
             self, '保存文件', '', 'CSV文件 (*.csv)')
         if filename:
             try:
-                self.db.export_products_to_csv(filename)
-                QMessageBox.information(self, '成功', '商品导出成功！')
+                count = self.run_export('正在导出商品...', self.db.export_products_to_csv, filename)
+                QMessageBox.information(self, '成功', f'商品导出成功！共 {count} 条')
+            except ExportCancelled:
+                QMessageBox.information(self, '提示', '已取消导出')
             except Exception as e:
                 QMessageBox.warning(self, '错误', f'导出失败: {str(e)}')
     
@@ -521,7 +870,108 @@ class ImportExportDialog(QDialog):
             self, '保存文件', '', 'CSV文件 (*.csv)')
         if filename:
             try:
-                self.db.export_orders_to_csv(filename)
-                QMessageBox.information(self, '成功', '订单导出成功！')
+                count = self.run_export('正在导出订单...', self.db.export_orders_to_csv, filename)
+                QMessageBox.information(self, '成功', f'订单导出成功！共 {count} 条')
+            except ExportCancelled:
+                QMessageBox.information(self, '提示', '已取消导出')
             except Exception as e:
-                QMessageBox.warning(self, '错误', f'导出失败: {str(e)}') 
\ No newline at end of file
+                QMessageBox.warning(self, '错误', f'导出失败: {str(e)}')
+
+
+class InstrumentationDialog(QDialog):
+    """性能监控：各数据库方法的耗时分布和慢查询"""
+
+    def __init__(self, instrumentation, parent=None):
+        super().__init__(parent)
+        self.instrumentation = instrumentation
+        self.setWindowTitle('性能监控')
+        self.setGeometry(100, 100, 900, 600)
+        
+        layout = QVBoxLayout(self)
+        
+        # 开关和操作按钮
+        control_layout = QHBoxLayout()
+        self.status_label = QLabel()
+        control_layout.addWidget(self.status_label)
+        control_layout.addStretch()
+        self.toggle_btn = QPushButton()
+        self.toggle_btn.clicked.connect(self.toggle)
+        refresh_btn = QPushButton('刷新')
+        refresh_btn.clicked.connect(self.refresh)
+        reset_btn = QPushButton('清零')
+        reset_btn.clicked.connect(self.reset)
+        dump_btn = QPushButton('导出')
+        dump_btn.clicked.connect(self.dump)
+        for button in (self.toggle_btn, refresh_btn, reset_btn, dump_btn):
+            control_layout.addWidget(button)
+        layout.addLayout(control_layout)
+        
+        tabs = QTabWidget()
+        self.method_table = QTableWidget()
+        headers = ['方法', '调用次数', '失败', '返回行数', '平均(ms)', 'P50(ms)', 'P95(ms)', 'P99(ms)', '最大(ms)']
+        self.method_table.setColumnCount(len(headers))
+        self.method_table.setHorizontalHeaderLabels(headers)
+        self.method_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.method_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        tabs.addTab(self.method_table, '方法耗时')
+        self.slow_text = QTextEdit()
+        self.slow_text.setReadOnly(True)
+        tabs.addTab(self.slow_text, '慢查询')
+        layout.addWidget(tabs)
+        
+        close_btn = QPushButton('关闭')
+        close_btn.clicked.connect(self.close)
+        layout.addWidget(close_btn)
+        
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.instrumentation.snapshot()
+        if snapshot['enabled']:
+            self.status_label.setText(f"监控中，开始于 {snapshot['started']}，"
+                                      f"慢查询阈值 {snapshot['slow_ms']} ms")
+            self.toggle_btn.setText('停止监控')
+        else:
+            self.status_label.setText('未启用监控')
+            self.toggle_btn.setText('开始监控')
+        
+        # 按总耗时从高到低排列，最影响收银的方法在最前
+        methods = sorted(snapshot['methods'].items(),
+                         key=lambda item: item[1]['avg_ms'] * item[1]['calls'], reverse=True)
+        self.method_table.setRowCount(len(methods))
+        for row, (name, stats) in enumerate(methods):
+            values = [name, stats['calls'], stats['errors'], stats['rows'], stats['avg_ms'],
+                      stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']]
+            for column, value in enumerate(values):
+                self.method_table.setItem(row, column, QTableWidgetItem(str(value)))
+        
+        lines = []
+        for entry in reversed(snapshot['slow_statements']):
+            lines.append(f"[{entry['time']}] {entry['ms']} ms  {entry['method'] or '未知方法'}"
+                         f"（{entry['thread']}）")
+            lines.append(entry['sql'])
+            lines.extend(f"    {step}" for step in entry['plan'])
+            lines.append('')
+        self.slow_text.setPlainText('\n'.join(lines) if lines else '没有慢查询')
+
+    def toggle(self):
+        if self.instrumentation.enabled:
+            self.instrumentation.disable()
+        else:
+            self.instrumentation.enable()
+        self.refresh()
+
+    def reset(self):
+        self.instrumentation.reset()
+        self.refresh()
+
+    def dump(self):
+        filename, _ = QFileDialog.getSaveFileName(
+            self, '导出性能数据', f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            'JSON文件 (*.json)')
+        if filename:
+            try:
+                self.instrumentation.dump(filename)
+                QMessageBox.information(self, '成功', f'性能数据已导出到 {filename}')
+            except Exception as e:
+                QMessageBox.warning(self, '错误', f'导出失败: {str(e)}')
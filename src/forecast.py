@@ -0,0 +1,179 @@
+import argparse
+import math
+import sys
+import time
+from datetime import datetime, timedelta
+from statistics import NormalDist
+import numpy as np
+import archive
+
+# 按商品、日期汇总销量；优先用销售汇总表，汇总表为空（如尚未重建）时从订单明细计算
+_ROLLUP_DEMAND_QUERY = '''
+SELECT product_id, sale_date, quantity
+FROM sales_daily_product
+WHERE sale_date >= ? AND sale_date < ?
+'''
+
+_ITEMS_DEMAND_QUERY = '''
+SELECT oi.product_id, date(o.order_time), SUM(oi.quantity)
+FROM {schema}.orders o
+JOIN {schema}.order_items oi ON oi.order_id = o.id
+WHERE o.order_time >= ? AND o.order_time < ?
+GROUP BY oi.product_id, date(o.order_time)
+'''
+
+def load_demand(conn, product_ids, start_date, days):
+    """
+    读取每个商品每天的销量
+    product_ids: 商品ID数组（升序）
+    返回: (商品数×天数的销量矩阵, 数据来源'rollups'或'order_items')
+    """
+    end_date = (datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+    rows = conn.execute(_ROLLUP_DEMAND_QUERY, (start_date, end_date)).fetchall()
+    source = 'rollups'
+    if not rows and not conn.execute('SELECT 1 FROM sales_daily_product LIMIT 1').fetchone():
+        source = 'order_items'
+        partitions = archive.list_partitions(conn, start_date, end_date)
+        for schema in archive.sources(conn, partitions):
+            rows.extend(conn.execute(_ITEMS_DEMAND_QUERY.format(schema=schema),
+                                     (start_date, end_date)).fetchall())
+
+    demand = np.zeros((len(product_ids), days))
+    if rows:
+        product_column, date_column, quantity = zip(*rows)
+        product_column = np.array(product_column, dtype=np.int64)
+        position = np.searchsorted(product_ids, product_column)
+        position = np.minimum(position, max(len(product_ids) - 1, 0))
+        # 已删除的商品不在product_ids中
+        known = (product_ids[position] == product_column) if len(product_ids) else \
+            np.zeros(len(rows), dtype=bool)
+        day = (np.array(date_column, dtype='datetime64[D]')
+               - np.datetime64(start_date, 'D')).astype(np.int64)
+        np.add.at(demand, (position[known], day[known]), np.array(quantity, dtype=float)[known])
+    return demand, source
+
+def forecast_demand(demand, half_life=14, min_days=None):
+    """
+    指数加权的日均需求和需求标准差，整个商品矩阵一次计算
+    - 越近的日子权重越大，权重每half_life天减半
+    - 每个商品只从它在统计期内第一次售出的那天算起，新商品不会被之前没上架的日子拉低
+    - 但至少按最近min_days天（默认等于half_life）计算：否则昨天才第一次卖出一件的商品，
+      日均需求就是那一天的销量且标准差为0，再订货点会被高估
+    返回: (日均需求数组, 日需求标准差数组)，统计期内没有销售的商品均为0
+    """
+    products, days = demand.shape
+    if not days:
+        return np.zeros(products), np.zeros(products)
+    if min_days is None:
+        min_days = half_life
+    weights = 0.5 ** ((days - 1 - np.arange(days)) / half_life)
+    sold = demand > 0
+    first = np.where(sold.any(axis=1), sold.argmax(axis=1), days)
+    first = np.minimum(first, max(days - int(math.ceil(min_days)), 0))
+    weights = weights[None, :] * (np.arange(days)[None, :] >= first[:, None])
+    total = weights.sum(axis=1)
+    safe_total = np.where(total > 0, total, 1)
+    mean = (weights * demand).sum(axis=1) / safe_total
+    variance = (weights * (demand - mean[:, None]) ** 2).sum(axis=1) / safe_total
+    return mean, np.sqrt(variance)
+
+def reorder_plan(mean, std, stock, lead_time=3, review_days=7, service_level=0.95):
+    """
+    计算安全库存、再订货点和建议补货量
+    - 安全库存 = z × 日需求标准差 × √到货天数，z由服务水平(不缺货的概率)决定
+    - 再订货点 = 日均需求 × 到货天数 + 安全库存
+    - 库存不高于再订货点时，补到 日均需求 × (到货天数 + 盘点周期) + 安全库存
+    返回: (安全库存, 再订货点, 建议补货量)，均为整数数组
+    """
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = np.ceil(z * std * math.sqrt(lead_time))
+    reorder_point = np.ceil(mean * lead_time + safety_stock)
+    order_up_to = np.ceil(mean * (lead_time + review_days) + safety_stock)
+    suggested = np.where(stock <= reorder_point, np.maximum(order_up_to - stock, 0), 0)
+    # 没有销售记录的商品不给补货建议
+    suggested = np.where(mean > 0, suggested, 0)
+    return safety_stock.astype(np.int64), reorder_point.astype(np.int64), suggested.astype(np.int64)
+
+def update_reorder_suggestions(db, history_days=56, half_life=14, lead_time=3, review_days=7,
+                               service_level=0.95, apply_thresholds=False):
+    """
+    为全部商品计算补货建议并写入reorder_suggestions表
+    history_days: 使用最近多少天（不含今天）的销售记录
+    apply_thresholds: 同时把有销售记录的商品的补货阈值改为再订货点，库存预警随之更新
+    返回: 本次计算的摘要
+    """
+    start = time.perf_counter()
+    conn = db.pool.reader()
+    products = conn.execute('SELECT id, stock FROM products ORDER BY id').fetchall()
+    product_ids = np.array([row[0] for row in products], dtype=np.int64)
+    stock = np.array([row[1] or 0 for row in products], dtype=np.int64)
+
+    today = datetime.now().date()
+    start_date = (today - timedelta(days=history_days)).strftime('%Y-%m-%d')
+    demand, source = load_demand(conn, product_ids, start_date, history_days)
+    mean, std = forecast_demand(demand, half_life)
+    safety_stock, reorder_point, suggested = reorder_plan(
+        mean, std, stock, lead_time, review_days, service_level)
+
+    computed_time = datetime.now()
+    rows = [(int(product_id), float(m), float(s), int(ss), int(rp), int(q), computed_time)
+            for product_id, m, s, ss, rp, q in zip(product_ids, mean.round(4), std.round(4),
+                                                     safety_stock, reorder_point, suggested)]
+    thresholds = [(int(rp), int(product_id), int(rp))
+                  for product_id, m, rp in zip(product_ids, mean, reorder_point) if m > 0]
+    thresholds_updated = 0
+    with db.pool.writer(immediate=True) as writer:
+        writer.execute('DELETE FROM reorder_suggestions')
+        writer.executemany('''
+        INSERT INTO reorder_suggestions (product_id, forecast_daily, demand_std, safety_stock,
+                                         reorder_point, suggested_quantity, computed_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        if apply_thresholds:
+            before = writer.total_changes
+            writer.executemany('''
+            UPDATE products SET reorder_threshold = ?
+            WHERE id = ? AND reorder_threshold != ?
+            ''', thresholds)
+            thresholds_updated = writer.total_changes - before
+
+    result = {
+        'products': len(rows),
+        'with_history': int((mean > 0).sum()),
+        'to_reorder': int((suggested > 0).sum()),
+        'source': source,
+        'thresholds_updated': thresholds_updated,
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+    print(f"补货建议已更新: {result['products']} 个商品，{result['to_reorder']} 个需要补货，"
+          f"用时 {result['seconds']:.2f} 秒")
+    return result
+
+def main(argv=None):
+    from models import Database
+
+    parser = argparse.ArgumentParser(description='按销售历史预测需求，计算全部商品的再订货点和建议补货量')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--history-days', type=int, default=56, help='使用最近多少天的销售记录')
+    parser.add_argument('--half-life', type=float, default=14, help='需求加权的半衰期（天）')
+    parser.add_argument('--lead-time', type=float, default=3, help='从下单到货的天数')
+    parser.add_argument('--review-days', type=float, default=7, help='两次补货之间的天数')
+    parser.add_argument('--service-level', type=float, default=0.95, help='不缺货的概率')
+    parser.add_argument('--apply-thresholds', action='store_true',
+                        help='把有销售记录的商品的补货阈值改为再订货点')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        db.update_reorder_suggestions(args.history_days, args.half_life, args.lead_time,
+                                      args.review_days, args.service_level, args.apply_thresholds)
+        for product_id, model, stock, forecast, _, reorder_point, quantity, _ in \
+                db.get_reorder_suggestions()[:20]:
+            print(f"{model}: 库存 {stock}，日均需求 {forecast:.1f}，再订货点 {reorder_point}，"
+                  f"建议补货 {quantity}")
+    finally:
+        db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import bisect
+import functools
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# 耗时直方图的桶上界（毫秒），最后一个桶收集更慢的调用
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# 每执行多少条虚拟机指令调用一次进度回调，用于估计语句耗时
+PROGRESS_INTERVAL = 1000
+
+# 不计入统计的Database方法
+_SKIPPED_METHODS = {'close', 'remote'}
+
+# 也要计时的私有方法：OrderWriter和门店服务器的结账路径直接调用_insert_order写入订单
+_EXTRA_METHODS = {'_insert_order'}
+
+class LatencyHistogram:
+    """一个方法的调用次数、耗时分布和返回行数"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms, rows, failed):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, fraction):
+        """按桶估计的分位数（取所在桶的上界），超过最大桶时返回最大耗时"""
+        if not self.calls:
+            return 0.0
+        target = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return min(LATENCY_BUCKETS_MS[index], self.max_ms)
+                break
+        return self.max_ms
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+            'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf'], self.counts))
+        }
+
+class _StatementState:
+    """一个线程上正在执行的语句"""
+    __slots__ = ('sql', 'start', 'last', 'method')
+
+    def __init__(self, sql, now, method):
+        self.sql = sql
+        self.start = now
+        self.last = now
+        self.method = method
+
+class Instrumentation:
+    """
+    Database的性能监控
+    - enable()把db的公开方法替换为计时的包装函数，记录每个方法的耗时直方图和返回行数
+    - 同时在连接池的所有连接上设置SQLite跟踪回调和进度回调：跟踪回调在语句开始时记下SQL和时间，
+      进度回调每PROGRESS_INTERVAL条指令更新一次最后运行时间；同一线程的下一条语句开始或方法返回时
+      结算上一条语句，超过slow_ms的语句连同EXPLAIN QUERY PLAN写入慢查询日志
+    - disable()恢复原来的方法并移除回调，未启用时没有任何额外开销
+    语句耗时由进度回调估计，不包括把结果取回Python的时间，也不包括等待写锁的时间
+    （连接池的写连接锁和BEGIN IMMEDIATE的忙等待都不执行虚拟机指令）；方法耗时是墙钟时间，包括等锁，
+    两者相差较大说明在排队等写锁。连接到门店服务器时只能记录方法耗时
+    """
+
+    def __init__(self, db, slow_ms=100, log_path='slow_queries.log', max_slow_entries=200):
+        self.db = db
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.enabled = False
+        self.started = None
+        self.histograms = {}
+        self.slow_statements = deque(maxlen=max_slow_entries)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._plan_conn = None
+        self._plan_lock = threading.Lock()
+
+    def _method_names(self):
+        from models import Database
+        return [name for name, value in vars(Database).items()
+                if callable(value) and (name in _EXTRA_METHODS or
+                                        not name.startswith('_') and name not in _SKIPPED_METHODS)]
+
+    def enable(self):
+        if self.enabled:
+            return
+        for name in self._method_names():
+            original = getattr(self.db, name, None)
+            if original is not None:
+                setattr(self.db, name, self._wrap(name, original))
+        pool = getattr(self.db, 'pool', None)
+        if pool is not None:
+            pool.set_hooks(self._trace, self._progress, PROGRESS_INTERVAL)
+        self.enabled = True
+        self.started = datetime.now()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for name in self._method_names():
+            # 包装函数保存在实例属性中，删除后恢复为类上的方法
+            self.db.__dict__.pop(name, None)
+        pool = getattr(self.db, 'pool', None)
+        if pool is not None:
+            pool.set_hooks(None, None)
+        self.enabled = False
+        with self._plan_lock:
+            if self._plan_conn is not None:
+                self._plan_conn.close()
+                self._plan_conn = None
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.slow_statements.clear()
+            self.started = datetime.now()
+
+    def _wrap(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            local = self._local
+            outer = getattr(local, 'method', None)
+            local.method = name
+            start = time.perf_counter()
+            failed = True
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self._finish_statement()
+                local.method = outer
+                if isinstance(result, (list, tuple)) and result and isinstance(result[0], tuple):
+                    rows = len(result)
+                else:
+                    rows = 0 if result is None else 1
+                with self._lock:
+                    histogram = self.histograms.get(name)
+                    if histogram is None:
+                        histogram = self.histograms[name] = LatencyHistogram()
+                    histogram.record(elapsed_ms, rows, failed)
+        return wrapper
+
+    def _trace(self, sql):
+        # 触发器中的语句和executemany的每一行会重复报告同一条SQL，视为同一条语句
+        state = getattr(self._local, 'statement', None)
+        if state is not None and state.sql == sql:
+            return
+        self._finish_statement()
+        self._local.statement = _StatementState(sql, time.perf_counter(),
+                                                getattr(self._local, 'method', None))
+
+    def _progress(self):
+        state = getattr(self._local, 'statement', None)
+        if state is not None:
+            state.last = time.perf_counter()
+        return 0
+
+    def _finish_statement(self):
+        # 从语句开始到最后一次进度回调，语句在等锁或忙等待时没有进度回调，不计入耗时
+        state = getattr(self._local, 'statement', None)
+        if state is None:
+            return
+        self._local.statement = None
+        elapsed_ms = (state.last - state.start) * 1000
+        if elapsed_ms >= self.slow_ms:
+            self._log_slow(state, elapsed_ms)
+
+    def _log_slow(self, state, elapsed_ms):
+        entry = {
+            'time': datetime.now().isoformat(sep=' ', timespec='seconds'),
+            'thread': threading.current_thread().name,
+            'method': state.method,
+            'ms': round(elapsed_ms, 1),
+            'sql': ' '.join(state.sql.split()),
+            'plan': self.explain(state.sql)
+        }
+        with self._lock:
+            self.slow_statements.append(entry)
+        print(f"慢查询 {entry['ms']} ms（{entry['method'] or '未知方法'}）: {entry['sql'][:200]}")
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"写入慢查询日志失败: {str(e)}")
+
+    def explain(self, sql):
+        """
+        在单独的只读连接上获取语句的查询计划
+        跟踪回调中不能在原连接上执行SQL；引用临时表或归档分区的语句无法解释，返回错误信息
+        """
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if keyword not in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            return []
+        with self._plan_lock:
+            try:
+                if self._plan_conn is None:
+                    uri = pathlib.Path(self.db.db_path).absolute().as_uri() + '?mode=ro'
+                    self._plan_conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                rows = self._plan_conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+                return [row[-1] for row in rows]
+            except sqlite3.Error as e:
+                return [f'无法获取查询计划: {str(e)}']
+
+    def snapshot(self):
+        """
+        当前的统计数据
+        返回: {'started': str, 'enabled': bool, 'slow_ms': float,
+               'methods': {方法名: LatencyHistogram.summary()}, 'slow_statements': [...]}
+        """
+        with self._lock:
+            return {
+                'started': self.started.isoformat(sep=' ', timespec='seconds') if self.started else None,
+                'enabled': self.enabled,
+                'slow_ms': self.slow_ms,
+                'methods': {name: histogram.summary()
+                            for name, histogram in sorted(self.histograms.items())},
+                'slow_statements': list(self.slow_statements)
+            }
+
+    def dump(self, path):
+        """把统计数据写入JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
@@ -1,3 +1,5 @@
+# 最先导入启动计时，记录各阶段的耗时
+from startup import profiler
 import sys
 import os
 import tempfile
@@ -5,18 +7,23 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QPushButton, QLabel, QLineEdit,
                            QTableWidget, QTableWidgetItem, QMessageBox,
                            QSpinBox, QDialog, QHeaderView, QComboBox,
-                           QTextEdit, QAction)
-from PyQt5.QtCore import Qt, pyqtSlot
-from models import Database
-from scanner import BarcodeScanner
-from printer import ReceiptPrinter
-from dialogs import (AddProductDialog, PaymentDialog, EditProductDialog, 
-                    SalesStatisticsDialog, CategoryDialog, MemberDialog,
-                    ImportExportDialog)
+                           QTextEdit, QAction, QTableView, QAbstractItemView,
+                           QDateEdit, QCheckBox)
+from PyQt5.QtCore import (Qt, pyqtSlot, pyqtSignal, QObject, QAbstractTableModel,
+                          QModelIndex, QDate, QTimer)
+from models import Database, OrderRejectedError, InsufficientStockError
+from money import Money
+from cart import Cart
+from order_journal import OrderJournal
+from store_protocol import DEFAULT_PORT, TOKEN_ENV
 from datetime import datetime
-import psutil
+from collections import OrderedDict
 import time
 
+# 对话框、扫码器、打印机、明细分析（numpy）、订单写入线程、备份和性能监控在窗口显示后或第一次使用时才导入，
+# 见MainWindow中的对应方法；psutil只在检查单实例时导入
+profiler.mark('imports')
+
 class SingleInstanceChecker:
     def __init__(self, lock_file):
         self.lock_file = lock_file
@@ -24,6 +31,7 @@ class SingleInstanceChecker:
 
     def try_lock(self):
         try:
+            import psutil
             # 检查是否有其他Python进程运行main.py
             current_pid = os.getpid()
             for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
@@ -60,6 +68,7 @@ class SingleInstanceChecker:
 
     @staticmethod
     def terminate_existing_instances():
+        import psutil
         current_pid = os.getpid()
         current_process = psutil.Process(current_pid)
         current_cmdline = ' '.join(current_process.cmdline())
@@ -74,12 +83,88 @@ class SingleInstanceChecker:
             except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.TimeoutExpired):
                 continue
 
+class OrderListModel(QAbstractTableModel):
+    """
+    订单历史的表格模型
+    按需分页加载订单：视图滚动到底部时通过fetchMore加载下一页
+    """
+    HEADERS = ['订单号', '交易时间', '订单金额', '支付方式']
+
+    def __init__(self, db, page_size=200, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.page_size = page_size
+        self.filters = {}
+        self.orders = []
+        self.next_cursor = None
+        self.has_more = True
+
+    def set_filters(self, start_date=None, end_date=None, payment_method=None):
+        """设置筛选条件并从第一页重新加载"""
+        self.beginResetModel()
+        self.filters = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'payment_method': payment_method
+        }
+        self.orders = []
+        self.next_cursor = None
+        self.has_more = True
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.orders)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        order = self.orders[index.row()]
+        column = index.column()
+        if column == 0:
+            # 将订单号格式化为5位数
+            return f"{order[0]:05d}"
+        if column == 2:
+            return f"¥{order[2]:.2f}"
+        return order[column]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.has_more:
+            return
+        rows, self.next_cursor = self.db.get_orders_page(
+            self.page_size, self.next_cursor, **self.filters)
+        self.has_more = self.next_cursor is not None
+        if rows:
+            first = len(self.orders)
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self.orders.extend(rows)
+            self.endInsertRows()
+
+    def order_at(self, row):
+        """返回(id, time, total_amount, payment_method)"""
+        return self.orders[row]
+
 class OrderHistoryDialog(QDialog):
+    # 订单详情缓存的最大订单数
+    DETAIL_CACHE_SIZE = 200
+
     def __init__(self, db, parent=None):
         super().__init__(parent)
         self.db = db
-        self.printer = parent.printer if parent else None
+        self.printer = parent.get_printer() if parent else None
         self.parent = parent
+        self.detail_cache = OrderedDict()
         self.init_ui()
         
     def init_ui(self):
@@ -87,11 +172,33 @@ class OrderHistoryDialog(QDialog):
         self.setGeometry(100, 100, 800, 600)
         
         layout = QVBoxLayout(self)
+
+        # 筛选条件
+        filter_layout = QHBoxLayout()
+        self.date_filter_check = QCheckBox('按日期')
+        self.start_date_edit = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.start_date_edit.setCalendarPopup(True)
+        self.end_date_edit = QDateEdit(QDate.currentDate())
+        self.end_date_edit.setCalendarPopup(True)
+        self.payment_combo = QComboBox()
+        self.payment_combo.addItems(['全部支付方式', '现金', '微信支付', '支付宝', '会员卡'])
+        filter_btn = QPushButton('查询')
+        filter_btn.clicked.connect(self.load_orders)
+        filter_layout.addWidget(self.date_filter_check)
+        filter_layout.addWidget(self.start_date_edit)
+        filter_layout.addWidget(QLabel('至'))
+        filter_layout.addWidget(self.end_date_edit)
+        filter_layout.addWidget(self.payment_combo)
+        filter_layout.addWidget(filter_btn)
+        layout.addLayout(filter_layout)
         
         # 订单列表
-        self.order_table = QTableWidget()
-        self.order_table.setColumnCount(4)
-        self.order_table.setHorizontalHeaderLabels(['订单号', '交易时间', '订单金额', '支付方式'])
+        self.order_model = OrderListModel(self.db, parent=self)
+        self.order_table = QTableView()
+        self.order_table.setModel(self.order_model)
+        self.order_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.order_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.order_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.order_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.order_table)
         
@@ -120,29 +227,68 @@ class OrderHistoryDialog(QDialog):
         button_layout.addWidget(close_btn)
         layout.addLayout(button_layout)
         
-        self.load_orders()
-        
         # 选择订单时显示详情
-        self.order_table.itemSelectionChanged.connect(self.show_order_details)
+        self.order_table.selectionModel().selectionChanged.connect(self.show_order_details)
+        # 新数据加载或滚动后预取可见订单的详情
+        self.order_model.rowsInserted.connect(self.prefetch_visible_details)
+        self.order_table.verticalScrollBar().valueChanged.connect(self.prefetch_visible_details)
+
+        self.load_orders()
+
+    def current_filters(self):
+        filters = {}
+        if self.date_filter_check.isChecked():
+            filters['start_date'] = self.start_date_edit.date().toString('yyyy-MM-dd')
+            # 结束日期包含当天
+            filters['end_date'] = self.end_date_edit.date().addDays(1).toString('yyyy-MM-dd')
+        if self.payment_combo.currentIndex() > 0:
+            filters['payment_method'] = self.payment_combo.currentText()
+        return filters
         
     def load_orders(self):
-        orders = self.db.get_all_orders()
-        self.order_table.setRowCount(len(orders))
-        for row, order in enumerate(orders):
-            # 将订单号格式化为5位数
-            self.order_table.setItem(row, 0, QTableWidgetItem(f"{order[0]:05d}"))
-            self.order_table.setItem(row, 1, QTableWidgetItem(order[1]))
-            self.order_table.setItem(row, 2, QTableWidgetItem(f"¥{order[2]:.2f}"))
-            self.order_table.setItem(row, 3, QTableWidgetItem(order[3]))
+        self.detail_table.setRowCount(0)
+        self.order_model.set_filters(**self.current_filters())
+
+    def prefetch_visible_details(self, *args):
+        """批量预取当前可见订单的详情"""
+        viewport = self.order_table.viewport()
+        first = self.order_table.rowAt(0)
+        last = self.order_table.rowAt(viewport.height() - 1)
+        if first < 0:
+            return
+        if last < 0:
+            last = self.order_model.rowCount() - 1
+        missing = [self.order_model.order_at(row)[0] for row in range(first, last + 1)
+                   if self.order_model.order_at(row)[0] not in self.detail_cache]
+        if missing:
+            for order_id, details in self.db.get_order_details_batch(missing).items():
+                self.cache_details(order_id, details)
+
+    def cache_details(self, order_id, details):
+        self.detail_cache[order_id] = details
+        self.detail_cache.move_to_end(order_id)
+        while len(self.detail_cache) > self.DETAIL_CACHE_SIZE:
+            self.detail_cache.popitem(last=False)
+
+    def get_order_details(self, order_id):
+        details = self.detail_cache.get(order_id)
+        if details is None:
+            details = self.db.get_order_details(order_id)
+            self.cache_details(order_id, details)
+        return details
+
+    def selected_order(self):
+        rows = self.order_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.order_model.order_at(rows[0].row())
             
     def show_order_details(self):
-        selected_items = self.order_table.selectedItems()
-        if not selected_items:
+        order = self.selected_order()
+        if order is None:
             return
             
-        # 将显示的5位数订单号转换回整数
-        order_id = int(self.order_table.item(self.order_table.currentRow(), 0).text())
-        details = self.db.get_order_details(order_id)
+        details = self.get_order_details(order[0])
         
         self.detail_table.setRowCount(len(details))
         for row, detail in enumerate(details):
@@ -153,21 +299,19 @@ class OrderHistoryDialog(QDialog):
 
     def print_selected_order(self):
         """打印选中的订单"""
-        selected_items = self.order_table.selectedItems()
-        if not selected_items:
+        order = self.selected_order()
+        if order is None:
             QMessageBox.warning(self, '警告', '请先选择要打印的订单')
             return
             
-        row = self.order_table.currentRow()
-        order_id = int(self.order_table.item(row, 0).text())
         order_data = {
-            'id': f"{order_id:05d}",  # 格式化订单号为5位数
-            'total_amount': float(self.order_table.item(row, 2).text().replace('¥', '')),
-            'payment_method': self.order_table.item(row, 3).text()
+            'id': f"{order[0]:05d}",  # 格式化订单号为5位数
+            'total_amount': order[2],
+            'payment_method': order[3]
         }
         
         # 获取订单详情
-        items = self.db.get_order_details(order_id)
+        items = self.get_order_details(order[0])
         
         if self.printer:
             try:
@@ -182,53 +326,202 @@ class OrderHistoryDialog(QDialog):
             
     def print_all_orders(self):
         """打印所有订单"""
-        if self.order_table.rowCount() == 0:
+        filters = self.current_filters()
+        order_count = self.db.count_orders(**filters)
+        if order_count == 0:
             QMessageBox.warning(self, '警告', '没有可打印的订单')
             return
             
         reply = QMessageBox.question(self, '确认', 
-                                   f'确定要打印全部 {self.order_table.rowCount()} 条订单记录吗？',
+                                   f'确定要打印全部 {order_count} 条订单记录吗？',
                                    QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
+            if not self.printer:
+                QMessageBox.warning(self, '错误', '打印机未初始化')
+                return
+
             success_count = 0
             fail_count = 0
+            cursor = None
             
-            for row in range(self.order_table.rowCount()):
-                order_id = int(self.order_table.item(row, 0).text())
-                order_data = {
-                    'id': f"{order_id:05d}",  # 格式化订单号为5位数
-                    'total_amount': float(self.order_table.item(row, 2).text().replace('¥', '')),
-                    'payment_method': self.order_table.item(row, 3).text()
-                }
-                
-                items = self.db.get_order_details(order_id)
-                
-                if self.printer:
+            while True:
+                orders, cursor = self.db.get_orders_page(200, cursor, **filters)
+                details = self.db.get_order_details_batch([order[0] for order in orders])
+                for order in orders:
+                    order_data = {
+                        'id': f"{order[0]:05d}",  # 格式化订单号为5位数
+                        'total_amount': order[2],
+                        'payment_method': order[3]
+                    }
                     try:
-                        if self.printer.print_receipt(order_data, items):
+                        if self.printer.print_receipt(order_data, details[order[0]]):
                             success_count += 1
                         else:
                             fail_count += 1
                     except:
                         fail_count += 1
-                else:
-                    QMessageBox.warning(self, '错误', '打印机未初始化')
-                    return
+                if cursor is None:
+                    break
             
             QMessageBox.information(self, '完成', 
                                   f'打印完成\n成功: {success_count}\n失败: {fail_count}')
 
+class OrderCommitSignals(QObject):
+    """把订单写入线程的提交结果转发到界面线程"""
+    # (Future, 订单数据)
+    finished = pyqtSignal(object, object)
+
+# 开启性能监控时，退出程序前把统计数据保存到该文件
+INSTRUMENTATION_DUMP_PATH = 'instrumentation.json'
+
+# 设置环境变量SHOP_STARTUP_PROFILE（值为文件路径）时，把启动各阶段的耗时保存到该文件
+STARTUP_PROFILE_ENV = 'SHOP_STARTUP_PROFILE'
+# 测量首次扫码耗时用（见benchmarks/bench_startup.py）：可以扫码后自动扫描该条码，保存启动耗时后退出
+STARTUP_SCAN_ENV = 'SHOP_STARTUP_SCAN'
+
+# 结账时等待订单写入数据库的最长时间（秒），等待期间界面不阻塞；超时后订单号待定，写入后再打印小票
+ORDER_CONFIRM_TIMEOUT = 5
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.db = Database()
-        self.scanner = BarcodeScanner()
-        self.printer = ReceiptPrinter()
-        self.current_order_items = []
+        with profiler.phase('打开数据库'):
+            self.init_database()
+        # 性能监控，设置环境变量SHOP_INSTRUMENT（值为慢查询阈值毫秒数）时启动即开启，否则第一次打开时创建
+        self.instrumentation = None
+        if os.environ.get('SHOP_INSTRUMENT'):
+            self.get_instrumentation().enable()
+        self.order_signals = OrderCommitSignals()
+        self.order_signals.finished.connect(self.on_order_committed)
+        # 正在等待写入结果的结账，见process_payment
+        self.checkout = None
+        # 结账时没有等到写入结果的订单 {订单日志记录ID: (购物车商品, 支付方式)}，写入后打印小票
+        self.pending_receipts = {}
+        # 第一次开始扫码时创建扫码器；打印机在窗口显示后查找，见get_printer
+        self.scanner = None
+        self.printer = None
+        self.cart = Cart()
         
-        self.init_ui()
-        self.check_low_stock()
+        with profiler.phase('创建界面'):
+            self.init_ui()
+            self.init_low_stock_feed()
+        self.deferred_started = False
+
+    def init_database(self):
+        self.order_journal = OrderJournal('orders.journal')
+        server = os.environ.get('SHOP_SERVER')
+        if server:
+            # 客户端模式：连接门店服务器，SHOP_SERVER格式为 主机[:端口]，共享密钥见TOKEN_ENV
+            host, _, port = server.partition(':')
+            self.db = Database.remote(host, int(port or DEFAULT_PORT), os.environ.get(TOKEN_ENV))
+            self.remote = True
+            # 明细分析需要直接读取数据库，客户端只显示汇总统计
+            self.analytics_available = False
+        else:
+            self.db = Database()
+            self.remote = False
+            self.analytics_available = True
+        # 订单写入线程（重放或重新发送订单日志）和备份线程在窗口显示后启动，见DEFERRED_INIT_STEPS
+        self.order_writer = None
+        self.backup_worker = None
+        # 第一次打开销售统计时才创建，见get_analytics
+        self.analytics = None
+
+    # 窗口显示后依次执行的初始化，每个事件循环执行一项，期间可以扫码
+    DEFERRED_INIT_STEPS = [
+        ('启动订单写入线程', 'get_order_writer'),
+        ('启动备份线程', 'start_backup_worker'),
+        ('加载商品列表', 'update_product_table'),
+        ('读取库存预警', 'start_low_stock_feed'),
+        ('查找打印机', 'get_printer'),
+        ('加载对话框', 'preload_dialogs'),
+    ]
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.deferred_started:
+            self.deferred_started = True
+            # 绘制事件先于计时器处理，回调执行时窗口已经完成首次绘制
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        profiler.mark('first_paint')
+        self.barcode_input.setFocus()
+        profiler.mark('ready_for_scan')
+        QTimer.singleShot(0, lambda: self.run_deferred_init(0))
+        barcode = os.environ.get(STARTUP_SCAN_ENV)
+        if barcode:
+            # 与真实扫码一样排在后台初始化的各项之间处理
+            QTimer.singleShot(0, lambda: self.on_barcode_scanned(barcode))
+
+    def run_deferred_init(self, index):
+        if index >= len(self.DEFERRED_INIT_STEPS):
+            profiler.mark('deferred_init_done')
+            if os.environ.get(STARTUP_PROFILE_ENV):
+                print(profiler.summary())
+            self.dump_startup_profile()
+            return
+        name, method = self.DEFERRED_INIT_STEPS[index]
+        with profiler.phase(name):
+            try:
+                getattr(self, method)()
+            except Exception as e:
+                print(f"{name}失败: {str(e)}")
+        QTimer.singleShot(0, lambda: self.run_deferred_init(index + 1))
+
+    def dump_startup_profile(self):
+        path = os.environ.get(STARTUP_PROFILE_ENV)
+        if path:
+            try:
+                profiler.dump(path)
+            except OSError as e:
+                print(f"保存启动耗时失败: {str(e)}")
+
+    def get_order_writer(self):
+        """订单写入器，窗口显示后创建；后台初始化完成前就结账时在此创建"""
+        if self.order_writer is None:
+            if self.remote:
+                from store_client import RemoteOrderWriter
+                self.order_writer = RemoteOrderWriter(self.db, self.order_journal)
+            else:
+                from order_writer import OrderWriter
+                self.order_writer = OrderWriter(self.db, self.order_journal)
+        return self.order_writer
+
+    def start_backup_worker(self):
+        """定时备份线程，连接门店服务器时由服务器负责备份"""
+        if self.backup_worker is None and not self.remote:
+            from backup import BackupWorker
+            self.backup_worker = BackupWorker(self.db.db_path)
+            self.backup_worker.start()
+        return self.backup_worker
+
+    def get_instrumentation(self):
+        """性能监控，第一次使用时创建"""
+        if self.instrumentation is None:
+            from instrumentation import Instrumentation
+            slow_ms = os.environ.get('SHOP_INSTRUMENT')
+            self.instrumentation = Instrumentation(self.db, slow_ms=float(slow_ms or 100))
+        return self.instrumentation
+
+    def get_printer(self):
+        """小票打印机，第一次使用时创建（查找默认打印机，加载pywin32）"""
+        if self.printer is None:
+            from printer import ReceiptPrinter
+            self.printer = ReceiptPrinter()
+        return self.printer
+
+    def preload_dialogs(self):
+        """提前导入对话框模块，第一次结账时不用等待"""
+        import dialogs
+
+    def get_analytics(self):
+        """销售明细分析，第一次使用时创建（导入numpy）；连接门店服务器时返回None"""
+        if self.analytics is None and self.analytics_available:
+            from analytics import SalesAnalytics
+            self.analytics = SalesAnalytics(self.db)
+        return self.analytics
         
     def init_ui(self):
         self.setWindowTitle('商店管理系统')
@@ -250,6 +543,26 @@ class MainWindow(QMainWindow):
         test_print_action.triggered.connect(self.test_print_sample)
         menu.addAction(test_print_action)
         
+        # 数据备份
+        backup_action = QAction('立即备份', self)
+        backup_action.triggered.connect(self.request_backup)
+        menu.addAction(backup_action)
+        
+        # 库存预警
+        low_stock_action = QAction('库存预警', self)
+        low_stock_action.triggered.connect(self.check_low_stock)
+        menu.addAction(low_stock_action)
+        
+        # 补货建议
+        reorder_action = QAction('补货建议', self)
+        reorder_action.triggered.connect(self.show_reorder_suggestions)
+        menu.addAction(reorder_action)
+        
+        # 性能监控
+        instrumentation_action = QAction('性能监控', self)
+        instrumentation_action.triggered.connect(self.show_instrumentation)
+        menu.addAction(instrumentation_action)
+        
         # 退出
         exit_action = QAction('退出', self)
         exit_action.triggered.connect(self.close)
@@ -329,15 +642,17 @@ class MainWindow(QMainWindow):
         right_layout.addWidget(total_widget)
         
         # 支付按钮
-        pay_btn = QPushButton('支付')
-        pay_btn.clicked.connect(self.process_payment)
-        right_layout.addWidget(pay_btn)
+        self.pay_btn = QPushButton('支付')
+        self.pay_btn.clicked.connect(self.process_payment)
+        right_layout.addWidget(self.pay_btn)
         
         layout.addWidget(right_panel)
-        
-        self.update_product_table()
+        # 商品列表在窗口显示后加载，见DEFERRED_INIT_STEPS
 
     def toggle_scanner(self):
+        if self.scanner is None:
+            from scanner import BarcodeScanner
+            self.scanner = BarcodeScanner()
         if not self.scanner.is_running:
             if self.scanner.start(callback=self.on_barcode_scanned):
                 self.sender().setText('停止扫码')
@@ -357,10 +672,9 @@ class MainWindow(QMainWindow):
         dialog.exec_()
 
     def update_order_table(self):
-        self.order_table.setRowCount(len(self.current_order_items))
-        total = 0
+        self.order_table.setRowCount(len(self.cart))
         
-        for row, item in enumerate(self.current_order_items):
+        for row, item in enumerate(self.cart):
             self.order_table.setItem(row, 0, QTableWidgetItem(item['model']))
             self.order_table.setItem(row, 1, QTableWidgetItem(f"¥{item['price']:.2f}"))
             
@@ -372,29 +686,26 @@ class MainWindow(QMainWindow):
             quantity_spin.valueChanged.connect(lambda value, row=row: self.update_item_quantity(row, value))
             self.order_table.setCellWidget(row, 2, quantity_spin)
             
-            subtotal = item['price'] * item['quantity']
+            subtotal = self.cart.subtotal(item)
             self.order_table.setItem(row, 3, QTableWidgetItem(f"¥{subtotal:.2f}"))
             
             # 删除按钮
             delete_btn = QPushButton('删除')
             delete_btn.clicked.connect(lambda checked, row=row: self.delete_order_item(row))
             self.order_table.setCellWidget(row, 4, delete_btn)
-            
-            total += subtotal
         
-        self.total_label.setText(f'总计: ¥{total:.2f}')
+        self.total_label.setText(f'总计: ¥{self.cart.total():.2f}')
 
     def update_item_quantity(self, row, value):
-        if 0 <= row < len(self.current_order_items):
-            self.current_order_items[row]['quantity'] = value
-            self.update_order_table()
+        self.cart.set_quantity(row, value)
+        self.update_order_table()
 
     def delete_order_item(self, row):
-        if 0 <= row < len(self.current_order_items):
-            self.current_order_items.pop(row)
-            self.update_order_table()
+        self.cart.remove(row)
+        self.update_order_table()
 
     def show_add_product_dialog(self):
+        from dialogs import AddProductDialog
         dialog = AddProductDialog(self)
         if dialog.exec() == AddProductDialog.DialogCode.Accepted:
             product_data = dialog.get_product_data()
@@ -404,7 +715,9 @@ class MainWindow(QMainWindow):
                         product_data['barcode'],
                         product_data['model'],
                         product_data['price'],
-                        product_data['stock']
+                        product_data['stock'],
+                        product_data['reorder_threshold'],
+                        product_data['cost']
                     )
                     self.update_product_table()
                 except Exception as e:
@@ -415,33 +728,28 @@ class MainWindow(QMainWindow):
         self.add_item_to_order(barcode)
 
     def add_item_to_order(self, barcode):
+        if self.checkout is not None:
+            self.statusBar().showMessage('正在确认订单，请稍后再扫码', 3000)
+            return
         product = self.db.get_product_by_barcode(barcode)
+        if 'first_scan' not in profiler.marks:
+            first_scan_ms = profiler.mark('first_scan')
+            if os.environ.get(STARTUP_PROFILE_ENV):
+                print(f"首次扫码: 启动后 {first_scan_ms} ms")
+            self.dump_startup_profile()
+            if os.environ.get(STARTUP_SCAN_ENV):
+                QTimer.singleShot(0, self.close)
         if not product:
             QMessageBox.warning(self, '错误', '商品不存在')
             return
 
-        # 检查是否已经在订单中
-        for item in self.current_order_items:
-            if item['product_id'] == product[0]:
-                item['quantity'] += 1
-                self.update_order_table()
-                return
-
-        # 添加到订单列表
-        item = {
-            'product_id': product[0],
-            'model': product[2],
-            'price': product[3],
-            'quantity': 1
-        }
-        self.current_order_items.append(item)
+        # 已经在订单中的商品累加数量
+        self.cart.add_product(product)
         self.update_order_table()
 
     def update_product_table(self, products=None):
         if products is None:
-            cursor = self.db.conn.cursor()
-            cursor.execute('SELECT * FROM products')
-            products = cursor.fetchall()
+            products = self.db.get_all_products()
         
         self.product_table.setRowCount(len(products))
         for row, product in enumerate(products):
@@ -460,16 +768,30 @@ class MainWindow(QMainWindow):
             self.product_table.setCellWidget(row, 4, edit_btn)
 
     def process_payment(self):
-        if not self.current_order_items:
+        if self.checkout is not None:
+            QMessageBox.information(self, '提示', '上一单正在确认，请稍候')
+            return
+        if not self.cart:
             QMessageBox.warning(self, '错误', '订单为空')
             return
 
-        total = sum(item['price'] * item['quantity'] for item in self.current_order_items)
-        dialog = PaymentDialog(total, self)
+        # 收款前先检查库存，库存不足时不收款
+        try:
+            shortages = self.db.check_stock(self.cart.items)
+        except (ConnectionError, TimeoutError):
+            # 连不上门店服务器时订单先记入本机日志，由服务器恢复后确认
+            shortages = []
+        if shortages:
+            QMessageBox.warning(self, '错误', str(InsufficientStockError(shortages)))
+            return
+
+        total = self.cart.total()
+        from dialogs import PaymentDialog
+        dialog = PaymentDialog(total, self, db=self.db)
         
         if dialog.exec() == PaymentDialog.DialogCode.Accepted:
             # 停止扫码器
-            if self.scanner.is_running:
+            if self.scanner and self.scanner.is_running:
                 self.scanner.stop()
                 # 恢复扫码按钮状态
                 for child in self.findChildren(QPushButton):
@@ -477,36 +799,201 @@ class MainWindow(QMainWindow):
                         child.setText('开始扫码')
                         break
             
-            # 创建订单
-            order_id = self.db.create_order(self.current_order_items, dialog.payment_method)
-            
-            # 打印小票
-            if not self.printer:
-                try:
-                    self.printer = ReceiptPrinter()
-                except Exception as e:
-                    QMessageBox.warning(self, '警告', f'打印机初始化失败: {str(e)}')
-            
-            if self.printer:
-                order_data = {
-                    'id': f"{order_id:05d}",  # 格式化订单号为5位数
-                    'total_amount': total,
-                    'payment_method': dialog.payment_method
-                }
-                try:
-                    self.printer.print_receipt(order_data, self.current_order_items)
-                except Exception as e:
-                    QMessageBox.warning(self, '警告', f'打印失败: {str(e)}')
-            
-            # 清空当前订单
-            self.current_order_items = []
-            self.update_order_table()
+            # 订单追加到本地订单日志后由后台写入线程写入数据库
+            member_id = dialog.member[0] if dialog.member else None
+            record = OrderJournal.new_record(self.cart.items, dialog.payment_method,
+                                             member_id)
+            try:
+                future = self.get_order_writer().submit_record(record)
+            except Exception as e:
+                QMessageBox.warning(self, '错误', f'创建订单失败: {str(e)}')
+                return
+            # 不阻塞界面等待写入结果：写入后由on_order_committed打印小票，
+            # ORDER_CONFIRM_TIMEOUT内没有结果时由on_checkout_timeout改为订单号待定
+            self.checkout = {'record': record, 'items': self.cart.items,
+                             'payment_method': dialog.payment_method}
+            self.set_checkout_busy(True)
+            QTimer.singleShot(int(ORDER_CONFIRM_TIMEOUT * 1000),
+                              lambda: self.on_checkout_timeout(record['id']))
+            future.add_done_callback(lambda f: self.order_signals.finished.emit(f, record))
+
+    def set_checkout_busy(self, busy):
+        """等待订单写入期间不能修改购物车和再次结账"""
+        self.pay_btn.setEnabled(not busy)
+        self.order_table.setEnabled(not busy)
+        if busy:
+            QApplication.setOverrideCursor(Qt.BusyCursor)
+            self.statusBar().showMessage('正在确认订单...')
+        else:
+            QApplication.restoreOverrideCursor()
+            self.statusBar().clearMessage()
+
+    def finish_checkout(self):
+        """结束正在确认的结账，返回其信息"""
+        checkout, self.checkout = self.checkout, None
+        self.set_checkout_busy(False)
+        return checkout
+
+    def on_checkout_timeout(self, record_id):
+        if self.checkout is None or self.checkout['record']['id'] != record_id:
+            return
+        # 数据库繁忙或门店服务器响应慢：订单已在日志中，写入后再打印小票
+        checkout = self.finish_checkout()
+        self.pending_receipts[record_id] = (checkout['items'], checkout['payment_method'])
+        self.cart.clear()
+        self.update_order_table()
+        QMessageBox.information(self, '提示',
+                                '订单已保存，正在等待写入数据库，订单号待定\n'
+                                '写入后自动打印小票')
+
+    def is_order_rejected(self, error):
+        """写入失败的订单是否已转存到.rejected文件；否则仍在订单日志中，下次启动时重新写入"""
+        # 本机写入器把除数据库繁忙外的错误都当作拒绝；门店服务器只拒绝业务错误，其余留待重发
+        return isinstance(error, OrderRejectedError) or not self.remote
+
+    def print_order_receipt(self, order_id, items, payment_method):
+        """打印已写入数据库的订单，小票号与订单历史中的订单号相同"""
+        if not self.printer:
+            try:
+                self.get_printer()
+            except Exception as e:
+                QMessageBox.warning(self, '警告', f'打印机初始化失败: {str(e)}')
+        
+        if self.printer:
+            order_data = {
+                'id': f"{order_id:05d}",
+                'total_amount': sum((Cart.subtotal(item) for item in items), Money()),
+                'payment_method': payment_method
+            }
+            try:
+                self.printer.print_receipt(order_data, items)
+            except Exception as e:
+                QMessageBox.warning(self, '警告', f'打印失败: {str(e)}')
+
+    @pyqtSlot(object, object)
+    def on_order_committed(self, future, record):
+        """订单写入数据库（或失败）后打印小票、提示收银员并刷新库存"""
+        if self.checkout is not None and self.checkout['record']['id'] == record['id']:
+            self.on_checkout_committed(future, self.finish_checkout())
             self.update_product_table()
-            QMessageBox.information(self, '成功', '交易完成！')
+            return
+
+        # 结账时没有等到写入结果的订单
+        items, payment_method = self.pending_receipts.pop(record['id'], ([], record['payment_method']))
+        try:
+            order_id = future.result()
+        except Exception as e:
+            if self.is_order_rejected(e):
+                QMessageBox.warning(self, '错误',
+                                    f'订单 {record["id"][:8].upper()} 写入数据库失败: {str(e)}\n'
+                                    f'订单已保存在 {self.order_journal.rejected_path}，请人工核对')
+            else:
+                QMessageBox.warning(self, '错误',
+                                    f'订单 {record["id"][:8].upper()} 未能写入门店服务器: {str(e)}\n'
+                                    f'订单已保存在本机订单日志，下次启动时重新发送')
+        else:
+            self.print_order_receipt(order_id, items, payment_method)
+            self.statusBar().showMessage(f'订单已写入数据库，订单号 {order_id:05d}', 10000)
+        self.update_product_table()
+
+    def on_checkout_committed(self, future, checkout):
+        """在ORDER_CONFIRM_TIMEOUT内得到了写入结果的结账"""
+        try:
+            order_id = future.result()
+        except Exception as e:
+            if isinstance(e, OrderRejectedError):
+                # 库存不足、会员不存在等，保留购物车以便修改后重新结账；没有收款，不需要人工核对
+                self.order_journal.abandon(checkout['record'])
+                QMessageBox.warning(self, '错误', f'创建订单失败，请勿收款: {str(e)}')
+                return
+            self.cart.clear()
+            self.update_order_table()
+            if self.is_order_rejected(e):
+                QMessageBox.warning(self, '错误',
+                                    f'订单写入数据库失败: {str(e)}\n'
+                                    f'订单已保存在 {self.order_journal.rejected_path}，请人工核对')
+            else:
+                QMessageBox.information(self, '提示',
+                                        f'订单暂时未能写入门店服务器: {str(e)}\n'
+                                        f'订单已保存在本机订单日志，下次启动时重新发送，订单号待定')
+            return
+
+        self.print_order_receipt(order_id, checkout['items'], checkout['payment_method'])
+        # 清空当前订单
+        self.cart.clear()
+        self.update_order_table()
+        QMessageBox.information(self, '成功', f'交易完成！订单号 {order_id:05d}')
+
+    def closeEvent(self, event):
+        """关闭窗口前写完排队中的订单"""
+        self.low_stock_timer.stop()
+        if self.backup_worker:
+            self.backup_worker.stop()
+        if self.instrumentation and self.instrumentation.enabled:
+            try:
+                self.instrumentation.dump(INSTRUMENTATION_DUMP_PATH)
+            except OSError as e:
+                print(f"保存性能数据失败: {str(e)}")
+            self.instrumentation.disable()
+        if self.order_writer:
+            self.order_writer.close()
+        self.order_journal.close()
+        self.db.close()
+        if self.scanner and self.scanner.is_running:
+            self.scanner.stop()
+        super().closeEvent(event)
+
+    def show_instrumentation(self):
+        from dialogs import InstrumentationDialog
+        dialog = InstrumentationDialog(self.get_instrumentation(), self)
+        dialog.exec_()
+
+    def request_backup(self):
+        """在后台线程中立即备份数据库，不影响收银"""
+        if self.remote:
+            QMessageBox.information(self, '提示', '当前连接门店服务器，数据由服务器备份')
+            return
+        self.start_backup_worker().request_backup()
+        self.statusBar().showMessage('正在后台备份数据库...', 5000)
+
+    # 轮询库存预警事件的间隔（毫秒）
+    LOW_STOCK_POLL_INTERVAL = 5000
+
+    def init_low_stock_feed(self):
+        """
+        在状态栏显示库存预警，不再在启动时弹窗
+        预警清单由数据库触发器维护，这里只定时读取新增的预警事件
+        窗口显示后才读取预警清单并开始轮询，见start_low_stock_feed
+        """
+        self.low_stock_label = QLabel()
+        self.statusBar().addPermanentWidget(self.low_stock_label)
+        self.low_stock_timer = QTimer(self)
+        self.low_stock_timer.timeout.connect(self.poll_low_stock_events)
+
+    def start_low_stock_feed(self):
+        self.last_low_stock_event_id = self.db.get_last_low_stock_event_id()
+        self.update_low_stock_label()
+        self.low_stock_timer.start(self.LOW_STOCK_POLL_INTERVAL)
+
+    def update_low_stock_label(self):
+        count = len(self.db.get_low_stock_products())
+        self.low_stock_label.setText(f'库存预警: {count} 种商品' if count else '')
+
+    def poll_low_stock_events(self):
+        events = self.db.get_low_stock_events(self.last_low_stock_event_id)
+        if not events:
+            return
+        self.last_low_stock_event_id = events[-1][0]
+        low = [event for event in events if event[3] == 'low']
+        if low:
+            messages = [f"{model}（库存：{stock}，阈值：{threshold}）"
+                        for _, _, model, _, stock, threshold, _ in low[-3:]]
+            self.statusBar().showMessage('库存不足: ' + '；'.join(messages), 30000)
+        self.update_low_stock_label()
 
     def check_low_stock(self):
         """
-        检查库存预警
+        查看库存预警清单
         """
         low_stock_products = self.db.get_low_stock_products()
         if low_stock_products:
@@ -514,6 +1001,29 @@ class MainWindow(QMainWindow):
             for product in low_stock_products:
                 message += f"- {product[2]}（库存：{product[4]}）\n"
             QMessageBox.warning(self, '库存预警', message)
+        else:
+            QMessageBox.information(self, '库存预警', '没有库存不足的商品')
+
+    def show_reorder_suggestions(self):
+        """
+        按最近的销售重新计算补货建议并显示需要补货的商品
+        """
+        try:
+            result = self.db.update_reorder_suggestions()
+            suggestions = self.db.get_reorder_suggestions()
+        except Exception as e:
+            QMessageBox.warning(self, '错误', f'计算补货建议失败: {str(e)}')
+            return
+        if not suggestions:
+            QMessageBox.information(self, '补货建议', '暂时没有需要补货的商品')
+            return
+        message = f"共 {result['to_reorder']} 个商品建议补货：\n"
+        for _, model, stock, forecast, _, reorder_point, quantity, _ in suggestions[:30]:
+            message += (f"- {model}（库存：{stock}，日均销量：{forecast:.1f}，"
+                        f"再订货点：{reorder_point}）补货 {quantity}\n")
+        if len(suggestions) > 30:
+            message += f"……其余 {len(suggestions) - 30} 个商品略"
+        QMessageBox.information(self, '补货建议', message)
 
     def search_products(self):
         """
@@ -530,7 +1040,8 @@ class MainWindow(QMainWindow):
         """
         显示销售统计
         """
-        dialog = SalesStatisticsDialog(self.db, self)
+        from dialogs import SalesStatisticsDialog
+        dialog = SalesStatisticsDialog(self.db, self.get_analytics(), self)
         dialog.exec_()
 
     def on_product_double_clicked(self, item):
@@ -542,10 +1053,13 @@ class MainWindow(QMainWindow):
             int(self.product_table.item(row, 0).data(Qt.UserRole)),  # id
             self.product_table.item(row, 0).text(),  # barcode
             self.product_table.item(row, 1).text(),  # model
-            float(self.product_table.item(row, 2).text().replace('¥', '')),  # price
-            int(self.product_table.item(row, 3).text())  # stock
+            Money.parse(self.product_table.item(row, 2).text()),  # price
+            int(self.product_table.item(row, 3).text()),  # stock
+            self.db.get_reorder_threshold(int(self.product_table.item(row, 0).data(Qt.UserRole))),
+            self.db.get_product_cost(int(self.product_table.item(row, 0).data(Qt.UserRole)))
         ]
         
+        from dialogs import EditProductDialog
         dialog = EditProductDialog(product_data, self)
         if dialog.exec() == EditProductDialog.DialogCode.Accepted:
             product_data = dialog.get_product_data()
@@ -556,22 +1070,30 @@ class MainWindow(QMainWindow):
                         barcode=product_data['barcode'],
                         model=product_data['model'],
                         price=product_data['price'],
-                        stock=product_data['stock']
+                        stock=product_data['stock'],
+                        reorder_threshold=product_data['reorder_threshold'],
+                        cost=product_data['cost']
                     )
                     self.update_product_table()
                 except Exception as e:
                     QMessageBox.warning(self, '错误', f'更新商品失败: {str(e)}')
 
     def show_category_dialog(self):
+        from dialogs import CategoryDialog
         dialog = CategoryDialog(self.db, self)
         dialog.exec_()
         self.update_product_table()  # 刷新商品列表
 
     def show_member_dialog(self):
+        from dialogs import MemberDialog
         dialog = MemberDialog(self.db, self)
         dialog.exec_()
 
     def show_import_export_dialog(self):
+        if self.remote:
+            QMessageBox.information(self, '提示', 'CSV导入导出需要读写数据库所在电脑上的文件，请在门店服务器上操作')
+            return
+        from dialogs import ImportExportDialog
         dialog = ImportExportDialog(self.db, self)
         dialog.exec_()
         self.update_product_table()  # 刷新商品列表
@@ -582,7 +1104,7 @@ class MainWindow(QMainWindow):
             # 创建测试订单数据
             order_data = {
                 'id': '00001',  # 使用5位数的订单号
-                'total_amount': 299.99,
+                'total_amount': Money.parse('299.99'),
                 'payment_method': '现金'
             }
             
@@ -591,17 +1113,17 @@ class MainWindow(QMainWindow):
                 {
                     'model': '测试商品1',
                     'quantity': 2,
-                    'price': 99.99
+                    'price': Money.parse('99.99')
                 },
                 {
                     'model': '测试商品2',
                     'quantity': 1,
-                    'price': 100.01
+                    'price': Money.parse('100.01')
                 }
             ]
             
             # 先显示预览
-            preview_text = self.printer.print_receipt(order_data, items, preview=True)
+            preview_text = self.get_printer().print_receipt(order_data, items, preview=True)
             
             # 创建预览对话框
             preview_dialog = QDialog(self)
@@ -639,7 +1161,7 @@ class MainWindow(QMainWindow):
     def do_print_sample(self, order_data, items, dialog):
         """执行实际打印"""
         try:
-            if self.printer.print_receipt(order_data, items):
+            if self.get_printer().print_receipt(order_data, items):
                 QMessageBox.information(self, '成功', '打印已发送')
                 dialog.accept()
             else:
@@ -662,7 +1184,7 @@ class MainWindow(QMainWindow):
         shop_name_layout = QHBoxLayout()
         shop_name_label = QLabel('店铺名称:')
         self.shop_name_input = QLineEdit()
-        self.shop_name_input.setText(self.printer.config['shop_name'])
+        self.shop_name_input.setText(self.get_printer().config['shop_name'])
         shop_name_layout.addWidget(shop_name_label)
         shop_name_layout.addWidget(self.shop_name_input)
         form_layout.addLayout(shop_name_layout)
@@ -671,7 +1193,7 @@ class MainWindow(QMainWindow):
         shop_address_layout = QHBoxLayout()
         shop_address_label = QLabel('店铺地址:')
         self.shop_address_input = QLineEdit()
-        self.shop_address_input.setText(self.printer.config['shop_address'])
+        self.shop_address_input.setText(self.get_printer().config['shop_address'])
         shop_address_layout.addWidget(shop_address_label)
         shop_address_layout.addWidget(self.shop_address_input)
         form_layout.addLayout(shop_address_layout)
@@ -680,7 +1202,7 @@ class MainWindow(QMainWindow):
         shop_phone_layout = QHBoxLayout()
         shop_phone_label = QLabel('联系电话:')
         self.shop_phone_input = QLineEdit()
-        self.shop_phone_input.setText(self.printer.config['shop_phone'])
+        self.shop_phone_input.setText(self.get_printer().config['shop_phone'])
         shop_phone_layout.addWidget(shop_phone_label)
         shop_phone_layout.addWidget(self.shop_phone_input)
         form_layout.addLayout(shop_phone_layout)
@@ -689,7 +1211,7 @@ class MainWindow(QMainWindow):
         footer_layout = QHBoxLayout()
         footer_label = QLabel('页脚文本:')
         self.footer_input = QLineEdit()
-        self.footer_input.setText(self.printer.config['footer_text'])
+        self.footer_input.setText(self.get_printer().config['footer_text'])
         footer_layout.addWidget(footer_label)
         footer_layout.addWidget(self.footer_input)
         form_layout.addLayout(footer_layout)
@@ -697,7 +1219,7 @@ class MainWindow(QMainWindow):
         layout.addLayout(form_layout)
         
         # 打印机信息显示
-        printer_info = QLabel(f'当前打印机: {self.printer.printer_name or "未连接"}')
+        printer_info = QLabel(f'当前打印机: {self.get_printer().printer_name or "未连接"}')
         layout.addWidget(printer_info)
         
         # 测试打印按钮
@@ -728,7 +1250,7 @@ class MainWindow(QMainWindow):
             'footer_text': self.footer_input.text()
         }
         
-        if self.printer.update_config(new_config):
+        if self.get_printer().update_config(new_config):
             QMessageBox.information(self, '成功', '打印机配置已保存')
             dialog.accept()
         else:
@@ -737,7 +1259,7 @@ class MainWindow(QMainWindow):
     def test_print(self):
         """测试打印功能"""
         try:
-            result = self.printer.test_printer()
+            result = self.get_printer().test_printer()
             if result is True:
                 QMessageBox.information(self, '成功', '测试打印已发送')
             else:
@@ -746,20 +1268,25 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, '错误', f'打印失败: {str(e)}')
 
 if __name__ == '__main__':
-    SingleInstanceChecker.terminate_existing_instances()
-    # 创建锁文件路径
-    lock_file = os.path.join(tempfile.gettempdir(), 'shop_management_system.lock')
-    
-    # 检查是否已有实例运行
-    checker = SingleInstanceChecker(lock_file)
-    if not checker.try_lock():
+    with profiler.phase('检查单实例'):
+        SingleInstanceChecker.terminate_existing_instances()
+        # 创建锁文件路径
+        lock_file = os.path.join(tempfile.gettempdir(), 'shop_management_system.lock')
+        
+        # 检查是否已有实例运行
+        checker = SingleInstanceChecker(lock_file)
+        locked = checker.try_lock()
+    if not locked:
         QMessageBox.warning(None, '错误', '程序已经在运行中！')
         sys.exit(1)
         
     try:
-        app = QApplication(sys.argv)
-        window = MainWindow()
-        window.show()
+        with profiler.phase('创建QApplication'):
+            app = QApplication(sys.argv)
+        with profiler.phase('创建主窗口'):
+            window = MainWindow()
+        with profiler.phase('显示窗口'):
+            window.show()
         app.exec_()
     finally:
         # 释放锁文件
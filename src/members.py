@@ -0,0 +1,79 @@
+import argparse
+import sys
+import time
+
+# 会员等级规则: (最低积分, 等级)，从高到低排列
+MEMBER_LEVELS = [(10000, 3), (5000, 2), (0, 1)]
+# 每消费1元积1分，不足1元的部分不计
+POINTS_PER_YUAN = 1
+
+# 每个事务重新评级的会员数，避免长时间占用写锁阻塞收银
+RESCORE_BATCH_SIZE = 2000
+
+def points_for(total_amount):
+    """订单金额(Money)对应的积分"""
+    return max(total_amount.cents // 100, 0) * POINTS_PER_YUAN
+
+def level_case(points_expr):
+    """
+    按MEMBER_LEVELS根据积分计算等级的SQL表达式
+    points_expr会在表达式中出现多次，其中的参数须使用命名参数
+    """
+    branches = ' '.join(f'WHEN {points_expr} >= {minimum} THEN {level}'
+                        for minimum, level in MEMBER_LEVELS[:-1])
+    return f'CASE {branches} ELSE {MEMBER_LEVELS[-1][1]} END'
+
+def apply_order(conn, member_id, total_amount):
+    """
+    为会员累加订单积分并重新计算等级，须在写入订单的同一事务中调用
+    返回: 会员是否存在
+    """
+    points = points_for(total_amount)
+    cursor = conn.execute(f'''
+    UPDATE members
+    SET points = points + :points,
+        level = {level_case('points + :points')}
+    WHERE id = :member_id
+    ''', {'points': points, 'member_id': member_id})
+    return cursor.rowcount == 1
+
+def rescore_levels(db, batch_size=RESCORE_BATCH_SIZE):
+    """
+    按当前等级规则重新计算全部会员的等级，修改MEMBER_LEVELS后运行
+    按会员ID分批，每批一个写事务，只更新等级有变化的会员
+    返回: 等级有变化的会员数
+    """
+    conn = db.pool.reader()
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM members').fetchone()[0]
+    changed = 0
+    for low in range(0, max_id, batch_size):
+        with db.pool.writer(immediate=True) as writer:
+            cursor = writer.execute(f'''
+            UPDATE members
+            SET level = {level_case('points')}
+            WHERE id > ? AND id <= ?
+              AND level != {level_case('points')}
+            ''', (low, low + batch_size))
+            changed += cursor.rowcount
+    return changed
+
+def main(argv=None):
+    from models import Database
+
+    parser = argparse.ArgumentParser(description='按当前等级规则重新计算全部会员的等级')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--batch-size', type=int, default=RESCORE_BATCH_SIZE,
+                        help='每个事务处理的会员数')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        start = time.perf_counter()
+        changed = db.rescore_member_levels(args.batch_size)
+        print(f"会员等级已重新计算，{changed} 个会员等级有变化，用时 {time.perf_counter() - start:.2f} 秒")
+    finally:
+        db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
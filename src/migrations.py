@@ -0,0 +1,412 @@
+"""
+数据库结构版本管理
+- 当前版本号保存在shop.db的PRAGMA user_version中
+- MIGRATIONS按版本号顺序登记，启动时依次执行尚未应用的迁移
+- 每个迁移与版本号更新在同一个事务中完成，失败时整体回滚
+- 只使用CREATE ... IF NOT EXISTS和ALTER TABLE ADD COLUMN，已有门店数据库原地升级，不重建表
+"""
+import sqlite3
+
+PRODUCT_FTS_TRIGGERS = ['products_fts_insert', 'products_fts_delete', 'products_fts_update']
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+def add_column(conn, table, column, definition):
+    """为已有表添加列，列已存在时跳过"""
+    if not column_exists(conn, table, column):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _migration_1(conn):
+    """基础表：商品、订单、订单详情"""
+    # 创建商品表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT UNIQUE,
+        model TEXT UNIQUE,
+        price REAL,
+        stock INTEGER
+    )
+    ''')
+
+    # 创建订单表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_time DATETIME,
+        total_amount REAL,
+        payment_method TEXT
+    )
+    ''')
+
+    # 创建订单详情表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER,
+        product_id INTEGER,
+        quantity INTEGER,
+        price REAL,
+        FOREIGN KEY (order_id) REFERENCES orders (id),
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )
+    ''')
+
+def _migration_2(conn):
+    """商品分类与会员"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        description TEXT
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS members (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        phone TEXT UNIQUE,
+        points INTEGER NOT NULL DEFAULT 0,
+        level INTEGER NOT NULL DEFAULT 1,
+        register_time DATETIME
+    )
+    ''')
+
+    add_column(conn, 'products', 'category_id', 'INTEGER REFERENCES categories (id)')
+    add_column(conn, 'orders', 'member_id', 'INTEGER REFERENCES members (id)')
+
+def _migration_3(conn):
+    """常用查询的索引"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items (product_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_order_time ON orders (order_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_member_id ON orders (member_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category_id ON products (category_id)')
+
+def create_product_fts_triggers(conn):
+    """创建保持products_fts与products同步的触发器"""
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, barcode, model)
+        VALUES (new.id, new.barcode, new.model);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, barcode, model)
+        VALUES ('delete', old.id, old.barcode, old.model);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF barcode, model ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, barcode, model)
+        VALUES ('delete', old.id, old.barcode, old.model);
+        INSERT INTO products_fts (rowid, barcode, model)
+        VALUES (new.id, new.barcode, new.model);
+    END
+    ''')
+
+def drop_product_fts_triggers(conn):
+    for name in PRODUCT_FTS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def _migration_4(conn):
+    """商品全文索引（FTS5 trigram），由触发器与products表保持同步"""
+    try:
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            barcode, model,
+            content='products', content_rowid='id',
+            tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # 旧版本SQLite不支持FTS5或trigram分词器，搜索会退回LIKE查询
+        print(f"未创建商品全文索引: {str(e)}")
+        return
+
+    create_product_fts_triggers(conn)
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+def _migration_5(conn):
+    """按支付方式筛选订单历史的索引"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_payment_time ON orders (payment_method, order_time)')
+
+def _migration_6(conn):
+    """按天、商品、支付方式汇总的销售数据表，并用已有订单初始化"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        sale_date TEXT PRIMARY KEY,
+        order_count INTEGER NOT NULL,
+        total_sales REAL NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily_product (
+        sale_date TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (sale_date, product_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily_payment (
+        sale_date TEXT NOT NULL,
+        payment_method TEXT NOT NULL,
+        order_count INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (sale_date, payment_method)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO sales_daily (sale_date, order_count, total_sales)
+    SELECT date(order_time), COUNT(*), SUM(total_amount)
+    FROM orders
+    GROUP BY date(order_time)
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO sales_daily_product (sale_date, product_id, quantity, amount)
+    SELECT date(o.order_time), oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    GROUP BY date(o.order_time), oi.product_id
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO sales_daily_payment (sale_date, payment_method, order_count, amount)
+    SELECT date(order_time), payment_method, COUNT(*), SUM(total_amount)
+    FROM orders
+    WHERE payment_method IS NOT NULL
+    GROUP BY date(order_time), payment_method
+    ''')
+
+def _migration_7(conn):
+    """
+    金额改为以整数分存储
+    新增price_cents/total_cents列并从原REAL列换算，原列保留但不再使用（旧版SQLite不支持删除列）
+    销售汇总表是派生数据，直接按分重建
+    """
+    add_column(conn, 'products', 'price_cents', 'INTEGER')
+    add_column(conn, 'orders', 'total_cents', 'INTEGER')
+    add_column(conn, 'order_items', 'price_cents', 'INTEGER')
+    conn.execute('UPDATE products SET price_cents = CAST(ROUND(price * 100) AS INTEGER) WHERE price_cents IS NULL')
+    conn.execute('UPDATE orders SET total_cents = CAST(ROUND(total_amount * 100) AS INTEGER) WHERE total_cents IS NULL')
+    conn.execute('UPDATE order_items SET price_cents = CAST(ROUND(price * 100) AS INTEGER) WHERE price_cents IS NULL')
+
+    for table in ('sales_daily', 'sales_daily_product', 'sales_daily_payment'):
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.execute('''
+    CREATE TABLE sales_daily (
+        sale_date TEXT PRIMARY KEY,
+        order_count INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE sales_daily_product (
+        sale_date TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        PRIMARY KEY (sale_date, product_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE sales_daily_payment (
+        sale_date TEXT NOT NULL,
+        payment_method TEXT NOT NULL,
+        order_count INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        PRIMARY KEY (sale_date, payment_method)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT INTO sales_daily (sale_date, order_count, total_cents)
+    SELECT date(order_time), COUNT(*), SUM(total_cents)
+    FROM orders
+    GROUP BY date(order_time)
+    ''')
+    conn.execute('''
+    INSERT INTO sales_daily_product (sale_date, product_id, quantity, amount_cents)
+    SELECT date(o.order_time), oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price_cents)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    GROUP BY date(o.order_time), oi.product_id
+    ''')
+    conn.execute('''
+    INSERT INTO sales_daily_payment (sale_date, payment_method, order_count, amount_cents)
+    SELECT date(order_time), payment_method, COUNT(*), SUM(total_cents)
+    FROM orders
+    WHERE payment_method IS NOT NULL
+    GROUP BY date(order_time), payment_method
+    ''')
+
+def _migration_8(conn):
+    """订单日志记录ID，重放日志时据此去重"""
+    add_column(conn, 'orders', 'journal_id', 'TEXT')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_journal_id ON orders (journal_id)')
+
+def _migration_9(conn):
+    """
+    按商品设置的补货阈值与库存预警清单
+    库存越过阈值时由触发器维护low_stock_watchlist并在low_stock_events中追加一条事件，
+    只处理被修改的商品，不再扫描全部商品
+    """
+    add_column(conn, 'products', 'reorder_threshold', 'INTEGER NOT NULL DEFAULT 10')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS low_stock_watchlist (
+        product_id INTEGER PRIMARY KEY,
+        stock INTEGER NOT NULL,
+        reorder_threshold INTEGER NOT NULL,
+        since DATETIME NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS low_stock_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        stock INTEGER NOT NULL,
+        reorder_threshold INTEGER NOT NULL,
+        event_time DATETIME NOT NULL
+    )
+    ''')
+
+    # 新增商品时库存就低于阈值
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS low_stock_insert AFTER INSERT ON products
+    WHEN new.stock <= new.reorder_threshold BEGIN
+        INSERT OR REPLACE INTO low_stock_watchlist (product_id, stock, reorder_threshold, since)
+        VALUES (new.id, new.stock, new.reorder_threshold, datetime('now', 'localtime'));
+        INSERT INTO low_stock_events (product_id, event, stock, reorder_threshold, event_time)
+        VALUES (new.id, 'low', new.stock, new.reorder_threshold, datetime('now', 'localtime'));
+    END
+    ''')
+    # 库存降到阈值以下（或阈值调高）
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS low_stock_enter AFTER UPDATE OF stock, reorder_threshold ON products
+    WHEN new.stock <= new.reorder_threshold AND old.stock > old.reorder_threshold BEGIN
+        INSERT OR REPLACE INTO low_stock_watchlist (product_id, stock, reorder_threshold, since)
+        VALUES (new.id, new.stock, new.reorder_threshold, datetime('now', 'localtime'));
+        INSERT INTO low_stock_events (product_id, event, stock, reorder_threshold, event_time)
+        VALUES (new.id, 'low', new.stock, new.reorder_threshold, datetime('now', 'localtime'));
+    END
+    ''')
+    # 已在清单中的商品库存继续变化，只更新清单中的数量，不产生事件
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS low_stock_change AFTER UPDATE OF stock, reorder_threshold ON products
+    WHEN new.stock <= new.reorder_threshold AND old.stock <= old.reorder_threshold BEGIN
+        UPDATE low_stock_watchlist
+        SET stock = new.stock, reorder_threshold = new.reorder_threshold
+        WHERE product_id = new.id;
+    END
+    ''')
+    # 补货后库存回到阈值以上（或阈值调低）
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS low_stock_leave AFTER UPDATE OF stock, reorder_threshold ON products
+    WHEN new.stock > new.reorder_threshold AND old.stock <= old.reorder_threshold BEGIN
+        DELETE FROM low_stock_watchlist WHERE product_id = new.id;
+        INSERT INTO low_stock_events (product_id, event, stock, reorder_threshold, event_time)
+        VALUES (new.id, 'restocked', new.stock, new.reorder_threshold, datetime('now', 'localtime'));
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS low_stock_delete AFTER DELETE ON products BEGIN
+        DELETE FROM low_stock_watchlist WHERE product_id = old.id;
+    END
+    ''')
+
+    # 用已有商品初始化清单，这是唯一一次全表扫描
+    conn.execute('''
+    INSERT OR REPLACE INTO low_stock_watchlist (product_id, stock, reorder_threshold, since)
+    SELECT id, stock, reorder_threshold, datetime('now', 'localtime')
+    FROM products
+    WHERE stock <= reorder_threshold
+    ''')
+
+def _migration_10(conn):
+    """订单归档分区目录表，每个已归档的月份一行"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive_partitions (
+        month TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        compressed INTEGER NOT NULL DEFAULT 0,
+        order_count INTEGER NOT NULL,
+        item_count INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        min_order_id INTEGER,
+        max_order_id INTEGER,
+        archived_time DATETIME NOT NULL
+    )
+    ''')
+
+def _migration_11(conn):
+    """商品进价，用于毛利分析；已有商品的进价为空，表示未设置"""
+    add_column(conn, 'products', 'cost_cents', 'INTEGER')
+
+def _migration_12(conn):
+    """补货建议表，由forecast.update_reorder_suggestions整体重写"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reorder_suggestions (
+        product_id INTEGER PRIMARY KEY REFERENCES products (id),
+        forecast_daily REAL NOT NULL,
+        demand_std REAL NOT NULL,
+        safety_stock INTEGER NOT NULL,
+        reorder_point INTEGER NOT NULL,
+        suggested_quantity INTEGER NOT NULL,
+        computed_time DATETIME NOT NULL
+    )
+    ''')
+
+def _migration_13(conn):
+    """会员卡号，收银时可按手机号或卡号识别会员"""
+    add_column(conn, 'members', 'card_no', 'TEXT')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_members_card_no ON members (card_no)')
+
+# (版本号, 说明, 迁移函数)，版本号必须连续递增
+MIGRATIONS = [
+    (1, '基础表', _migration_1),
+    (2, '商品分类与会员', _migration_2),
+    (3, '订单与商品索引', _migration_3),
+    (4, '商品全文索引', _migration_4),
+    (5, '订单支付方式索引', _migration_5),
+    (6, '销售汇总表', _migration_6),
+    (7, '金额以分存储', _migration_7),
+    (8, '订单日志记录ID', _migration_8),
+    (9, '补货阈值与库存预警清单', _migration_9),
+    (10, '订单归档分区', _migration_10),
+    (11, '商品进价', _migration_11),
+    (12, '补货建议', _migration_12),
+    (13, '会员卡号', _migration_13),
+]
+
+def migrate(conn):
+    """
+    将数据库升级到最新版本
+    conn: 处于自动提交模式(isolation_level=None)的连接
+    返回: 本次应用的迁移版本号列表
+    """
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 取得写锁后再确认一次，避免多个进程同时升级
+            if version <= get_schema_version(conn):
+                conn.execute('ROLLBACK')
+                continue
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        print(f"数据库已升级到版本 {version}: {description}")
+        applied.append(version)
+    return applied
@@ -2,60 +2,105 @@ import sqlite3
 from datetime import datetime, timedelta
 import csv
 import os
+from db_pool import ConnectionPool
+from cache import ProductCache, MemberCache
+import archive
+import members
+import migrations
+import rollups
+from money import Money
+from store_protocol import DEFAULT_PORT
+
+# 导出CSV时每次从游标读取的行数和文件写缓冲区大小
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 1024 * 1024
+# 导入CSV时每批写入的行数
+IMPORT_BATCH_SIZE = 5000
+# 未单独设置补货阈值的商品使用的默认阈值，与products.reorder_threshold列的默认值一致
+DEFAULT_REORDER_THRESHOLD = 10
+
+# 商品行的列顺序：(id, barcode, model, price, stock, category_id)
+PRODUCT_COLUMNS = ['id', 'barcode', 'model', 'price_cents', 'stock', 'category_id']
+
+def product_columns(alias=None):
+    """拼接商品查询的列清单，alias为表别名"""
+    if alias:
+        return ', '.join(f'{alias}.{column}' for column in PRODUCT_COLUMNS)
+    return ', '.join(PRODUCT_COLUMNS)
+
+def product_row(row):
+    """把数据库中的商品行转换为(id, barcode, model, Money价格, stock, category_id)"""
+    if row is None:
+        return None
+    return (row[0], row[1], row[2], Money.from_cents(row[3]), row[4], row[5])
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
+class OrderRejectedError(Exception):
+    """订单因业务原因被拒绝（库存不足、会员不存在等），原样重试也不会成功"""
+
+class InsufficientStockError(OrderRejectedError):
+    """下单时商品库存不足"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        lines = []
+        for product_id, model, stock, quantity in shortages:
+            if model is None:
+                lines.append(f"商品ID {product_id} 不存在")
+            else:
+                lines.append(f"{model}（库存：{stock}，需要：{quantity}）")
+        super().__init__("以下商品库存不足：\n" + "\n".join(lines))
+
+class UnknownMemberError(OrderRejectedError):
+    """下单时指定的会员不存在（如已被删除）"""
+
+    def __init__(self, member_id):
+        self.member_id = member_id
+        super().__init__(f"会员ID {member_id} 不存在")
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('shop.db')
+    def __init__(self, db_path='shop.db'):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.product_cache = ProductCache()
+        self.member_cache = MemberCache()
         self.create_tables()
 
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # 创建商品表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            barcode TEXT UNIQUE,
-            model TEXT UNIQUE,
-            price REAL,
-            stock INTEGER
-        )
-        ''')
-
-        # 创建订单表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_time DATETIME,
-            total_amount REAL,
-            payment_method TEXT
-        )
-        ''')
+    @staticmethod
+    def remote(host='127.0.0.1', port=DEFAULT_PORT, token=None):
+        """
+        客户端模式：连接门店服务器(store_server.py)，返回方法与Database相同的RemoteDatabase
+        多台收银机共用服务器上的一个数据库
+        token: 门店服务器的共享密钥
+        """
+        from store_client import RemoteDatabase
+        return RemoteDatabase(host, port, token=token)
 
-        # 创建订单详情表
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER,
-            product_id INTEGER,
-            quantity INTEGER,
-            price REAL,
-            FOREIGN KEY (order_id) REFERENCES orders (id),
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-        ''')
+    def close(self):
+        self.pool.close()
 
-        self.conn.commit()
+    def create_tables(self):
+        """创建或升级数据库表结构"""
+        with self.pool.writer_connection() as conn:
+            migrations.migrate(conn)
+            self._has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone() is not None
 
-    def add_product(self, barcode, model, price, stock):
-        """添加商品，如果型号已存在则抛出异常"""
-        cursor = self.conn.cursor()
+    def add_product(self, barcode, model, price, stock, reorder_threshold=DEFAULT_REORDER_THRESHOLD,
+                    cost=None):
+        """
+        添加商品，如果型号已存在则抛出异常
+        cost: 进价，None表示未设置
+        """
         try:
-            cursor.execute('''
-            INSERT INTO products (barcode, model, price, stock)
-            VALUES (?, ?, ?, ?)
-            ''', (barcode, model, price, stock))
-            self.conn.commit()
+            with self.pool.writer() as conn:
+                conn.execute('''
+                INSERT INTO products (barcode, model, price_cents, stock, reorder_threshold, cost_cents)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (barcode, model, Money.parse(price), stock, reorder_threshold,
+                      Money.parse(cost) if cost is not None else None))
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint failed: products.model" in str(e):
                 raise Exception("商品型号已存在")
@@ -63,93 +108,220 @@ class Database:
                 raise Exception("商品条码已存在")
             else:
                 raise e
+        self.product_cache.invalidate_barcode(barcode)
 
-    def update_product(self, product_id, barcode=None, model=None, price=None, stock=None):
+    def update_product(self, product_id, barcode=None, model=None, price=None, stock=None,
+                       reorder_threshold=None, cost=None):
         """
         更新商品信息，如果型号已存在则抛出异常
+        cost: 进价，None表示不修改，空字符串表示清除进价
         """
         try:
-            # 先检查型号是否存在（如果要更新型号的话）
-            if model is not None:
-                cursor = self.conn.cursor()
-                cursor.execute('''
-                SELECT id FROM products 
-                WHERE model = ? AND id != ?
-                ''', (model, product_id))
-                if cursor.fetchone():
-                    raise Exception("商品型号已存在")
-
-            updates = []
-            values = []
-            if barcode is not None:
-                updates.append("barcode = ?")
-                values.append(barcode)
-            if model is not None:
-                updates.append("model = ?")
-                values.append(model)
-            if price is not None:
-                updates.append("price = ?")
-                values.append(price)
-            if stock is not None:
-                updates.append("stock = ?")
-                values.append(stock)
-            
-            if updates:
-                values.append(product_id)
-                cursor = self.conn.cursor()
-                cursor.execute(f'''
-                UPDATE products 
-                SET {", ".join(updates)}
-                WHERE id = ?
-                ''', values)
-                self.conn.commit()
+            with self.pool.writer() as conn:
+                cursor = conn.cursor()
+                # 先检查型号是否存在（如果要更新型号的话）
+                if model is not None:
+                    cursor.execute('''
+                    SELECT id FROM products 
+                    WHERE model = ? AND id != ?
+                    ''', (model, product_id))
+                    if cursor.fetchone():
+                        raise Exception("商品型号已存在")
+
+                updates = []
+                values = []
+                if barcode is not None:
+                    updates.append("barcode = ?")
+                    values.append(barcode)
+                if model is not None:
+                    updates.append("model = ?")
+                    values.append(model)
+                if price is not None:
+                    updates.append("price_cents = ?")
+                    values.append(Money.parse(price))
+                if stock is not None:
+                    updates.append("stock = ?")
+                    values.append(stock)
+                if reorder_threshold is not None:
+                    updates.append("reorder_threshold = ?")
+                    values.append(reorder_threshold)
+                if cost is not None:
+                    updates.append("cost_cents = ?")
+                    values.append(Money.parse(cost) if cost != '' else None)
+
+                if updates:
+                    values.append(product_id)
+                    cursor.execute(f'''
+                    UPDATE products 
+                    SET {", ".join(updates)}
+                    WHERE id = ?
+                    ''', values)
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint failed: products.barcode" in str(e):
                 raise Exception("商品条码已存在")
             else:
                 raise e
+        self.product_cache.invalidate_ids([product_id])
 
     def delete_product(self, id):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM products WHERE id = ?', (id,))
-        self.conn.commit()
+        with self.pool.writer() as conn:
+            conn.execute('DELETE FROM products WHERE id = ?', (id,))
+        self.product_cache.invalidate_ids([id])
+
+    def get_all_products(self):
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'SELECT {product_columns()} FROM products')
+        return [product_row(row) for row in cursor.fetchall()]
 
     def get_product_by_barcode(self, barcode):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE barcode = ?', (barcode,))
-        return cursor.fetchone()
+        product = self.product_cache.get(barcode)
+        if product is not None:
+            return product
 
-    def create_order(self, items, payment_method):
-        cursor = self.conn.cursor()
-        total_amount = sum(item['price'] * item['quantity'] for item in items)
-        
-        # 创建订单
-        cursor.execute('''
-        INSERT INTO orders (order_time, total_amount, payment_method)
-        VALUES (?, ?, ?)
-        ''', (datetime.now(), total_amount, payment_method))
-        
-        order_id = cursor.lastrowid
-        
-        # 添加订单项目
+        generation = self.product_cache.generation
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'SELECT {product_columns()} FROM products WHERE barcode = ?', (barcode,))
+        product = product_row(cursor.fetchone())
+        if product is not None:
+            self.product_cache.put(barcode, product, generation)
+        return product
+
+    def get_product_cache_stats(self):
+        """获取条码缓存的命中统计"""
+        return self.product_cache.stats()
+
+    def create_order(self, items, payment_method, member_id=None):
+        """
+        创建订单并扣减库存
+        整个订单在一个BEGIN IMMEDIATE事务中提交，任一商品库存不足时整单失败
+        member_id: 会员ID，订单积分在同一事务中累加到会员
+        """
+        with self.pool.writer(immediate=True) as conn:
+            order_id = self._insert_order(conn, items, payment_method, member_id=member_id)
+
+        self.product_cache.invalidate_ids([item['product_id'] for item in items])
+        return order_id
+
+    def check_stock(self, items):
+        """
+        收款前检查库存，不修改数据库
+        返回库存不足或不存在的商品 [(product_id, model, stock, quantity), ...]，与InsufficientStockError相同
+        下单时仍会在事务中再次检查，两次检查之间其他收银台可能卖出同一商品
+        """
+        quantities = {}
         for item in items:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+        if not quantities:
+            return []
+        placeholders = ','.join('?' * len(quantities))
+        rows = self.pool.reader().execute(
+            f'SELECT id, model, stock FROM products WHERE id IN ({placeholders})',
+            list(quantities)).fetchall()
+        found = {row[0]: row for row in rows}
+        shortages = []
+        for product_id, quantity in quantities.items():
+            row = found.get(product_id)
+            if row is None:
+                shortages.append((product_id, None, None, quantity))
+            elif row[2] < quantity:
+                shortages.append((product_id, row[1], row[2], quantity))
+        return shortages
+
+    def _insert_order(self, conn, items, payment_method, order_time=None, journal_id=None,
+                      member_id=None):
+        """
+        在调用方已开启的事务中写入一个订单
+        库存不足时回滚本订单的全部修改并抛出InsufficientStockError
+        order_time: 下单时间，默认为当前时间；重放订单日志时使用日志中记录的时间
+        journal_id: 订单日志记录ID，该记录已写入过（包括已被归档）时直接返回已有订单ID
+        member_id: 会员ID，累加积分并重新计算等级；会员不存在时回滚并抛出UnknownMemberError
+        """
+        if journal_id is not None:
+            row = conn.execute('SELECT id FROM orders WHERE journal_id = ?', (journal_id,)).fetchone()
+            if row:
+                return row[0]
+            # 重放较早的日志时，订单可能已经写入并随所在月份移到归档分区
+            if order_time is not None:
+                archived_id = archive.archived_journal_order(conn, journal_id, order_time)
+                if archived_id is not None:
+                    return archived_id
+
+        total_amount = sum((Money.parse(item['price']) * item['quantity'] for item in items),
+                           Money())
+
+        # 同一商品可能出现在多行，按商品汇总扣减数量
+        quantities = {}
+        for item in items:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS order_request (
+            product_id INTEGER PRIMARY KEY,
+            quantity INTEGER NOT NULL
+        )
+        ''')
+        cursor.execute('DELETE FROM temp.order_request')
+        cursor.executemany('INSERT INTO temp.order_request VALUES (?, ?)',
+                           quantities.items())
+
+        if order_time is None:
+            order_time = datetime.now()
+        cursor.execute('SAVEPOINT create_order')
+        try:
+            # 会员积分与订单同时提交或回滚
+            if member_id is not None and not members.apply_order(conn, member_id, total_amount):
+                raise UnknownMemberError(member_id)
+
+            # 创建订单
             cursor.execute('''
-            INSERT INTO order_items (order_id, product_id, quantity, price)
+            INSERT INTO orders (order_time, total_cents, payment_method, journal_id, member_id)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (order_time, total_amount, payment_method, journal_id, member_id))
+            order_id = cursor.lastrowid
+
+            # 批量添加订单项目
+            cursor.executemany('''
+            INSERT INTO order_items (order_id, product_id, quantity, price_cents)
             VALUES (?, ?, ?, ?)
-            ''', (order_id, item['product_id'], item['quantity'], item['price']))
-            
-            # 更新库存
+            ''', [(order_id, item['product_id'], item['quantity'], Money.parse(item['price']))
+                  for item in items])
+
+            # 一条语句扣减所有商品库存，库存不足的商品不会被更新
             cursor.execute('''
-            UPDATE products 
-            SET stock = stock - ?
-            WHERE id = ?
-            ''', (item['quantity'], item['product_id']))
-        
-        self.conn.commit()
+            UPDATE products
+            SET stock = stock - (SELECT r.quantity FROM temp.order_request r
+                                 WHERE r.product_id = products.id)
+            WHERE id IN (SELECT product_id FROM temp.order_request)
+              AND stock >= (SELECT r.quantity FROM temp.order_request r
+                            WHERE r.product_id = products.id)
+            ''')
+            if cursor.rowcount != len(quantities):
+                cursor.execute('ROLLBACK TO create_order')
+                raise InsufficientStockError(self._stock_shortages(cursor))
+
+            # 更新销售汇总
+            rollups.apply_order(conn, order_time, total_amount, payment_method, items)
+        except BaseException:
+            cursor.execute('ROLLBACK TO create_order')
+            cursor.execute('RELEASE create_order')
+            raise
+        cursor.execute('RELEASE create_order')
+
         return order_id
 
+    def _stock_shortages(self, cursor):
+        """根据temp.order_request找出库存不足或不存在的商品"""
+        cursor.execute('''
+        SELECT r.product_id, p.model, p.stock, r.quantity
+        FROM temp.order_request r
+        LEFT JOIN products p ON p.id = r.product_id
+        WHERE p.id IS NULL OR p.stock < r.quantity
+        ''')
+        return cursor.fetchall()
+
     def get_order(self, order_id):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         cursor.execute('''
         SELECT o.*, oi.*, p.model
         FROM orders o
@@ -161,124 +333,322 @@ class Database:
 
     def get_all_orders(self):
         """
-        获取所有订单
+        获取所有订单（包括已归档的月份）
         返回: [(id, time, total_amount, payment_method), ...]
         """
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT id, datetime(order_time), total_amount, payment_method
-        FROM orders
-        ORDER BY order_time DESC
-        ''')
-        return cursor.fetchall()
+        conn = self.pool.reader()
+        orders = []
+        # 归档分区按月份从新到旧排列，依次拼接即为按时间倒序
+        for schema in archive.sources(conn, archive.list_partitions(conn)):
+            cursor = conn.execute(f'''
+            SELECT id, datetime(order_time), total_cents, payment_method
+            FROM {schema}.orders
+            ORDER BY order_time DESC
+            ''')
+            orders.extend((row[0], row[1], Money.from_cents(row[2]), row[3]) for row in cursor)
+        return orders
+
+    def _order_filters(self, start_date=None, end_date=None, payment_method=None):
+        """拼接订单查询的过滤条件，返回(条件列表, 参数列表)"""
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append('order_time >= ?')
+            params.append(start_date)
+        if end_date:
+            conditions.append('order_time < ?')
+            params.append(end_date)
+        if payment_method:
+            conditions.append('payment_method = ?')
+            params.append(payment_method)
+        return conditions, params
+
+    def get_orders_page(self, limit=100, after=None, start_date=None, end_date=None,
+                        payment_method=None):
+        """
+        按时间倒序分页获取订单（键集分页，按(order_time, id)定位，不使用OFFSET）
+        热库中的订单取完后继续从与时间范围相交的归档分区中读取
+        limit: 每页订单数
+        after: 上一页返回的游标，None表示第一页
+        start_date/end_date: 订单时间范围 [start_date, end_date)
+        payment_method: 只返回指定支付方式的订单
+        返回: ([(id, time, total_amount, payment_method), ...], 下一页游标或None)
+        """
+        conditions, params = self._order_filters(start_date, end_date, payment_method)
+        if after is not None:
+            conditions.append('(order_time, id) < (?, ?)')
+            params.extend(after)
+
+        query = '''
+        SELECT id, datetime(order_time), total_cents, payment_method, order_time
+        FROM {schema}.orders
+        '''
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY order_time DESC, id DESC LIMIT ?'
+
+        conn = self.pool.reader()
+        partitions = archive.list_partitions(conn, start_date,
+                                             after[0] if after is not None else end_date,
+                                             end_inclusive=after is not None)
+        rows = []
+        schemas = archive.sources(conn, partitions)
+        for schema in schemas:
+            rows += conn.execute(query.format(schema=schema), params + [limit - len(rows)]).fetchall()
+            if len(rows) == limit:
+                schemas.close()
+                break
+
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = (rows[-1][4], rows[-1][0])
+        return [(row[0], row[1], Money.from_cents(row[2]), row[3]) for row in rows], next_cursor
+
+    def count_orders(self, start_date=None, end_date=None, payment_method=None):
+        """统计满足条件的订单数（包括已归档的月份）"""
+        conditions, params = self._order_filters(start_date, end_date, payment_method)
+        query = 'SELECT COUNT(*) FROM {schema}.orders'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        conn = self.pool.reader()
+        partitions = archive.list_partitions(conn, start_date, end_date)
+        return sum(conn.execute(query.format(schema=schema), params).fetchall()[0][0]
+                   for schema in archive.sources(conn, partitions))
 
     def get_order_details(self, order_id):
         """
         获取订单详情
         order_id: 订单ID
-        返回: [{'model': str, 'price': float, 'quantity': int}, ...]
+        返回: [{'model': str, 'price': Money, 'quantity': int}, ...]
         """
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT p.model, oi.price, oi.quantity
-        FROM order_items oi
+        return self.get_order_details_batch([order_id])[order_id]
+
+    def get_order_details_batch(self, order_ids):
+        """
+        一次查询获取多个订单的详情
+        返回: {order_id: [{'model': str, 'price': Money, 'quantity': int}, ...]}
+        """
+        details = {order_id: [] for order_id in order_ids}
+        if not details:
+            return details
+
+        conn = self.pool.reader()
+        self._fetch_order_details(conn, 'main', list(details), details)
+        # 热库中找不到的订单按订单ID范围到归档分区中查找
+        missing = [order_id for order_id, items in details.items() if not items]
+        if missing:
+            for partition, ids in archive.partitions_for_orders(conn, missing):
+                with archive.attached(conn, partition) as schema:
+                    self._fetch_order_details(conn, schema, ids, details)
+        return details
+
+    def _fetch_order_details(self, conn, schema, order_ids, details):
+        cursor = conn.execute(f'''
+        SELECT oi.order_id, p.model, oi.price_cents, oi.quantity
+        FROM {schema}.order_items oi
         JOIN products p ON oi.product_id = p.id
-        WHERE oi.order_id = ?
-        ''', (order_id,))
-        
-        details = []
-        for row in cursor.fetchall():
-            details.append({
-                'model': row[0],
-                'price': row[1],
-                'quantity': row[2]
+        WHERE oi.order_id IN ({", ".join("?" * len(order_ids))})
+        ORDER BY oi.order_id, oi.id
+        ''', order_ids)
+        for row in cursor:
+            details[row[0]].append({
+                'model': row[1],
+                'price': Money.from_cents(row[2]),
+                'quantity': row[3]
             })
-        return details
 
-    def get_low_stock_products(self, threshold=10):
+    def get_low_stock_products(self, threshold=None):
         """
         获取库存低于阈值的商品
-        threshold: 库存阈值
+        threshold: 为None时按各商品的补货阈值，直接读取触发器维护的预警清单；
+                   指定时按统一阈值扫描全部商品
         """
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE stock <= ?', (threshold,))
-        return cursor.fetchall()
+        # CROSS JOIN固定以预警清单驱动连接，查询代价与清单大小成正比
+        cursor = self.pool.reader().cursor()
+        if threshold is None:
+            cursor.execute(f'''
+            SELECT {product_columns('p')} FROM low_stock_watchlist w
+            CROSS JOIN products p ON p.id = w.product_id
+            ORDER BY w.since
+            ''')
+        else:
+            cursor.execute(f'SELECT {product_columns()} FROM products WHERE stock <= ?', (threshold,))
+        return [product_row(row) for row in cursor.fetchall()]
+
+    def get_reorder_threshold(self, product_id):
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT reorder_threshold FROM products WHERE id = ?', (product_id,))
+        row = cursor.fetchone()
+        return row[0] if row else DEFAULT_REORDER_THRESHOLD
 
-    def search_products(self, keyword):
+    def get_product_cost(self, product_id):
+        """商品进价，未设置时返回None"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT cost_cents FROM products WHERE id = ?', (product_id,))
+        row = cursor.fetchone()
+        return Money.from_cents(row[0]) if row and row[0] is not None else None
+
+    def get_low_stock_events(self, after_id=0, limit=100):
         """
-        搜索商品（按条码或型号）
+        获取库存预警事件，供界面轮询
+        after_id: 只返回ID大于该值的事件
+        返回: [(事件ID, 商品ID, 型号, 事件('low'或'restocked'), 库存, 阈值, 时间), ...]
         """
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         cursor.execute('''
-        SELECT * FROM products 
-        WHERE barcode LIKE ? OR model LIKE ?
-        ''', (f'%{keyword}%', f'%{keyword}%'))
+        SELECT e.id, e.product_id, p.model, e.event, e.stock, e.reorder_threshold, e.event_time
+        FROM low_stock_events e
+        LEFT JOIN products p ON p.id = e.product_id
+        WHERE e.id > ?
+        ORDER BY e.id
+        LIMIT ?
+        ''', (after_id, limit))
         return cursor.fetchall()
 
+    def get_last_low_stock_event_id(self):
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM low_stock_events')
+        return cursor.fetchone()[0]
+
+    def update_reorder_suggestions(self, history_days=56, half_life=14, lead_time=3, review_days=7,
+                                   service_level=0.95, apply_thresholds=False):
+        """按销售历史重新计算全部商品的补货建议，参数见forecast.update_reorder_suggestions"""
+        # 预测依赖NumPy，只在用到时导入
+        import forecast
+        return forecast.update_reorder_suggestions(self, history_days, half_life, lead_time,
+                                                   review_days, service_level, apply_thresholds)
+
+    def get_reorder_suggestions(self, only_needed=True):
+        """
+        获取补货建议
+        only_needed: 只返回建议补货量大于0的商品
+        返回: [(商品ID, 型号, 库存, 日均需求, 安全库存, 再订货点, 建议补货量, 计算时间), ...]
+              按建议补货量从多到少
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'''
+        SELECT p.id, p.model, p.stock, r.forecast_daily, r.safety_stock, r.reorder_point,
+               r.suggested_quantity, r.computed_time
+        FROM reorder_suggestions r
+        JOIN products p ON p.id = r.product_id
+        {'WHERE r.suggested_quantity > 0' if only_needed else ''}
+        ORDER BY r.suggested_quantity DESC, p.id
+        ''')
+        return cursor.fetchall()
+
+    def search_products(self, keyword, limit=200):
+        """
+        搜索商品（按条码或型号）
+        关键字不少于3个字符时使用trigram全文索引，结果按相关度排序，条码完全匹配的排在最前
+        limit: 最多返回的商品数
+        """
+        cursor = self.pool.reader().cursor()
+        if len(keyword) >= 3 and self._has_fts:
+            cursor.execute(f'''
+            SELECT {product_columns('p')} FROM products_fts f
+            JOIN products p ON p.id = f.rowid
+            WHERE products_fts MATCH ?
+            ORDER BY p.barcode = ? DESC, f.rank
+            LIMIT ?
+            ''', ('"' + keyword.replace('"', '""') + '"', keyword, limit))
+        else:
+            cursor.execute(f'''
+            SELECT {product_columns()} FROM products 
+            WHERE barcode LIKE ? OR model LIKE ?
+            LIMIT ?
+            ''', (f'%{keyword}%', f'%{keyword}%', limit))
+        return [product_row(row) for row in cursor.fetchall()]
+
     def get_sales_statistics(self, days=30):
         """
-        获取销售统计数据
+        获取销售统计数据（从按天汇总的销售表查询，统计范围按整天计算）
         days: 统计天数
         返回: {
-            'total_sales': float,  # 总销售额
+            'total_sales': Money,  # 总销售额
             'total_orders': int,   # 订单总数
             'popular_products': [], # 热销商品
-            'daily_sales': []      # 每日销售额
+            'daily_sales': [],     # 每日销售额
+            'payment_methods': []  # 各支付方式的订单数和金额
         }
         """
-        cursor = self.conn.cursor()
-        start_date = datetime.now() - timedelta(days=days)
-        
-        # 总销售额和订单数
-        cursor.execute('''
-        SELECT COUNT(*) as order_count, SUM(total_amount) as total_sales
-        FROM orders
-        WHERE order_time >= ?
-        ''', (start_date,))
-        count_row = cursor.fetchone()
-        
-        # 热销商品
-        cursor.execute('''
-        SELECT p.model, SUM(oi.quantity) as total_quantity, 
-               SUM(oi.quantity * oi.price) as total_amount
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        JOIN orders o ON oi.order_id = o.id
-        WHERE o.order_time >= ?
-        GROUP BY p.id
-        ORDER BY total_quantity DESC
-        LIMIT 10
-        ''', (start_date,))
-        popular_products = cursor.fetchall()
-        
-        # 每日销售额
-        cursor.execute('''
-        SELECT date(order_time) as sale_date, 
-               COUNT(*) as order_count,
-               SUM(total_amount) as daily_sales
-        FROM orders
-        WHERE order_time >= ?
-        GROUP BY date(order_time)
-        ORDER BY sale_date
-        ''', (start_date,))
-        daily_sales = cursor.fetchall()
-        
+        conn = self.pool.reader()
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+        # 在同一个读事务中执行，保证几项统计基于同一份数据快照
+        conn.execute('BEGIN')
+        try:
+            cursor = conn.cursor()
+            # 总销售额和订单数
+            cursor.execute('''
+            SELECT SUM(order_count) as order_count, SUM(total_cents) as total_sales
+            FROM sales_daily
+            WHERE sale_date >= ?
+            ''', (start_date,))
+            count_row = cursor.fetchone()
+
+            # 热销商品
+            cursor.execute('''
+            SELECT p.model, SUM(s.quantity) as total_quantity, 
+                   SUM(s.amount_cents) as total_amount
+            FROM sales_daily_product s
+            JOIN products p ON s.product_id = p.id
+            WHERE s.sale_date >= ?
+            GROUP BY s.product_id
+            ORDER BY total_quantity DESC
+            LIMIT 10
+            ''', (start_date,))
+            popular_products = [(row[0], row[1], Money.from_cents(row[2]))
+                                for row in cursor.fetchall()]
+
+            # 每日销售额
+            cursor.execute('''
+            SELECT sale_date, order_count, total_cents as daily_sales
+            FROM sales_daily
+            WHERE sale_date >= ?
+            ORDER BY sale_date
+            ''', (start_date,))
+            daily_sales = [(row[0], row[1], Money.from_cents(row[2]))
+                           for row in cursor.fetchall()]
+
+            # 支付方式
+            cursor.execute('''
+            SELECT payment_method, SUM(order_count), SUM(amount_cents)
+            FROM sales_daily_payment
+            WHERE sale_date >= ?
+            GROUP BY payment_method
+            ORDER BY SUM(amount_cents) DESC
+            ''', (start_date,))
+            payment_methods = [(row[0], row[1], Money.from_cents(row[2]))
+                               for row in cursor.fetchall()]
+        finally:
+            conn.execute('COMMIT')
+
         return {
-            'total_sales': count_row[1] or 0,
+            'total_sales': Money.from_cents(count_row[1]),
             'total_orders': count_row[0] or 0,
             'popular_products': popular_products,
-            'daily_sales': daily_sales
+            'daily_sales': daily_sales,
+            'payment_methods': payment_methods
         }
 
+    def rebuild_sales_rollups(self):
+        """
+        根据订单历史重新计算销售汇总表并校验
+        返回: 校验发现的不一致列表，为空表示一致
+        """
+        archived = rollups.archived_totals(self.pool.reader())
+        with self.pool.writer(immediate=True) as conn:
+            rollups.rebuild(conn, archived)
+        return rollups.verify(self.pool.reader())
+
     # 商品分类管理
     def add_category(self, name, description=''):
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO categories (name, description) VALUES (?, ?)',
-                      (name, description))
-        self.conn.commit()
+        with self.pool.writer() as conn:
+            conn.execute('INSERT INTO categories (name, description) VALUES (?, ?)',
+                         (name, description))
 
     def get_all_categories(self):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         cursor.execute('SELECT * FROM categories')
         return cursor.fetchall()
 
@@ -294,116 +664,330 @@ class Database:
         
         if updates:
             values.append(category_id)
-            cursor = self.conn.cursor()
-            cursor.execute(f'''
-            UPDATE categories 
-            SET {", ".join(updates)}
-            WHERE id = ?
-            ''', values)
-            self.conn.commit()
+            with self.pool.writer() as conn:
+                conn.execute(f'''
+                UPDATE categories 
+                SET {", ".join(updates)}
+                WHERE id = ?
+                ''', values)
 
     # 会员管理
-    def add_member(self, name, phone):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        INSERT INTO members (name, phone, register_time)
-        VALUES (?, ?, ?)
-        ''', (name, phone, datetime.now()))
-        self.conn.commit()
+    # 会员行的列，与SELECT *在迁移后的列顺序一致
+    MEMBER_COLUMNS = 'id, name, phone, points, level, register_time, card_no'
+
+    def add_member(self, name, phone, card_no=None):
+        try:
+            with self.pool.writer() as conn:
+                conn.execute('''
+                INSERT INTO members (name, phone, register_time, card_no)
+                VALUES (?, ?, ?, ?)
+                ''', (name, phone, datetime.now(), card_no or None))
+        except sqlite3.IntegrityError as e:
+            if "members.phone" in str(e):
+                raise Exception("手机号码已登记")
+            elif "members.card_no" in str(e):
+                raise Exception("会员卡号已登记")
+            else:
+                raise e
 
     def get_member_by_phone(self, phone):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM members WHERE phone = ?', (phone,))
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'SELECT {self.MEMBER_COLUMNS} FROM members WHERE phone = ?', (phone,))
+        return cursor.fetchone()
+
+    def get_member(self, member_id):
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f'SELECT {self.MEMBER_COLUMNS} FROM members WHERE id = ?', (member_id,))
         return cursor.fetchone()
 
+    def find_member(self, code):
+        """
+        按手机号或会员卡号查找会员，收银时使用
+        号码到会员ID的对应关系有缓存，积分和等级总是读取最新值
+        返回: (id, name, phone, points, level, register_time, card_no)，未找到返回None
+        """
+        code = code.strip()
+        if not code:
+            return None
+        member_id = self.member_cache.get(code)
+        if member_id is not None:
+            member = self.get_member(member_id)
+            if member is not None:
+                return member
+            self.member_cache.clear()
+
+        generation = self.member_cache.generation
+        cursor = self.pool.reader().cursor()
+        # 两个条件分别走card_no和phone上的唯一索引
+        cursor.execute(f'''
+        SELECT {self.MEMBER_COLUMNS} FROM members WHERE card_no = ?
+        UNION ALL
+        SELECT {self.MEMBER_COLUMNS} FROM members WHERE phone = ?
+        LIMIT 1
+        ''', (code, code))
+        member = cursor.fetchone()
+        if member is not None:
+            self.member_cache.put(code, member[0], generation)
+        return member
+
     def update_member_points(self, member_id, points_delta):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        UPDATE members 
-        SET points = points + ?,
-            level = CASE 
-                WHEN points + ? >= 10000 THEN 3
-                WHEN points + ? >= 5000 THEN 2
-                ELSE 1
-            END
-        WHERE id = ?
-        ''', (points_delta, points_delta, points_delta, member_id))
-        self.conn.commit()
+        with self.pool.writer() as conn:
+            conn.execute(f'''
+            UPDATE members 
+            SET points = points + :delta,
+                level = {members.level_case('points + :delta')}
+            WHERE id = :member_id
+            ''', {'delta': points_delta, 'member_id': member_id})
+
+    def rescore_member_levels(self, batch_size=members.RESCORE_BATCH_SIZE):
+        """按当前等级规则分批重新计算全部会员的等级，返回等级有变化的会员数"""
+        return members.rescore_levels(self, batch_size)
 
     # 导入导出功能
-    def export_products_to_csv(self, filename):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        SELECT p.barcode, p.model, p.price, p.stock, c.name
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        ''')
-        
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['条码', '型号', '价格', '库存', '分类'])
-            writer.writerows(cursor.fetchall())
-
-    def import_products_from_csv(self, filename):
-        cursor = self.conn.cursor()
-        with open(filename, 'r', encoding='utf-8') as f:
+    def _stream_to_csv(self, filename, header, count_query, query, params,
+                       progress_callback=None, chunk_size=EXPORT_CHUNK_SIZE, partitions=()):
+        """
+        分批读取查询结果写入CSV文件，内存占用与导出行数无关
+        progress_callback: callback(已导出行数, 总行数)，返回False时取消导出并删除已写入的文件
+        partitions: 一并导出的归档分区，查询中的{schema}依次替换为main和各分区的附加库名
+        返回: 导出的行数
+        """
+        conn = self.pool.reader()
+        # 归档分区只读，可以先统计行数；ATTACH不能在事务中执行
+        archived_total = 0
+        for schema in archive.sources(conn, partitions):
+            if schema != 'main':
+                archived_total += conn.execute(count_query.format(schema=schema), params).fetchall()[0][0]
+
+        try:
+            with open(filename, 'w', newline='', encoding='utf-8',
+                      buffering=EXPORT_BUFFER_SIZE) as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                # 热库的行数统计与导出在同一个读事务中，保证进度总数与导出内容一致
+                conn.execute('BEGIN')
+                try:
+                    total = archived_total + conn.execute(
+                        count_query.format(schema='main'), params).fetchone()[0]
+                    if progress_callback and progress_callback(0, total) is False:
+                        raise ExportCancelled()
+                    cursor = conn.execute(query.format(schema='main'), params)
+                    done = self._write_csv_rows(cursor, writer, 0, total,
+                                                progress_callback, chunk_size)
+                finally:
+                    conn.execute('COMMIT')
+                # 归档分区在读事务之外逐个附加
+                for schema in archive.sources(conn, partitions):
+                    if schema == 'main':
+                        continue
+                    cursor = conn.execute(query.format(schema=schema), params)
+                    done = self._write_csv_rows(cursor, writer, done, total,
+                                                progress_callback, chunk_size)
+            return done
+        except ExportCancelled:
+            os.remove(filename)
+            raise
+
+    def _write_csv_rows(self, cursor, writer, done, total, progress_callback, chunk_size):
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            done += len(rows)
+            if progress_callback and progress_callback(done, total) is False:
+                raise ExportCancelled()
+        return done
+
+    def export_products_to_csv(self, filename, progress_callback=None):
+        """
+        导出商品到CSV文件
+        progress_callback: callback(已导出行数, 总行数)，返回False时取消导出
+        返回: 导出的行数，取消时抛出ExportCancelled
+        """
+        return self._stream_to_csv(
+            filename,
+            ['条码', '型号', '价格', '库存', '分类'],
+            'SELECT COUNT(*) FROM {schema}.products',
+            '''
+            SELECT p.barcode, p.model, printf('%.2f', p.price_cents / 100.0), p.stock, c.name
+            FROM {schema}.products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            ''',
+            [],
+            progress_callback)
+
+    def import_products_from_csv(self, filename, batch_size=IMPORT_BATCH_SIZE):
+        """
+        从CSV文件批量导入商品，条码已存在的商品原地更新（保留商品ID）
+        数据有误的行不会中断导入，而是记录在返回的报告中
+        返回: {
+            'imported': int,   # 新增或更新的商品数
+            'rejected': [],    # [(行号, 条码, 原因), ...]
+        }
+        """
+        report = {'imported': 0, 'rejected': []}
+
+        with self.pool.writer(immediate=True) as conn, \
+                open(filename, 'r', encoding='utf-8-sig', newline='') as f:
             reader = csv.DictReader(f)
-            for row in reader:
-                # 检查分类是否存在
-                category_id = None
-                if row.get('分类'):
-                    cursor.execute('SELECT id FROM categories WHERE name = ?', 
-                                 (row['分类'],))
-                    result = cursor.fetchone()
-                    if result:
-                        category_id = result[0]
-                    else:
-                        cursor.execute('''
-                        INSERT INTO categories (name) VALUES (?)
-                        ''', (row['分类'],))
-                        category_id = cursor.lastrowid
-
-                # 添加或更新商品
-                cursor.execute('''
-                INSERT OR REPLACE INTO products 
-                (barcode, model, price, stock, category_id)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (row['条码'], row['型号'], float(row['价格']), 
-                     int(row['库存']), category_id))
-        
-        self.conn.commit()
+            missing = [name for name in ('条码', '型号', '价格', '库存')
+                       if name not in (reader.fieldnames or [])]
+            if missing:
+                raise Exception(f"CSV文件缺少列: {', '.join(missing)}")
 
-    def export_orders_to_csv(self, filename, start_date=None, end_date=None):
-        cursor = self.conn.cursor()
-        query = '''
-        SELECT o.id, o.order_time, o.total_amount, o.payment_method,
-               m.name as member_name, m.phone as member_phone,
-               p.model, oi.quantity, oi.price
-        FROM orders o
+            categories = {name: category_id for category_id, name
+                          in conn.execute('SELECT id, name FROM categories')}
+            # 本次导入中已接受的型号 -> 条码，用于发现文件内的型号冲突
+            accepted_models = {}
+
+            batch = []
+            fts_suspended = False
+            # 表头占第1行
+            for line_no, row in enumerate(reader, start=2):
+                batch.append((line_no, row))
+                if len(batch) >= batch_size:
+                    if not fts_suspended and self._has_fts:
+                        # 大批量导入时先停用全文索引触发器，导入完成后一次性重建索引
+                        migrations.drop_product_fts_triggers(conn)
+                        fts_suspended = True
+                    self._import_product_batch(conn, batch, categories, accepted_models, report)
+                    batch = []
+            if batch:
+                self._import_product_batch(conn, batch, categories, accepted_models, report)
+
+            if fts_suspended:
+                migrations.create_product_fts_triggers(conn)
+                conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+        self.product_cache.clear()
+        report['rejected'].sort()
+        return report
+
+    def _import_product_batch(self, conn, batch, categories, accepted_models, report):
+        """校验并写入一批CSV行"""
+        rejected = report['rejected']
+        parsed = []
+        for line_no, row in batch:
+            barcode = (row.get('条码') or '').strip()
+            model = (row.get('型号') or '').strip()
+            if not barcode:
+                rejected.append((line_no, barcode, '条码为空'))
+                continue
+            if not model:
+                rejected.append((line_no, barcode, '型号为空'))
+                continue
+            try:
+                price = Money.parse(row['价格'])
+                if price.cents < 0:
+                    raise ValueError()
+            except (TypeError, ValueError):
+                rejected.append((line_no, barcode, f"价格无效: {row.get('价格')}"))
+                continue
+            try:
+                stock = int(row['库存'])
+            except (TypeError, ValueError):
+                rejected.append((line_no, barcode, f"库存无效: {row.get('库存')}"))
+                continue
+
+            category_id = None
+            category_name = (row.get('分类') or '').strip()
+            if category_name:
+                category_id = categories.get(category_name)
+                if category_id is None:
+                    category_id = conn.execute('INSERT INTO categories (name) VALUES (?)',
+                                               (category_name,)).lastrowid
+                    categories[category_name] = category_id
+            parsed.append((line_no, barcode, model, price, stock, category_id))
+
+        # 型号唯一：型号已属于其他条码的行拒绝导入
+        owners = {}
+        models = list({row[2] for row in parsed})
+        for start in range(0, len(models), 500):
+            chunk = models[start:start + 500]
+            owners.update(conn.execute(
+                f'SELECT model, barcode FROM products WHERE model IN ({", ".join("?" * len(chunk))})',
+                chunk))
+        owners.update(accepted_models)
+
+        rows = []
+        for line_no, barcode, model, price, stock, category_id in parsed:
+            owner = owners.get(model)
+            if owner is not None and owner != barcode:
+                rejected.append((line_no, barcode, f'型号 {model} 已被条码 {owner} 使用'))
+                continue
+            owners[model] = barcode
+            accepted_models[model] = barcode
+            rows.append((line_no, barcode, model, price, stock, category_id))
+
+        upsert = '''
+        INSERT INTO products (barcode, model, price_cents, stock, category_id)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (barcode) DO UPDATE SET
+            model = excluded.model,
+            price_cents = excluded.price_cents,
+            stock = excluded.stock,
+            category_id = excluded.category_id
+        '''
+        conn.execute('SAVEPOINT import_batch')
+        try:
+            conn.executemany(upsert, [row[1:] for row in rows])
+            report['imported'] += len(rows)
+        except sqlite3.IntegrityError:
+            # 批量写入失败时逐行重试，找出具体出错的行
+            conn.execute('ROLLBACK TO import_batch')
+            for row in rows:
+                try:
+                    conn.execute(upsert, row[1:])
+                    report['imported'] += 1
+                except sqlite3.IntegrityError as e:
+                    rejected.append((row[0], row[1], str(e)))
+        conn.execute('RELEASE import_batch')
+
+    def export_orders_to_csv(self, filename, start_date=None, end_date=None,
+                             progress_callback=None):
+        """
+        导出订单明细到CSV文件，包括时间范围内的归档分区
+        start_date/end_date: 订单时间范围（含两端）
+        progress_callback: callback(已导出行数, 总行数)，返回False时取消导出
+        返回: 导出的行数，取消时抛出ExportCancelled
+        """
+        joins = '''
+        FROM {schema}.orders o
         LEFT JOIN members m ON o.member_id = m.id
-        JOIN order_items oi ON o.id = oi.order_id
+        JOIN {schema}.order_items oi ON o.id = oi.order_id
         JOIN products p ON oi.product_id = p.id
         '''
+        conditions = []
         params = []
         if start_date:
-            query += ' WHERE o.order_time >= ?'
+            conditions.append('o.order_time >= ?')
             params.append(start_date)
         if end_date:
-            query += ' AND o.order_time <= ?' if start_date else ' WHERE o.order_time <= ?'
+            conditions.append('o.order_time <= ?')
             params.append(end_date)
-        
-        cursor.execute(query, params)
-        
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['订单号', '时间', '总金额', '支付方式', 
-                           '会员姓名', '会员电话', '商品', '数量', '单价'])
-            writer.writerows(cursor.fetchall())
+        if conditions:
+            joins += ' WHERE ' + ' AND '.join(conditions)
+
+        return self._stream_to_csv(
+            filename,
+            ['订单号', '时间', '总金额', '支付方式', 
+             '会员姓名', '会员电话', '商品', '数量', '单价'],
+            'SELECT COUNT(*) ' + joins,
+            '''
+            SELECT o.id, o.order_time, printf('%.2f', o.total_cents / 100.0), o.payment_method,
+                   m.name as member_name, m.phone as member_phone,
+                   p.model, oi.quantity, printf('%.2f', oi.price_cents / 100.0)
+            ''' + joins,
+            params,
+            progress_callback,
+            partitions=archive.list_partitions(self.pool.reader(), start_date, end_date,
+                                               end_inclusive=True))
 
     def get_order_by_id(self, order_id):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         cursor.execute('''
-            SELECT id, total_amount, payment_method, created_at
+            SELECT id, total_cents, payment_method, datetime(order_time)
             FROM orders
             WHERE id = ?
         ''', (order_id,))
@@ -411,16 +995,16 @@ class Database:
         if row:
             return {
                 'id': row[0],
-                'total_amount': row[1],
+                'total_amount': Money.from_cents(row[1]),
                 'payment_method': row[2],
-                'created_at': row[3]
+                'order_time': row[3]
             }
         return None
 
     def get_order_items(self, order_id):
-        cursor = self.conn.cursor()
+        cursor = self.pool.reader().cursor()
         cursor.execute('''
-            SELECT p.model, oi.quantity, oi.price
+            SELECT p.model, oi.quantity, oi.price_cents
             FROM order_items oi
             JOIN products p ON oi.product_id = p.id
             WHERE oi.order_id = ?
@@ -430,6 +1014,6 @@ class Database:
             items.append({
                 'model': row[0],
                 'quantity': row[1],
-                'price': row[2]
+                'price': Money.from_cents(row[2])
             })
-        return items 
\ No newline at end of file
+        return items
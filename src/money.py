@@ -0,0 +1,127 @@
+import sqlite3
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+class Money:
+    """
+    金额（以整数分为单位的定点数）
+    - 加减和乘以整数数量都是精确的整数运算，不会出现浮点误差
+    - 绑定到SQL参数时自动转换为整数分，数据库中的金额列都以分存储
+    - 支持f"{money:.2f}"这类格式化，显示为元
+    """
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int):
+            raise TypeError(f"金额必须用整数分表示: {cents!r}")
+        object.__setattr__(self, 'cents', cents)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money对象不可修改")
+
+    @classmethod
+    def parse(cls, value):
+        """
+        从字符串或数字解析金额，如'12.5'、'¥12.50'、12.5，按四舍五入保留到分
+        无法解析时抛出ValueError
+        """
+        if isinstance(value, Money):
+            return value
+        text = str(value).strip().replace('¥', '').replace(',', '')
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"无效的金额: {value}")
+        if not amount.is_finite():
+            raise ValueError(f"无效的金额: {value}")
+        return cls(int((amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)))
+
+    @classmethod
+    def from_cents(cls, cents):
+        """从数据库读取的分值构造金额，NULL视为0"""
+        return cls(int(cents or 0))
+
+    def to_decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            # 支持sum()的起始值0
+            return self
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __mul__(self, quantity):
+        if isinstance(quantity, int) and not isinstance(quantity, bool):
+            return Money(self.cents * quantity)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, Money):
+            return self.cents <= other.cents
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, Money):
+            return self.cents > other.cents
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, Money):
+            return self.cents >= other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __str__(self):
+        sign = '-' if self.cents < 0 else ''
+        yuan, fen = divmod(abs(self.cents), 100)
+        return f"{sign}{yuan}.{fen:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        if not spec:
+            return str(self)
+        return format(self.to_decimal(), spec)
+
+    def __conform__(self, protocol):
+        # sqlite3绑定参数时调用，金额以整数分写入数据库
+        if protocol is sqlite3.PrepareProtocol:
+            return self.cents
+
+    def __reduce__(self):
+        return (Money, (self.cents,))
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from money import Money
+
+class OrderJournal:
+    """
+    订单日志（只追加的本地文件）
+    - 每个完成支付的购物车写成一行JSON，append返回时该行已经fsync到磁盘，收银台即可继续下一单
+    - 多个线程同时追加时只由其中一个执行fsync，一次fsync覆盖此前写入的所有记录
+    - 记录写入数据库（或被拒绝）后标记为已处理，全部处理完后清空日志文件
+    - 被拒绝的记录转存到.rejected文件，该文件同时是持久的拒绝标记：日志清空前重启时，
+      pending_records()不再返回这些记录，不会被重放或重新发送
+    - .rejected文件只留需要人工核对的已收款订单；结账时当场被拒绝、收银员修改后重新结账的记录
+      用abandon()移到.abandoned文件，同样不再重放
+    - 程序异常退出后，启动时由OrderWriter把尚未写入数据库的记录重新写入，
+      订单以记录ID(orders.journal_id)去重，重复写入不会产生重复订单
+    """
+
+    def __init__(self, path='orders.journal'):
+        self.path = path
+        self.rejected_path = path + '.rejected'
+        self.abandoned_path = path + '.abandoned'
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        # 写入线程追加.rejected与界面线程abandon()重写.rejected互斥
+        self._rejected_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        self._written = 0
+        self._synced = 0
+        self._discard_torn_tail()
+        # 文件中已有的未拒绝记录在重放确认前都视为未处理
+        self.outstanding = len(self.pending_records())
+
+    @staticmethod
+    def new_record(items, payment_method, member_id=None):
+        """根据购物车生成一条日志记录，记录ID同时作为订单的journal_id"""
+        return {
+            'id': uuid.uuid4().hex,
+            'order_time': datetime.now().isoformat(sep=' '),
+            'payment_method': payment_method,
+            'member_id': member_id,
+            'items': [{'product_id': item['product_id'],
+                       'quantity': item['quantity'],
+                       'price': str(Money.parse(item['price']))}
+                      for item in items]
+        }
+
+    def _discard_torn_tail(self):
+        """写到一半时断电会留下不完整的最后一行，该记录的append从未返回，直接截掉"""
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end != size:
+            print(f"订单日志末尾有不完整的记录，已丢弃 {size - end} 字节")
+            os.ftruncate(self._fd, end)
+            os.fsync(self._fd)
+
+    def append(self, record):
+        """追加一条记录，返回时记录已持久化"""
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            os.write(self._fd, line)
+            self._written += 1
+            self.outstanding += 1
+            sequence = self._written
+        self._sync(sequence)
+        return record
+
+    def _sync(self, sequence):
+        with self._sync_lock:
+            # 等锁期间其他线程的fsync可能已经覆盖了本条记录
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                target = self._written
+            os.fsync(self._fd)
+            self._synced = target
+
+    def read_records(self):
+        """读取日志中的全部记录"""
+        records = []
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.endswith(b'\n'):
+                    records.append(json.loads(line))
+        return records
+
+    @staticmethod
+    def _read_entries(path):
+        entries = []
+        if not os.path.exists(path):
+            return entries
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.endswith(b'\n'):
+                    entries.append(json.loads(line))
+        return entries
+
+    def rejected_ids(self):
+        """已转存到.rejected或.abandoned文件的记录ID"""
+        return {entry['id'] for path in (self.rejected_path, self.abandoned_path)
+                for entry in self._read_entries(path)}
+
+    def pending_records(self):
+        """日志中尚未被拒绝或放弃的记录，启动时据此重放或重新发送"""
+        records = self.read_records()
+        if not records:
+            return records
+        rejected = self.rejected_ids()
+        return [record for record in records if record['id'] not in rejected]
+
+    def mark_resolved(self, count=1):
+        """记录已写入数据库或已被拒绝"""
+        with self._lock:
+            self.outstanding -= count
+
+    def reject(self, record, reason):
+        """
+        无法写入数据库的记录（如库存不足）转存到.rejected文件，留待人工处理
+        写入.rejected并fsync后才标记为已处理，此后该记录不会再被重放
+        """
+        with self._rejected_lock:
+            self._append_entry(self.rejected_path, dict(record, reason=reason))
+        print(f"订单 {record['id']} 未能写入数据库，已转存到 {self.rejected_path}: {reason}")
+        self.mark_resolved()
+
+    def abandon(self, record):
+        """
+        结账时当场被拒绝、没有收款的记录从.rejected移到.abandoned文件，不再需要人工核对
+        先写入.abandoned并fsync，再替换.rejected，中途断电时记录仍不会被重放
+        """
+        self._append_entry(self.abandoned_path,
+                           dict(record, abandoned_at=datetime.now().isoformat(sep=' ')))
+        with self._rejected_lock:
+            entries = self._read_entries(self.rejected_path)
+            remaining = [entry for entry in entries if entry['id'] != record['id']]
+            if len(remaining) == len(entries):
+                return
+            partial = self.rejected_path + '.partial'
+            with open(partial, 'w', encoding='utf-8') as f:
+                for entry in remaining:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(partial, self.rejected_path)
+
+    @staticmethod
+    def _append_entry(path, entry):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self):
+        """所有记录都已处理时清空日志文件，返回是否已清空"""
+        with self._lock:
+            if self.outstanding > 0 or os.fstat(self._fd).st_size == 0:
+                return False
+            os.ftruncate(self._fd, 0)
+            os.fsync(self._fd)
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
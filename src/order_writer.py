@@ -0,0 +1,196 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from order_journal import OrderJournal
+
+class OrderWriter:
+    """
+    订单分组提交写入器
+    - 收银台把完成支付的购物车放入队列，立即得到一个Future
+    - 后台线程把上一次提交期间排队的订单（以及可选的短时间窗口内到达的订单）合并到同一个事务中提交，
+      多个订单共用一次fsync
+    - 每个订单在各自的保存点中写入，某个订单库存不足只会使该订单失败，不影响同组其他订单
+    - 事务提交成功后Future才返回订单ID
+    - 配置了订单日志(OrderJournal)时，入队前先追加到日志，submit返回时订单已持久化，
+      收银台不必等待数据库；数据库被锁定时后台线程会一直重试，启动时重放上次未写入的记录
+    """
+
+    def __init__(self, db, journal=None, max_batch=64, max_wait=0.0, retry_interval=1.0,
+                 retry_busy=None):
+        """
+        journal: OrderJournal，为None时不写日志，Future返回前订单只在内存中
+        max_batch: 每组最多合并的订单数
+        max_wait: 收到一组中第一个订单后最多等待的秒数，0表示不等待，只合并已在排队的订单
+        retry_interval: 数据库繁忙导致提交失败后重试的间隔秒数
+        retry_busy: 数据库繁忙时是否重试整组而不是使整组失败，默认配置了日志时重试；
+            门店服务器没有日志，但订单已记在收银机的日志中，同样需要重试
+        """
+        self.db = db
+        self.journal = journal
+        self.retry_busy = journal is not None if retry_busy is None else retry_busy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.retry_interval = retry_interval
+        self.queue = queue.Queue()
+        self.committed_orders = 0
+        self.committed_groups = 0
+        self._closed = False
+        if journal is not None:
+            self._replay_journal()
+        self._thread = threading.Thread(target=self._run, name='OrderWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, items, payment_method, member_id=None):
+        """
+        提交一个订单
+        返回: Future，结果为订单ID；订单失败时Future中为对应的异常
+        """
+        return self.submit_record(OrderJournal.new_record(items, payment_method, member_id))
+
+    def submit_record(self, record):
+        """
+        提交一条由OrderJournal.new_record生成的订单记录
+        配置了订单日志时先追加到日志，返回时记录已持久化，可以打印小票
+        """
+        if self._closed:
+            raise Exception("订单写入器已关闭")
+        if self.journal is not None:
+            self.journal.append(record)
+        future = Future()
+        self.queue.put((record, future))
+        return future
+
+    def create_order(self, items, payment_method, member_id=None, timeout=None):
+        """提交订单并等待提交完成，返回订单ID"""
+        return self.submit(items, payment_method, member_id).result(timeout)
+
+    def close(self, timeout=None):
+        """处理完队列中剩余的订单后停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(None)
+        self._thread.join(timeout)
+        if self.journal is not None:
+            self.journal.compact()
+
+    def _replay_journal(self):
+        """
+        把日志中尚未写入数据库的记录重新放入队列，已写入的记录直接标记为已处理
+        已被拒绝（转存到.rejected文件）的记录不再重放
+        """
+        records = self.journal.pending_records()
+        if not records:
+            return
+        conn = self.db.pool.reader()
+        applied = set()
+        ids = [record['id'] for record in records]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            applied.update(row[0] for row in conn.execute(
+                f'SELECT journal_id FROM orders WHERE journal_id IN ({placeholders})', chunk))
+
+        pending = [record for record in records if record['id'] not in applied]
+        self.journal.mark_resolved(len(records) - len(pending))
+        if pending:
+            print(f"订单日志中有 {len(pending)} 个订单尚未写入数据库，正在恢复")
+        for record in pending:
+            self.queue.put((record, Future()))
+        self.journal.compact()
+
+    def _next_group(self):
+        """阻塞等待第一个订单，然后在时间窗口内尽量多收集订单"""
+        first = self.queue.get()
+        if first is None:
+            return None, True
+        group = [first]
+        deadline = time.monotonic() + self.max_wait
+        stop = False
+        while len(group) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                stop = True
+                break
+            group.append(request)
+        return group, stop
+
+    def _run(self):
+        while True:
+            group, stop = self._next_group()
+            if group:
+                self._commit_group(group)
+            if stop:
+                break
+
+    def _commit_group(self, group):
+        # 配置了日志时订单已经收款，即使Future被取消也要写入数据库
+        group = [(record, future) for record, future in group
+                 if future.set_running_or_notify_cancel() or self.journal is not None]
+        while True:
+            try:
+                results = self._write_group(group)
+                break
+            except sqlite3.OperationalError as e:
+                if not self.retry_busy or self._closed:
+                    self._fail_group(group, e)
+                    return
+                # 订单已在日志中，数据库繁忙时等待后重试整组，不能当作订单被拒绝
+                print(f"写入订单失败，{self.retry_interval} 秒后重试: {str(e)}")
+                time.sleep(self.retry_interval)
+            except Exception as e:
+                self._fail_group(group, e)
+                return
+
+        self.db.product_cache.invalidate_ids(
+            [item['product_id'] for record, _ in group for item in record['items']])
+        self.committed_groups += 1
+        for record, future, order_id, error in results:
+            if self.journal is not None:
+                if error is None:
+                    self.journal.mark_resolved()
+                else:
+                    self.journal.reject(record, str(error))
+            if error is None:
+                self.committed_orders += 1
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(order_id)
+            else:
+                future.set_exception(error)
+        if self.journal is not None and self.queue.empty():
+            self.journal.compact()
+
+    def _write_group(self, group):
+        """在一个事务中写入一组订单，返回每个订单的结果"""
+        results = []
+        with self.db.pool.writer(immediate=True) as conn:
+            for record, future in group:
+                try:
+                    order_id = self.db._insert_order(
+                        conn, record['items'], record['payment_method'],
+                        order_time=datetime.fromisoformat(record['order_time']),
+                        journal_id=record['id'],
+                        # 旧版本写入的日志记录没有member_id
+                        member_id=record.get('member_id'))
+                    results.append((record, future, order_id, None))
+                except sqlite3.OperationalError:
+                    # 数据库繁忙等错误使整组重试
+                    raise
+                except Exception as e:
+                    results.append((record, future, None, e))
+        return results
+
+    def _fail_group(self, group, error):
+        # 提交失败时整组订单都没有写入，日志中的记录留待下次启动时重放
+        for _, future in group:
+            if not future.done():
+                future.set_exception(error)
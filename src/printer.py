@@ -1,13 +1,14 @@
-from datetime import datetime
 import json
 import os
-from PyQt5.QtWidgets import QMessageBox
-import win32print
-import win32con
-import win32ui
-import win32gui
+from receipt import DEFAULT_RECEIPT_CONFIG, render_receipt, render_test_page
 
 class ReceiptPrinter:
+    """
+    小票打印机
+    小票文本由receipt模块生成；pywin32只在连接和使用打印机时导入，
+    没有安装pywin32（如Linux上的命令行工具和服务）时以模拟模式运行，只返回小票文本
+    """
+
     def __init__(self, printer_type='windows', config_file='printer_config.json'):
         self.config_file = config_file
         self.config = self.load_config()
@@ -19,12 +20,7 @@ class ReceiptPrinter:
             print(f"打印机初始化失败: {str(e)}")
             
     def load_config(self):
-        default_config = {
-            'shop_name': '示例商店',
-            'shop_address': '示例地址',
-            'shop_phone': '示例电话',
-            'footer_text': '感谢您的惠顾，欢迎再次光临！'
-        }
+        default_config = dict(DEFAULT_RECEIPT_CONFIG)
         
         try:
             if os.path.exists(self.config_file):
@@ -37,6 +33,7 @@ class ReceiptPrinter:
             
     def init_printer(self, printer_type):
         try:
+            import win32print
             self.printer_name = win32print.GetDefaultPrinter()
             if self.printer_name:
                 print(f"已连接默认打印机: {self.printer_name}")
@@ -56,6 +53,9 @@ class ReceiptPrinter:
             return text
             
         try:
+            import win32print
+            import win32con
+            import win32ui
             print("开始打印...")
             print(f"使用打印机: {self.printer_name}")
             
@@ -165,43 +165,7 @@ class ReceiptPrinter:
             
     def print_receipt(self, order_data, items, preview=False):
         try:
-            content = []
-            
-            # 店铺信息
-            content.append(f"{self.config['shop_name']}\n")
-            content.append("--------------------------------\n")
-            content.append(f"地址:{self.config['shop_address']}\n")
-            content.append(f"电话:{self.config['shop_phone']}\n")
-            content.append("--------------------------------\n")
-            
-            # 订单信息
-            content.append(f"订单号:{order_data['id']}\n")
-            content.append(f"时间:{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            content.append("--------------------------------\n")
-            
-            # 商品列表
-            content.append("商品列表:\n")
-            for item in items:
-                # 商品名称可能较长，需要处理换行
-                model = item['model']
-                if len(model) > 16:  # 一行最多16个中文字符
-                    model = model[:15] + '...'
-                content.append(f"{model}\n")
-                content.append(f"数量:{item['quantity']}×¥{item['price']:.2f}\n")
-                content.append(f"小计:¥{item['quantity'] * item['price']:.2f}\n")
-            
-            content.append("--------------------------------\n")
-            
-            # 总计
-            content.append(f"总计:¥{order_data['total_amount']:.2f}\n")
-            content.append(f"支付方式:{order_data['payment_method']}\n")
-            
-            # 页脚
-            content.append("--------------------------------\n")
-            content.append(f"{self.config['footer_text']}\n")
-            content.append("\n\n\n")  # 留出切纸空间
-            
-            return self.do_print(''.join(content), preview)
+            return self.do_print(render_receipt(self.config, order_data, items), preview)
                 
         except Exception as e:
             if not preview and not self.simulation_mode:
@@ -210,18 +174,7 @@ class ReceiptPrinter:
             
     def test_printer(self, preview=False):
         try:
-            content = [
-                "打印机测试\n",
-                "--------------------------------\n",
-                f"店铺名称:{self.config['shop_name']}\n",
-                f"打印时间:{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
-                "--------------------------------\n",
-                "打印机工作正常\n",
-                "--------------------------------\n",
-                "\n\n\n"  # 留出切纸空间
-            ]
-            
-            return self.do_print(''.join(content), preview)
+            return self.do_print(render_test_page(self.config), preview)
                 
         except Exception as e:
             if not preview and not self.simulation_mode:
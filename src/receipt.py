@@ -0,0 +1,75 @@
+from datetime import datetime
+from money import Money
+
+# 小票的默认店铺信息，打印机配置文件中的同名项会覆盖这些值
+DEFAULT_RECEIPT_CONFIG = {
+    'shop_name': '示例商店',
+    'shop_address': '示例地址',
+    'shop_phone': '示例电话',
+    'footer_text': '感谢您的惠顾，欢迎再次光临！'
+}
+
+SEPARATOR = '--------------------------------'
+# 一行最多16个中文字符，更长的商品名称截断
+MAX_MODEL_LENGTH = 16
+# 留出切纸空间
+CUT_MARGIN = '\n\n\n'
+
+def render_receipt(config, order_data, items, printed_at=None):
+    """
+    生成小票文本，不依赖打印机，可用于预览和测试
+    order_data: {'id': 小票号, 'total_amount': Money或金额字符串, 'payment_method': str}
+    items: [{'model': str, 'price': Money或金额字符串, 'quantity': int}, ...]
+    printed_at: 打印时间，默认为当前时间
+    """
+    printed_at = printed_at or datetime.now()
+    content = []
+
+    # 店铺信息
+    content.append(f"{config['shop_name']}\n")
+    content.append(f"{SEPARATOR}\n")
+    content.append(f"地址:{config['shop_address']}\n")
+    content.append(f"电话:{config['shop_phone']}\n")
+    content.append(f"{SEPARATOR}\n")
+
+    # 订单信息
+    content.append(f"订单号:{order_data['id']}\n")
+    content.append(f"时间:{printed_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    content.append(f"{SEPARATOR}\n")
+
+    # 商品列表
+    content.append("商品列表:\n")
+    for item in items:
+        model = item['model']
+        if len(model) > MAX_MODEL_LENGTH:
+            model = model[:MAX_MODEL_LENGTH - 1] + '...'
+        price = Money.parse(item['price'])
+        content.append(f"{model}\n")
+        content.append(f"数量:{item['quantity']}×¥{price:.2f}\n")
+        content.append(f"小计:¥{price * item['quantity']:.2f}\n")
+
+    content.append(f"{SEPARATOR}\n")
+
+    # 总计
+    content.append(f"总计:¥{Money.parse(order_data['total_amount']):.2f}\n")
+    content.append(f"支付方式:{order_data['payment_method']}\n")
+
+    # 页脚
+    content.append(f"{SEPARATOR}\n")
+    content.append(f"{config['footer_text']}\n")
+    content.append(CUT_MARGIN)
+    return ''.join(content)
+
+def render_test_page(config, printed_at=None):
+    """生成打印机测试页文本"""
+    printed_at = printed_at or datetime.now()
+    return ''.join([
+        "打印机测试\n",
+        f"{SEPARATOR}\n",
+        f"店铺名称:{config['shop_name']}\n",
+        f"打印时间:{printed_at.strftime('%Y-%m-%d %H:%M:%S')}\n",
+        f"{SEPARATOR}\n",
+        "打印机工作正常\n",
+        f"{SEPARATOR}\n",
+        CUT_MARGIN
+    ])
@@ -0,0 +1,217 @@
+import argparse
+import sqlite3
+import sys
+import time
+import archive
+from money import Money
+
+# 按天汇总的销售数据，由create_order在同一事务中增量维护
+ROLLUP_TABLES = ['sales_daily', 'sales_daily_product', 'sales_daily_payment']
+
+def create_rollup_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        sale_date TEXT PRIMARY KEY,
+        order_count INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily_product (
+        sale_date TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        PRIMARY KEY (sale_date, product_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily_payment (
+        sale_date TEXT NOT NULL,
+        payment_method TEXT NOT NULL,
+        order_count INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        PRIMARY KEY (sale_date, payment_method)
+    ) WITHOUT ROWID
+    ''')
+
+def apply_order(conn, order_time, total_amount, payment_method, items):
+    """
+    把一个新订单累加到汇总表，须在写入订单的同一事务中调用
+    total_amount: Money
+    items: [{'product_id': int, 'quantity': int, 'price': Money}, ...]
+    """
+    sale_date = order_time.strftime('%Y-%m-%d')
+
+    conn.execute('''
+    INSERT INTO sales_daily (sale_date, order_count, total_cents)
+    VALUES (?, 1, ?)
+    ON CONFLICT (sale_date) DO UPDATE SET
+        order_count = order_count + 1,
+        total_cents = total_cents + excluded.total_cents
+    ''', (sale_date, total_amount))
+
+    conn.execute('''
+    INSERT INTO sales_daily_payment (sale_date, payment_method, order_count, amount_cents)
+    VALUES (?, ?, 1, ?)
+    ON CONFLICT (sale_date, payment_method) DO UPDATE SET
+        order_count = order_count + 1,
+        amount_cents = amount_cents + excluded.amount_cents
+    ''', (sale_date, payment_method, total_amount))
+
+    products = {}
+    for item in items:
+        quantity, amount = products.get(item['product_id'], (0, Money()))
+        products[item['product_id']] = (quantity + item['quantity'],
+                                        amount + Money.parse(item['price']) * item['quantity'])
+    conn.executemany('''
+    INSERT INTO sales_daily_product (sale_date, product_id, quantity, amount_cents)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (sale_date, product_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        amount_cents = amount_cents + excluded.amount_cents
+    ''', [(sale_date, product_id, quantity, amount)
+          for product_id, (quantity, amount) in products.items()])
+
+# 从订单历史重新计算汇总数据的查询，重建和校验共用，{schema}为热库main或归档分区的附加库名
+_DAILY_QUERY = '''
+SELECT date(order_time) AS sale_date, COUNT(*), SUM(total_cents)
+FROM {schema}.orders
+GROUP BY date(order_time)
+'''
+
+_PRODUCT_QUERY = '''
+SELECT date(o.order_time) AS sale_date, oi.product_id,
+       SUM(oi.quantity), SUM(oi.quantity * oi.price_cents)
+FROM {schema}.order_items oi
+JOIN {schema}.orders o ON o.id = oi.order_id
+GROUP BY date(o.order_time), oi.product_id
+'''
+
+_PAYMENT_QUERY = '''
+SELECT date(order_time) AS sale_date, payment_method, COUNT(*), SUM(total_cents)
+FROM {schema}.orders
+WHERE payment_method IS NOT NULL
+GROUP BY date(order_time), payment_method
+'''
+
+# (汇总表, 主键列, 数值列, 查询)
+_ROLLUP_QUERIES = [
+    ('sales_daily', ['sale_date'], ['order_count', 'total_cents'], _DAILY_QUERY),
+    ('sales_daily_product', ['sale_date', 'product_id'], ['quantity', 'amount_cents'], _PRODUCT_QUERY),
+    ('sales_daily_payment', ['sale_date', 'payment_method'], ['order_count', 'amount_cents'], _PAYMENT_QUERY),
+]
+
+def _recompute(conn, query, key_count, schemas):
+    """在给定的库上执行重新计算的查询并按主键累加，返回{主键: 数值}"""
+    totals = {}
+    for schema in schemas:
+        for row in conn.execute(query.format(schema=schema)):
+            key = tuple(row[:key_count])
+            values = tuple(row[key_count:])
+            if key in totals:
+                values = tuple(a + b for a, b in zip(totals[key], values))
+            totals[key] = values
+    return totals
+
+def archived_totals(conn):
+    """
+    归档分区中订单的汇总值，供rebuild使用
+    ATTACH不能在事务中执行，须在开启重建事务之前调用；分区只读，提前计算不影响一致性
+    """
+    partitions = archive.list_partitions(conn)
+    schemas = archive.sources(conn, partitions)
+    next(schemas)  # 跳过热库
+    totals = {table: {} for table, _, _, _ in _ROLLUP_QUERIES}
+    for schema in schemas:
+        for table, keys, _, query in _ROLLUP_QUERIES:
+            for key, values in _recompute(conn, query, len(keys), [schema]).items():
+                if key in totals[table]:
+                    values = tuple(a + b for a, b in zip(totals[table][key], values))
+                totals[table][key] = values
+    return totals
+
+def rebuild(conn, archived=None):
+    """
+    清空并根据订单历史重新计算全部汇总表，须在事务中调用
+    archived: archived_totals()的结果；存在归档分区时必须提供，否则已归档月份的汇总会丢失
+    """
+    create_rollup_tables(conn)
+    if archived is None:
+        if conn.execute('SELECT 1 FROM archive_partitions LIMIT 1').fetchone():
+            raise Exception("存在归档分区，重建汇总表前须在事务外调用archived_totals()")
+        archived = {}
+    for table, keys, values, query in _ROLLUP_QUERIES:
+        conn.execute(f'DELETE FROM {table}')
+        columns = keys + values
+        placeholders = ', '.join('?' * len(columns))
+        conn.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})',
+                         [key + value for key, value in archived.get(table, {}).items()])
+        # 热库中的订单直接用SQL累加，已归档月份之后补录的订单与归档数据合并
+        updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in values)
+        conn.execute(f'''
+        INSERT INTO {table} ({", ".join(columns)})
+        {query.format(schema='main')}
+        ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}
+        ''')
+
+def _compare(conn, table, key_columns, value_columns, query, schemas):
+    """比较汇总表与重新计算的结果，返回不一致的行"""
+    expected = _recompute(conn, query, len(key_columns), schemas)
+
+    mismatches = []
+    columns = ', '.join(key_columns + value_columns)
+    for row in conn.execute(f'SELECT {columns} FROM {table}'):
+        key = tuple(row[:len(key_columns)])
+        actual = tuple(row[len(key_columns):])
+        wanted = expected.pop(key, None)
+        if wanted != actual:
+            mismatches.append((table, key, actual, wanted))
+    for key, wanted in expected.items():
+        mismatches.append((table, key, None, wanted))
+    return mismatches
+
+def verify(conn):
+    """
+    校验汇总表与订单历史（热库和全部归档分区）是否一致，须在事务外调用
+    返回: [(表名, 主键, 汇总表中的值, 重新计算的值), ...]，为空表示一致
+    """
+    partitions = archive.list_partitions(conn)
+    mismatches = []
+    for table, keys, values, query in _ROLLUP_QUERIES:
+        mismatches += _compare(conn, table, keys, values, query, archive.sources(conn, partitions))
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='重建并校验销售汇总表')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--verify-only', action='store_true', help='只校验，不重建')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, isolation_level=None, uri=True)
+    try:
+        if not args.verify_only:
+            start = time.perf_counter()
+            archived = archived_totals(conn)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rebuild(conn, archived)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            print(f"汇总表重建完成，用时 {time.perf_counter() - start:.2f} 秒")
+
+        mismatches = verify(conn)
+        if mismatches:
+            print(f"汇总表与订单历史不一致，共 {len(mismatches)} 处：")
+            for table, key, actual, wanted in mismatches[:20]:
+                print(f"- {table} {key}: 汇总值 {actual}，应为 {wanted}")
+            return 1
+        print("汇总表校验通过")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# 本模块第一次被导入的时间，主程序最先导入本模块，作为计时起点
+_IMPORTED_AT = time.perf_counter()
+_IMPORTED_AT_WALL = time.time()
+
+def _process_start():
+    """进程创建时间对应的perf_counter值，无法获取时以本模块导入时间代替"""
+    try:
+        import psutil
+        created = psutil.Process(os.getpid()).create_time()
+    except Exception:
+        return _IMPORTED_AT
+    return _IMPORTED_AT - max(_IMPORTED_AT_WALL - created, 0)
+
+class StartupProfiler:
+    """
+    启动各阶段的耗时
+    - phase(name)记录一段操作的开始和耗时，可以嵌套
+    - mark(name)记录某个时间点，如首次绘制(first_paint)、可以扫码(ready_for_scan)、
+      第一次扫码(first_scan)，时间从进程创建算起，包括解释器启动
+    只在启动时调用少量几次，不影响运行速度
+    """
+
+    def __init__(self):
+        self.origin = _process_start()
+        self.phases = []
+        self.marks = {}
+        self._depth = 0
+
+    def elapsed_ms(self, moment=None):
+        return round(((moment or time.perf_counter()) - self.origin) * 1000, 1)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        entry = {'name': name, 'depth': self._depth, 'start_ms': self.elapsed_ms(start)}
+        self.phases.append(entry)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            entry['ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+    def mark(self, name):
+        """记录时间点，同名的时间点只记录第一次；返回从进程创建算起的毫秒数"""
+        if name not in self.marks:
+            self.marks[name] = self.elapsed_ms()
+        return self.marks[name]
+
+    def report(self):
+        return {
+            'imported_ms': self.elapsed_ms(_IMPORTED_AT),
+            'phases': list(self.phases),
+            'marks': dict(self.marks)
+        }
+
+    def summary(self):
+        lines = [f"启动耗时（从进程创建算起）: 导入启动计时 {self.elapsed_ms(_IMPORTED_AT)} ms"]
+        for entry in self.phases:
+            indent = '  ' * (entry['depth'] + 1)
+            lines.append(f"{indent}{entry['name']}: {entry.get('ms', '未完成')} ms"
+                         f"（开始于 {entry['start_ms']} ms）")
+        for name, ms in self.marks.items():
+            lines.append(f"  {name}: {ms} ms")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return path
+
+# 主程序使用的全局实例
+profiler = StartupProfiler()
@@ -0,0 +1,206 @@
+import concurrent.futures
+import functools
+import itertools
+import socket
+import threading
+from concurrent.futures import Future
+from models import OrderRejectedError, InsufficientStockError, UnknownMemberError
+from order_journal import OrderJournal
+from store_protocol import (DEFAULT_PORT, REMOTE_METHODS, AUTH_METHOD, ERROR_REJECTED,
+                            dump_message, load_message)
+
+class RemoteError(Exception):
+    """门店服务器执行请求时出错，消息为服务器端的错误信息，kind见store_protocol中的ERROR_*"""
+
+    def __init__(self, error_type, message, kind=None):
+        self.error_type = error_type
+        self.kind = kind
+        super().__init__(message)
+
+class RemoteDatabase:
+    """
+    门店服务器客户端，提供与Database相同的方法
+    - 所有请求共用一个TCP连接，发送后不必等待响应即可继续发送（流水线），由后台线程按id分发响应
+    - call_async返回Future；call_many一次发出多个请求再统一等待，只花一次往返时间
+    - CSV导入导出需要读写服务器上的文件，不能通过客户端调用
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, timeout=30.0, token=None):
+        """token: 门店服务器的共享密钥，连接后先认证，认证失败时抛出RemoteError"""
+        self.address = (host, port)
+        self.timeout = timeout
+        self._sock = socket.create_connection(self.address, timeout=timeout)
+        self._sock.settimeout(None)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._sock.makefile('rb')
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._receive, name='RemoteDatabase', daemon=True)
+        self._thread.start()
+        if token:
+            try:
+                self.call(AUTH_METHOD, token)
+            except Exception:
+                self.close()
+                raise
+
+    def __getattr__(self, name):
+        if name in REMOTE_METHODS:
+            return functools.partial(self.call, name)
+        raise AttributeError(name)
+
+    def call_async(self, method, *args, **kwargs):
+        """发送一个请求，返回Future"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("与门店服务器的连接已断开")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self._sock.sendall(dump_message(
+                    {'id': request_id, 'method': method, 'args': list(args), 'kwargs': kwargs}))
+            except OSError as e:
+                del self._pending[request_id]
+                raise ConnectionError(f"与门店服务器的连接已断开: {str(e)}")
+        return future
+
+    def call(self, method, *args, **kwargs):
+        return self._wait(self.call_async(method, *args, **kwargs))
+
+    def call_many(self, calls):
+        """
+        流水线执行多个请求
+        calls: [(方法名, args, kwargs), ...]
+        返回: 各请求的结果列表，任一请求失败时抛出对应的异常
+        """
+        futures = [self.call_async(method, *args, **kwargs) for method, args, kwargs in calls]
+        return [self._wait(future) for future in futures]
+
+    def _wait(self, future):
+        """等待响应，服务器在timeout内没有响应时与连接断开一样抛出ConnectionError"""
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise ConnectionError(f"门店服务器 {self.timeout} 秒内没有响应")
+
+    def get_products_by_barcodes(self, barcodes):
+        """批量查询商品，返回与barcodes顺序对应的商品列表"""
+        return self.call_many([('get_product_by_barcode', (barcode,), {}) for barcode in barcodes])
+
+    def submit_record(self, record):
+        """提交一条订单日志记录，服务器按记录ID去重，返回Future"""
+        return self.call_async('submit_order', record)
+
+    def _receive(self):
+        error = ConnectionError("与门店服务器的连接已断开")
+        try:
+            for line in self._rfile:
+                response = load_message(line)
+                with self._lock:
+                    future = self._pending.pop(response['id'], None)
+                if future is None:
+                    continue
+                if 'error' in response:
+                    future.set_exception(self._make_error(response['error']))
+                else:
+                    future.set_result(response.get('result'))
+        except (OSError, ValueError) as e:
+            error = ConnectionError(f"与门店服务器的连接已断开: {str(e)}")
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    @staticmethod
+    def _make_error(detail):
+        if detail.get('type') == 'InsufficientStockError':
+            return InsufficientStockError(detail.get('shortages', []))
+        if detail.get('type') == 'UnknownMemberError':
+            return UnknownMemberError(detail.get('member_id'))
+        if detail.get('kind') == ERROR_REJECTED:
+            return OrderRejectedError(detail.get('message'))
+        return RemoteError(detail.get('type'), detail.get('message'), detail.get('kind'))
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._thread.join(self.timeout)
+
+class RemoteOrderWriter:
+    """
+    客户端模式下代替OrderWriter，接口相同
+    订单先追加到本机的订单日志，再发送给门店服务器；连接断开、数据库繁忙等失败时记录保留在日志中，
+    下次启动时重新发送，服务器按记录ID去重；只有服务器因业务原因拒绝的记录（OrderRejectedError）
+    转存到.rejected文件，不再发送
+    """
+
+    def __init__(self, client, journal=None):
+        self.client = client
+        self.journal = journal
+        self._pending = set()
+        self._lock = threading.Lock()
+        if journal is not None:
+            records = journal.pending_records()
+            if records:
+                print(f"订单日志中有 {len(records)} 个订单待确认，正在重新发送到门店服务器")
+            for record in records:
+                self._send(record)
+
+    def submit(self, items, payment_method, member_id=None):
+        return self.submit_record(OrderJournal.new_record(items, payment_method, member_id))
+
+    def submit_record(self, record):
+        if self.journal is not None:
+            self.journal.append(record)
+        return self._send(record)
+
+    def create_order(self, items, payment_method, member_id=None, timeout=None):
+        return self.submit(items, payment_method, member_id).result(timeout)
+
+    def _send(self, record):
+        try:
+            future = self.client.submit_record(record)
+        except ConnectionError as e:
+            # 记录已在日志中，下次启动时重新发送
+            future = Future()
+            future.set_exception(e)
+            return future
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(functools.partial(self._resolved, record))
+        return future
+
+    def _resolved(self, record, future):
+        with self._lock:
+            self._pending.discard(future)
+        if self.journal is None:
+            return
+        error = future.exception()
+        if error is None:
+            self.journal.mark_resolved()
+        elif isinstance(error, OrderRejectedError):
+            # 服务器拒绝了该订单（如库存不足），重发也不会成功
+            self.journal.reject(record, str(error))
+        else:
+            print(f"订单 {record['id']} 暂时未能写入门店服务器，下次启动时重新发送: {str(error)}")
+
+    def close(self, timeout=None):
+        """等待已发送的订单得到服务器确认"""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+        if self.journal is not None:
+            self.journal.compact()
@@ -0,0 +1,88 @@
+import json
+from datetime import date, datetime
+from money import Money
+
+# 门店服务器默认监听端口
+DEFAULT_PORT = 8765
+
+# 客户端可以调用的Database方法，与Database的方法名和参数一致
+# CSV导入导出的参数是服务器磁盘上的文件路径，不对客户端开放
+REMOTE_METHODS = frozenset([
+    'add_product', 'update_product', 'delete_product', 'get_all_products',
+    'get_product_by_barcode', 'get_product_cache_stats', 'search_products',
+    'get_low_stock_products', 'get_reorder_threshold', 'get_product_cost', 'get_low_stock_events',
+    'get_last_low_stock_event_id', 'update_reorder_suggestions', 'get_reorder_suggestions',
+    'create_order', 'check_stock', 'get_order', 'get_all_orders', 'get_orders_page', 'count_orders',
+    'get_order_details', 'get_order_details_batch', 'get_order_by_id', 'get_order_items',
+    'get_sales_statistics', 'rebuild_sales_rollups',
+    'add_category', 'get_all_categories', 'update_category',
+    'add_member', 'get_member_by_phone', 'get_member', 'find_member', 'update_member_points',
+    'rescore_member_levels',
+])
+
+# 连接后的第一个请求，参数为共享密钥；服务器设置了密钥时，未通过认证的连接会被关闭
+AUTH_METHOD = 'authenticate'
+
+# 共享密钥的环境变量，门店服务器和收银机使用同一个值
+TOKEN_ENV = 'SHOP_SERVER_TOKEN'
+
+# 只能从本机连接的监听地址，监听其他地址时必须设置共享密钥
+LOOPBACK_HOSTS = frozenset(['127.0.0.1', 'localhost', '::1'])
+
+# 错误响应中的kind，客户端据此决定订单日志中的记录是否还要重新发送
+# 订单因库存不足、会员不存在等原因被拒绝，重发也不会成功
+ERROR_REJECTED = 'rejected'
+# 数据库繁忙（被锁定），稍后重发
+ERROR_BUSY = 'busy'
+# 其他错误
+ERROR_FAILED = 'failed'
+
+# 由服务器的OrderWriter分组提交的方法，其余方法在连接线程中按到达顺序直接执行
+ORDER_METHODS = frozenset(['create_order', 'submit_order'])
+
+def encode(value):
+    """
+    把方法参数和返回值转换为可JSON序列化的结构
+    Money以整数分传输；元组、日期和键不是字符串的字典用带$前缀的对象标记，解码时还原
+    """
+    if isinstance(value, Money):
+        return {'$money': value.cents}
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, tuple):
+        return {'$tuple': [encode(item) for item in value]}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) and not key.startswith('$') for key in value):
+            return {key: encode(item) for key, item in value.items()}
+        return {'$dict': [[encode(key), encode(item)] for key, item in value.items()]}
+    return value
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (key, item), = value.items()
+            if key == '$money':
+                return Money(item)
+            if key == '$datetime':
+                return datetime.fromisoformat(item)
+            if key == '$date':
+                return date.fromisoformat(item)
+            if key == '$tuple':
+                return tuple(decode(x) for x in item)
+            if key == '$dict':
+                return {decode(k): decode(v) for k, v in item}
+        return {key: decode(item) for key, item in value.items()}
+    return value
+
+def dump_message(message):
+    """一条消息占一行"""
+    return (json.dumps(encode(message), ensure_ascii=False) + '\n').encode('utf-8')
+
+def load_message(line):
+    return decode(json.loads(line))
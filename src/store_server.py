@@ -0,0 +1,192 @@
+import argparse
+import hmac
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+from backup import BackupWorker
+from instrumentation import Instrumentation
+from models import Database, OrderRejectedError, InsufficientStockError, UnknownMemberError
+from order_writer import OrderWriter
+from store_protocol import (DEFAULT_PORT, REMOTE_METHODS, ORDER_METHODS, AUTH_METHOD, TOKEN_ENV,
+                            LOOPBACK_HOSTS, ERROR_REJECTED, ERROR_BUSY, ERROR_FAILED,
+                            dump_message, load_message)
+
+class StoreRequestHandler(socketserver.StreamRequestHandler):
+    """
+    一个收银台连接
+    - 请求和响应都是一行JSON: {"id": 1, "method": "...", "args": [...], "kwargs": {...}}
+      -> {"id": 1, "result": ...} 或 {"id": 1, "error": {"type": ..., "kind": ..., "message": ...}}，
+      kind见store_protocol中的ERROR_*
+    - 客户端可以不等响应连续发送多个请求（流水线），响应通过id对应
+    - 查询等方法在本连接线程中按顺序执行；下单请求交给OrderWriter，与其他收银台的订单合并提交，
+      提交完成后再返回响应，因此下单的响应可能晚于后面请求的响应
+    - 服务器设置了共享密钥时，第一个请求必须是携带正确密钥的authenticate，否则返回错误并断开连接
+    """
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+
+    def handle(self):
+        authenticated = self.server.token is None
+        for line in self.rfile:
+            try:
+                request = load_message(line)
+            except ValueError as e:
+                print(f"门店服务器收到无效请求: {str(e)}")
+                break
+            if request.get('method') == AUTH_METHOD or not authenticated:
+                authenticated = self.authenticate(request)
+                if not authenticated:
+                    break
+                continue
+            self.dispatch(request)
+
+    def authenticate(self, request):
+        """校验共享密钥，返回是否通过；服务器没有设置密钥时总是通过"""
+        token = self.server.token
+        args = request.get('args') or ['']
+        if request.get('method') == AUTH_METHOD and (
+                token is None or hmac.compare_digest(str(args[0]).encode(), token.encode())):
+            self.send({'id': request.get('id'), 'result': True})
+            return True
+        print(f"门店服务器拒绝了未通过认证的连接: {self.client_address[0]}")
+        self.send_error(request.get('id'), Exception("认证失败，请检查共享密钥"))
+        return False
+
+    def finish(self):
+        super().finish()
+        self.server.db.pool.release_reader()
+
+    def dispatch(self, request):
+        request_id = request.get('id')
+        method = request.get('method')
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+
+        if method in ORDER_METHODS:
+            writer = self.server.order_writer
+            try:
+                if method == 'submit_order':
+                    future = writer.submit_record(*args, **kwargs)
+                else:
+                    future = writer.submit(*args, **kwargs)
+            except Exception as e:
+                self.send_error(request_id, e)
+                return
+            future.add_done_callback(lambda f: self.send_future(request_id, f))
+            return
+
+        if method not in REMOTE_METHODS:
+            self.send_error(request_id, Exception(f"不支持的方法: {method}"))
+            return
+        try:
+            result = getattr(self.server.db, method)(*args, **kwargs)
+        except Exception as e:
+            self.send_error(request_id, e)
+            return
+        self.send({'id': request_id, 'result': result})
+
+    def send_future(self, request_id, future):
+        error = future.exception()
+        if error is not None:
+            self.send_error(request_id, error)
+        else:
+            self.send({'id': request_id, 'result': future.result()})
+
+    def send_error(self, request_id, error):
+        if isinstance(error, OrderRejectedError):
+            kind = ERROR_REJECTED
+        elif isinstance(error, sqlite3.OperationalError):
+            kind = ERROR_BUSY
+        else:
+            kind = ERROR_FAILED
+        detail = {'type': type(error).__name__, 'kind': kind, 'message': str(error)}
+        if isinstance(error, InsufficientStockError):
+            detail['shortages'] = [tuple(row) for row in error.shortages]
+        elif isinstance(error, UnknownMemberError):
+            detail['member_id'] = error.member_id
+        self.send({'id': request_id, 'error': detail})
+
+    def send(self, message):
+        data = dump_message(message)
+        with self._send_lock:
+            try:
+                self.wfile.write(data)
+            except OSError:
+                # 客户端已断开，下单结果以数据库为准，客户端重连后可按订单日志重放
+                pass
+
+class StoreServer(socketserver.ThreadingTCPServer):
+    """
+    门店服务器：独占shop.db，多台收银机通过TCP连接共享同一份商品、订单和库存数据
+    所有收银台的下单请求进入同一个OrderWriter，分组提交
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, db, host='127.0.0.1', port=DEFAULT_PORT, token=None):
+        """token: 共享密钥，为None时不认证，只应在监听本机地址时使用"""
+        self.db = db
+        self.token = token or None
+        # 服务器没有订单日志，数据库繁忙时由写入器重试，不让收银机把已收款的订单当作被拒绝
+        self.order_writer = OrderWriter(db, retry_busy=True)
+        super().__init__((host, port), StoreRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.order_writer.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='门店服务器，供多台收银机共享一个数据库')
+    parser.add_argument('--db', default='shop.db', help='数据库文件路径')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='监听地址，监听本机以外的地址时必须设置共享密钥')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                        help=f'共享密钥，收银机须设置相同的{TOKEN_ENV}，默认读取该环境变量')
+    parser.add_argument('--backup-dir', default='backups', help='备份目录')
+    parser.add_argument('--backup-interval', type=float, default=6,
+                        help='自动备份间隔（小时），0表示不自动备份')
+    parser.add_argument('--slow-ms', type=float, default=0,
+                        help='开启性能监控并记录超过该毫秒数的慢查询，0表示不监控')
+    parser.add_argument('--metrics', default='instrumentation.json',
+                        help='开启性能监控时，停止服务器前保存统计数据的文件')
+    args = parser.parse_args(argv)
+    if args.host not in LOOPBACK_HOSTS and not args.token:
+        print(f"监听 {args.host} 时局域网内的任何电脑都能连接，请用--token或环境变量{TOKEN_ENV}设置共享密钥")
+        return 1
+
+    db = Database(args.db)
+    instrumentation = None
+    if args.slow_ms > 0:
+        instrumentation = Instrumentation(db, slow_ms=args.slow_ms)
+        instrumentation.enable()
+    backup_worker = None
+    if args.backup_interval > 0:
+        backup_worker = BackupWorker(args.db, args.backup_dir, interval=args.backup_interval * 3600)
+        backup_worker.start()
+    server = StoreServer(db, args.host, args.port, args.token)
+    print(f"门店服务器已启动: {args.host}:{server.server_address[1]}，数据库: {args.db}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if backup_worker:
+            backup_worker.stop()
+        server.server_close()
+        if instrumentation is not None:
+            instrumentation.dump(args.metrics)
+            instrumentation.disable()
+            print(f"性能数据已保存到 {args.metrics}")
+        db.close()
+        print("门店服务器已停止")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())